@@ -1,5 +1,39 @@
-from flask import Flask, render_template, redirect, url_for, request, flash
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from collections import defaultdict
+from datetime import datetime
+
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+import click
+from flask import (
+    Blueprint,
+    Flask,
+    current_app,
+    render_template,
+    redirect,
+    url_for,
+    request,
+    flash,
+    abort,
+    make_response,
+    session,
+    Response,
+    stream_with_context,
+)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import QueuePool
+from flask_migrate import Migrate
 from flask_login import (
     LoginManager,
     login_user,
@@ -8,17 +42,90 @@ from flask_login import (
     current_user,
     UserMixin,
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+
+from asyncdb import AsyncDatabase
+from cache import RenderCache
+from changefeed import ChangeFeed
+from connections import configure_sqlite_connections
+from hashing import PasswordHasher, PasswordHasherBusy
+from hierarchy import ClosureTable, CycleError
+from groupcommit import GroupCommitter
+from instrumentation import Instrumentation
+import rollups
+from search import MIN_QUERY_LENGTH, SearchIndex, relevance
+from sequences import reserve_ids
+from sharding import ShardRouter, UserMovedError, shard_urls
+from templating import configure_templates, precompile_templates
+
+
+def engine_config(environ):
+    """Database settings from the environment.
+
+    ``DATABASE_URL`` selects the database (SQLite by default). Connections are
+    pooled, sized by ``DB_POOL_SIZE`` and ``DB_MAX_OVERFLOW``; server databases
+    are also pre-pinged and recycled after ``DB_POOL_RECYCLE`` seconds.
+    ``SQLITE_*`` variables tune the pragmas every SQLite connection gets.
+    ``SHARD_DATABASE_URLS`` lists the databases the users' tasks are sharded
+    over (see :mod:`sharding`); the main database is then the user directory.
+    """
+    uri = environ.get("DATABASE_URL", "sqlite:///todo.db")
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://") :]
+    sqlite = uri.startswith("sqlite")
+    options = {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 5 if sqlite else 10)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 10 if sqlite else 20)),
+        "pool_timeout": int(environ.get("DB_POOL_TIMEOUT", 30)),
+    }
+    if uri in ("sqlite://", "sqlite:///:memory:"):
+        options = {}  # a single static connection, see Flask-SQLAlchemy
+    elif sqlite:
+        # Keep connections open so the pragmas below are paid once each
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = int(environ.get("DB_POOL_RECYCLE", 1800))
+    pragmas = {
+        "journal_mode": "WAL",
+        "busy_timeout": int(environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+        "synchronous": environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "mmap_size": int(environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        "cache_size": int(environ.get("SQLITE_CACHE_SIZE", -64 * 1024)),  # KiB
+    }
+    shards = shard_urls(environ)
+    return {
+        "SQLALCHEMY_DATABASE_URI": uri,
+        "SQLALCHEMY_ENGINE_OPTIONS": options,
+        "SQLALCHEMY_BINDS": {
+            ShardRouter.bind_key(shard): url for shard, url in enumerate(shards)
+        },
+        "SHARD_DATABASE_URLS": shards,
+        "SQLITE_PRAGMAS": pragmas,
+    }
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "your_secret_key"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///todo.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db = SQLAlchemy(app)
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+instrumentation = Instrumentation()
+async_db = AsyncDatabase()
+migrate = Migrate(db=db, render_as_batch=True)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"
+login_manager.login_view = "todo.login"
+bp = Blueprint("todo", __name__, cli_group=None)
+
+
+def _extension(name):
+    # Objects built from the app's config, looked up on the current app
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+password_hasher = _extension("password_hasher")
+render_cache = _extension("render_cache")
+change_feed = _extension("change_feed")
 
 
 # Models
@@ -26,23 +133,53 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), nullable=False, unique=True)
     password_hash = db.Column(db.String(256), nullable=False)
+    # The shard database holding the user's tasks; None: the main database
+    shard = db.Column(db.Integer, nullable=True)
     task_groups = db.relationship("TaskGroup", backref="user", lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        with instrumentation.timer("hash"):
+            self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        with instrumentation.timer("hash"):
+            return password_hasher.verify(self.password_hash, password)
+
+
+class DataVersion(db.Model):
+    # Bumped by every change to the user's tasks; keys the dashboard caches.
+    # It lives next to the tasks, so that a write stays within one shard.
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Set on the row left behind when the user's tasks move to another shard
+    moved = db.Column(db.Boolean, nullable=False, default=False)
 
 
 class TaskGroup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
     tasks = db.relationship("Task", backref="task_group", lazy=True)
 
 
 class Task(db.Model):
+    # Indexes follow the lookups the routes actually make: columns page through
+    # top-level tasks by status, subtask pages through a parent's children, and
+    # exports scan a user's tasks in id order.
+    __table_args__ = (
+        db.Index(
+            "ix_task_user_id_parent_task_id_status",
+            "user_id",
+            "parent_task_id",
+            "status",
+        ),
+        db.Index("ix_task_user_id_id", "user_id", "id"),
+        db.Index("ix_task_parent_task_id_user_id", "parent_task_id", "user_id"),
+        db.Index("ix_task_deleted_at", "deleted_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     status = db.Column(db.String(20), nullable=False, default="To Do")
@@ -54,151 +191,1585 @@ class Task(db.Model):
     )
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     user = db.relationship("User", backref="tasks")
+    # Set on the root of a deleted subtree; the rows are purged in the background
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Live subtree aggregates, maintained by rollups along the ancestor path
+    descendant_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    completed_descendant_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    max_depth = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
+def _task_is_done(task):
+    return task.status == "Done"
+
+
+def _task_is_live(task):
+    return task.deleted_at.is_(None)
+
+
+# Every task's ancestors, for one-query subtrees, paths and tombstone checks
+task_tree = ClosureTable(Task, "parent_task_id")
+
+# Trigram full-text index over task titles (SQLite only)
+task_search = SearchIndex(Task, owner="{row}.user_id")
+
+# Each user's tasks live in one of the SHARD_DATABASE_URLS, if any are set.
+# create_app() gives every app its own router and group committer over them.
+SHARDED_MODELS = (TaskGroup, Task, DataVersion)
+shards = _extension("shards")
+group_commit = _extension("group_commit")
+
+
+TASK_STATUSES = ("To Do", "In Progress", "Done")
+
+
+def task_page_query(user_id, after=None, **filters):
+    """Query a page of the user's live tasks, in id order, with a child flag.
+
+    Rows are ``(task, has_subtasks)`` pairs; ``after`` is the id cursor of the
+    previous page.
+    """
+    child = db.aliased(Task)
+    has_subtasks = db.exists().where(
+        child.parent_task_id == Task.id, child.deleted_at.is_(None)
+    )
+    query = (
+        db.session.query(Task, has_subtasks.label("has_subtasks"))
+        .filter_by(user_id=user_id, deleted_at=None, **filters)
+        .order_by(Task.id)
+    )
+    if after is not None:
+        query = query.filter(Task.id > after)
+    return query
+
+
+def _split_page(rows, limit):
+    next_cursor = rows[limit - 1][0].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def fetch_task_page(query, limit):
+    """Return up to ``limit`` rows of a page query and the next page's cursor."""
+    return _split_page(query.limit(limit + 1).all(), limit)
+
+
+async def fetch_task_page_async(query, limit):
+    """:func:`fetch_task_page` on a session of the asyncio engine."""
+    async with async_db.session() as session:
+        result = await session.execute(query.limit(limit + 1).statement)
+        return _split_page(result.all(), limit)
+
+
+def _page_args():
+    after = request.args.get("after", type=int)
+    limit = request.args.get("limit", current_app.config["TASK_PAGE_SIZE"], type=int)
+    return after, max(1, min(limit, current_app.config["TASK_PAGE_MAX_SIZE"]))
+
+
+def _task_json(task, has_subtasks):
+    return {
+        "id": task.id,
+        "title": task.title,
+        "status": task.status,
+        "parent_task_id": task.parent_task_id,
+        "has_subtasks": has_subtasks,
+        "descendant_count": task.descendant_count,
+        "completed_descendant_count": task.completed_descendant_count,
+        "max_depth": task.max_depth,
+    }
+
+
+def _task_page_response(rows, next_url, nested):
+    """Render a page of tasks as an HTML fragment, or as JSON if requested."""
+    if request.args.get("format") == "json":
+        return {
+            "tasks": [_task_json(task, has_subtasks) for task, has_subtasks in rows],
+            "next": next_url,
+        }
+    return render_template(
+        "task_nodes.html", rows=rows, next_url=next_url, nested=nested
+    )
+
+
+def live_task_query(task_id, user_id):
+    """Query the user's task, unless it or one of its ancestors was deleted."""
+    tombstoned = task_tree.has_ancestor(task_id, lambda task: ~_task_is_live(task))
+    return Task.query.filter_by(id=task_id, user_id=user_id).filter(~tombstoned)
+
+
+def get_live_task(task_id, user_id):
+    return live_task_query(task_id, user_id).first()
+
+
+async def get_live_task_async(task_id, user_id):
+    async with async_db.session() as session:
+        result = await session.execute(
+            live_task_query(task_id, user_id).limit(1).statement
+        )
+        return result.scalars().first()
+
+
+def purge_deleted_tasks(batch_size):
+    """Run one bounded step of removing tombstoned subtrees.
+
+    Each step pushes the tombstone one level down to at most ``batch_size``
+    children of tombstoned tasks, then deletes at most ``batch_size``
+    tombstoned tasks that no longer have children. Returns the number of rows
+    touched, which is zero once every deleted subtree is gone.
+    """
+    tombstoned_ids = db.select(Task.id).where(Task.deleted_at.isnot(None))
+    orphan_ids = (
+        db.select(Task.id)
+        .where(Task.parent_task_id.in_(tombstoned_ids), Task.deleted_at.is_(None))
+        .limit(batch_size)
+    )
+    marked = db.session.execute(
+        db.update(Task)
+        .where(Task.id.in_(orphan_ids))
+        .values(deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    child = db.aliased(Task)
+    leaf_ids = db.session.scalars(
+        db.select(Task.id)
+        .where(
+            Task.deleted_at.isnot(None),
+            ~db.exists().where(child.parent_task_id == Task.id),
+        )
+        .limit(batch_size)
+    ).all()
+    task_tree.remove(db.session, leaf_ids)
+    purged = db.session.execute(
+        db.delete(Task)
+        .where(Task.id.in_(leaf_ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return marked + purged
+
+
+def live_task_ids(user_id):
+    """Select of the ids of all the user's tasks outside deleted subtrees."""
+    tombstoned = db.select(Task.id).where(
+        Task.user_id == user_id, ~_task_is_live(Task)
+    )
+    return db.select(Task.id).where(
+        Task.user_id == user_id, Task.id.not_in(task_tree.descendant_ids(tombstoned))
+    )
+
+
+class TaskImportError(ValueError):
+    pass
+
+
+def _flatten_import(records):
+    """Yield ``(ref, parent_ref, record)`` for flat or nested task records.
+
+    Flat records reference their parent by ``parent_id``; nested ones carry
+    their children in ``subtasks``. Nodes without an ``id`` get a private ref.
+    """
+    stack = [(record, None) for record in reversed(records)]
+    anonymous = 0
+    while stack:
+        record, parent_ref = stack.pop()
+        if not isinstance(record, dict):
+            raise TaskImportError("Every task must be a JSON object.")
+        if record.get("id") is None:
+            anonymous += 1
+            ref = ("new", anonymous)
+        else:
+            ref = ("id", record["id"])
+        if parent_ref is None and record.get("parent_id") is not None:
+            parent_ref = ("id", record["parent_id"])
+        yield ref, parent_ref, record
+        stack.extend((child, ref) for child in reversed(record.get("subtasks") or []))
+
+
+def import_tasks(user_id, records):
+    """Insert a batch of task records for the user in a single transaction.
+
+    Parents are inserted before their children with ids reserved up front
+    (see :mod:`sequences`), so that every level goes in as plain executemany()
+    batches. Parent references that are not part of the upload must name one
+    of the user's live tasks. Returns the number of imported tasks and the
+    user's new data version.
+    """
+    nodes = {}
+    for ref, parent_ref, record in _flatten_import(records):
+        title = str(record.get("title") or "").strip()
+        if not title or len(title) > 150:
+            raise TaskImportError(f"Task {ref[1]!r} needs a title of 1-150 chars.")
+        if record.get("status", "To Do") not in TASK_STATUSES:
+            raise TaskImportError(f"Task {ref[1]!r} has an unknown status.")
+        if ref in nodes:
+            raise TaskImportError(f"Duplicate task id {ref[1]!r}.")
+        nodes[ref] = (parent_ref, title, record)
+
+    external = {p[1] for p, _, _ in nodes.values() if p and p not in nodes}
+    existing = set()
+    if external:
+        if not all(isinstance(ref, int) for ref in external):
+            raise TaskImportError("Unknown parent task reference.")
+        existing = {
+            task_id
+            for (task_id,) in db.session.query(Task.id).filter(
+                Task.id.in_(external), Task.id.in_(live_task_ids(user_id))
+            )
+        }
+        if existing != external:
+            raise TaskImportError("Unknown parent task reference.")
+
+    depths = {}
+    for ref in nodes:
+        path = []
+        while ref in nodes and ref not in depths:
+            if ref in path:
+                raise TaskImportError("Task parent references form a cycle.")
+            path.append(ref)
+            ref = nodes[ref][0]
+        depth = depths.get(ref, -1)
+        for ref in reversed(path):
+            depth += 1
+            depths[ref] = depth
+
+    # Writing first takes the SQLite write lock, which the ids reserved below
+    # rely on, and keeps the user's other writes out until the commit
+    version = bump_data_version(user_id)
+    task_ids = iter(reserve_ids(db.session, Task.id, len(nodes)))
+    new_ids = {}
+    rows = []
+    for ref in sorted(nodes, key=depths.__getitem__):
+        parent_ref, title, record = nodes[ref]
+        new_ids[ref] = task_id = next(task_ids)
+        if parent_ref is None:
+            parent_task_id = None
+        elif parent_ref in new_ids:
+            parent_task_id = new_ids[parent_ref]
+        else:
+            parent_task_id = parent_ref[1]
+        rows.append(
+            {
+                "id": task_id,
+                "title": title,
+                "status": record.get("status", "To Do"),
+                "is_completed": bool(record.get("is_completed", False)),
+                "parent_task_id": parent_task_id,
+                "user_id": user_id,
+            }
+        )
+
+    totals = rollups.subtree_totals(
+        {row["id"]: (row["parent_task_id"], row["status"] == "Done") for row in rows}
+    )
+    attached = defaultdict(lambda: [0, 0, 0])  # existing parent -> rollup delta
+    for row in rows:
+        count, completed, depth = totals[row["id"]]
+        row["descendant_count"] = count
+        row["completed_descendant_count"] = completed
+        row["max_depth"] = depth
+        if row["parent_task_id"] in existing:
+            delta = attached[row["parent_task_id"]]
+            delta[0] += count + 1
+            delta[1] += completed + (row["status"] == "Done")
+            delta[2] = max(delta[2], depth)
+
+    chunk_size = current_app.config["TASK_IMPORT_CHUNK_SIZE"]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(Task.__table__.insert(), rows[start : start + chunk_size])
+    if rows:
+        # Other users' tasks may have drawn ids within the range meanwhile
+        task_tree.insert_nodes(
+            db.session,
+            db.and_(
+                Task.id.between(rows[0]["id"], rows[-1]["id"]),
+                Task.user_id == user_id,
+            ),
+        )
+    for parent_id, (count, completed, height) in attached.items():
+        rollups.add_subtree(
+            db.session, Task, "parent_task_id", parent_id, count, completed, height
+        )
+    db.session.commit()
+    return len(rows), version
+
+
+def bump_data_version(user_id):
+    """Invalidate the user's cached dashboard within the current transaction.
+
+    Returns the new version. Raises :class:`UserMovedError` if the user's
+    tasks have left the shard this request is bound to.
+    """
+    bumped = db.session.execute(
+        db.update(DataVersion)
+        .where(DataVersion.user_id == user_id, DataVersion.moved.is_(False))
+        .values(version=DataVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        if db.session.get(DataVersion, user_id, populate_existing=True):
+            raise UserMovedError(f"The tasks of user {user_id} were moved.")
+        db.session.add(DataVersion(user_id=user_id, version=1))
+        return 1
+    return db.session.scalar(
+        db.select(DataVersion.version).where(DataVersion.user_id == user_id)
+    )
+
+
+def _delete_user_tasks(connection, user_id):
+    """Delete the user's task groups, tasks and data version."""
+    task_ids = db.select(Task.id).where(Task.user_id == user_id)
+    closure = task_tree.table
+    connection.execute(
+        db.delete(closure).where(closure.c.descendant_id.in_(task_ids))
+    )
+    for model in (Task, TaskGroup, DataVersion):
+        connection.execute(
+            db.delete(model.__table__).where(model.__table__.c.user_id == user_id)
+        )
+
+
+def _shard_ids(connection, model, rows):
+    # Ids are shard-local: copies are numbered after the target's last row
+    last_id = connection.scalar(db.select(db.func.coalesce(db.func.max(model.id), 0)))
+    return {row["id"]: last_id + n for n, row in enumerate(rows, start=1)}
+
+
+def move_user_to_shard(user, shard):
+    """Move the user's task groups and live tasks to ``shard``, while serving.
+
+    The source database stays write-locked from the first step to the last,
+    so writes to it wait meanwhile; the moving user's then fail with
+    :class:`UserMovedError` and are retried on the new shard. The copies get
+    new ids on the target. A move that fails before the directory is updated
+    leaves a stale copy there, which the next move to that shard replaces.
+    Returns the number of tasks moved.
+    """
+    user_id, source_shard = user.id, user.shard
+    source_engine, target_engine = shards.engine(source_shard), shards.engine(shard)
+    with source_engine.connect() as source, target_engine.connect() as target:
+        source_transaction = source.begin()
+        target_transaction = target.begin()
+        # Writing first takes the source's write lock before anything is read
+        source.execute(
+            db.update(DataVersion.__table__)
+            .where(DataVersion.user_id == user_id)
+            .values(version=DataVersion.version + 1)
+        )
+        version = source.scalar(
+            db.select(DataVersion.version).where(DataVersion.user_id == user_id)
+        )
+        groups = (
+            source.execute(
+                db.select(TaskGroup.__table__)
+                .where(TaskGroup.user_id == user_id)
+                .order_by(TaskGroup.id)
+            )
+            .mappings()
+            .all()
+        )
+        tasks = (
+            source.execute(
+                db.select(Task.__table__)
+                .where(Task.id.in_(live_task_ids(user_id)))
+                .order_by(Task.id)
+            )
+            .mappings()
+            .all()
+        )
+
+        _delete_user_tasks(target, user_id)
+        group_ids = _shard_ids(target, TaskGroup, groups)
+        task_ids = _shard_ids(target, Task, tasks)
+        if groups:
+            target.execute(
+                TaskGroup.__table__.insert(),
+                [{**row, "id": group_ids[row["id"]]} for row in groups],
+            )
+        rows = [
+            {
+                **row,
+                "id": task_ids[row["id"]],
+                "parent_task_id": task_ids.get(row["parent_task_id"]),
+                "task_group_id": group_ids.get(row["task_group_id"]),
+            }
+            for row in tasks
+        ]
+        chunk_size = current_app.config["TASK_IMPORT_CHUNK_SIZE"]
+        for start in range(0, len(rows), chunk_size):
+            target.execute(Task.__table__.insert(), rows[start : start + chunk_size])
+        if rows:
+            task_tree.insert_nodes(
+                target, Task.id.between(rows[0]["id"], rows[-1]["id"])
+            )
+        target.execute(
+            DataVersion.__table__.insert(),
+            {"user_id": user_id, "version": (version or 0) + 1, "moved": False},
+        )
+        target_transaction.commit()
+
+        switch = db.update(User.__table__).where(User.id == user_id)
+        switch = switch.values(shard=shard)
+        if source_shard is None:
+            # The main database is locked by the source connection already
+            source.execute(switch)
+        else:
+            db.session.execute(switch)
+            db.session.commit()
+        _delete_user_tasks(source, user_id)
+        source.execute(
+            DataVersion.__table__.insert(),
+            {"user_id": user_id, "version": version or 0, "moved": True},
+        )
+        source_transaction.commit()
+    db.session.expire(user)
+    # Task ids changed; open boards reload
+    _publish(user_id, (version or 0) + 1, {"type": "reset"})
+    return len(rows)
+
+
+def _templates_fingerprint(*names):
+    digest = hashlib.sha1()
+    for name in names:
+        with open(os.path.join(bp.root_path, "templates", name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# Part of every dashboard ETag, so a template change invalidates cached pages
+DASHBOARD_TEMPLATES_FINGERPRINT = _templates_fingerprint(
+    "base.html",
+    "dashboard.html",
+    "search_form.html",
+    "task_column.html",
+    "task_nodes.html",
+)
+
+
+class TaskPurger:
+    """Background thread that purges tombstoned subtrees in short transactions.
+
+    Deleting a task only tombstones it; the purger is woken afterwards and
+    removes the rows batch by batch, pausing between batches so that request
+    handlers can grab the SQLite write lock.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def notify(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="task-purger", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.app.config["TASK_PURGE_INTERVAL"])
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.purge()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Purging deleted tasks failed")
+
+    def purge(self):
+        batch_size = self.app.config["TASK_PURGE_BATCH_SIZE"]
+        for _ in shards.each(db.session):
+            while purge_deleted_tasks(batch_size):
+                time.sleep(self.app.config["TASK_PURGE_PAUSE"])
+
+
+task_purger = _extension("task_purger")
+
+
+def task_change(kind, task, previous_parent_id=None):
+    """A task-level diff: ``added``, ``updated``, ``moved`` or ``deleted``.
+
+    Besides the task, it carries the new rollups of its ancestors (and of its
+    former ancestors, after a move) and, unless the task is gone, its rendered
+    node, so that a board can patch itself.
+    """
+    has_subtasks = task.descendant_count > 0
+    change = {"type": kind, "task": _task_json(task, has_subtasks)}
+    if kind != "deleted":
+        change["html"] = render_template(
+            "task_nodes.html",
+            rows=[(task, has_subtasks)],
+            next_url=None,
+            nested=task.parent_task_id is not None,
+        )
+    ancestor_ids = task_tree.ancestor_ids(task.parent_task_id)
+    if previous_parent_id is not None:
+        ancestor_ids = ancestor_ids.union(task_tree.ancestor_ids(previous_parent_id))
+    change["ancestors"] = [
+        {
+            "id": task_id,
+            "descendant_count": count,
+            "completed_descendant_count": completed,
+        }
+        for task_id, count, completed in db.session.execute(
+            db.select(
+                Task.id, Task.descendant_count, Task.completed_descendant_count
+            ).where(Task.id.in_(ancestor_ids))
+        )
+    ]
+    return change
+
+
+def _publish(user_id, version, change):
+    if current_app.config["CHANGE_FEED_ENABLED"]:
+        change_feed.publish(user_id, version, change)
+
+
+def _mutation_response(change, version):
+    """Publish a change committed at ``version`` and answer in the requested
+    format.
+
+    ``?format=json`` returns the change itself and ``?format=fragment`` the
+    task's rendered node; otherwise the browser goes back to the dashboard.
+    """
+    _publish(current_user.id, version, change)
+    response_format = request.args.get("format")
+    if response_format == "json":
+        return change
+    if response_format == "fragment":
+        return change.get("html", ""), 200 if "html" in change else 204
+    return redirect(url_for(".dashboard"))
+
+
+def _mutation_failed(message, status=404):
+    if request.args.get("format") in ("json", "fragment"):
+        return {"error": message}, status
+    flash(message)
+    return redirect(url_for(".dashboard"))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user = User.query.get(int(user_id))
+    if user is not None and shards.enabled:
+        # Every task query of the request goes to the user's shard
+        shards.use(db.session, user.shard)
+    return user
+
+
+@bp.app_errorhandler(UserMovedError)
+def user_moved(error):
+    # The user's tasks moved to another shard mid-request; a retry finds them
+    db.session.rollback()
+    message = "Your tasks are being moved, please try again in a moment."
+    return message, 503, {"Retry-After": "1"}
 
 
 # Routes for authentication
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for("dashboard"))
+        return redirect(url_for(".dashboard"))
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
         if User.query.filter_by(username=username).first():
             flash("Username already exists.")
-            return redirect(url_for("register"))
+            return redirect(url_for(".register"))
         user = User(username=username)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment.")
+            return render_template("register.html"), 503, {"Retry-After": "1"}
         db.session.add(user)
+        db.session.flush()
+        user.shard = shards.shard_for(user.id)
         db.session.commit()
         flash("Registration successful. Please log in.")
-        return redirect(url_for("login"))
+        return redirect(url_for(".login"))
     return render_template("register.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("dashboard"))
+        return redirect(url_for(".dashboard"))
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            authenticated = user is not None and user.check_password(password)
+            if authenticated and password_hasher.needs_rehash(user.password_hash):
+                # Upgrade hashes made with older parameters while we know
+                # the password
+                user.set_password(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment.")
+            return render_template("login.html"), 503, {"Retry-After": "1"}
+        if authenticated:
             login_user(user)
-            return redirect(url_for("dashboard"))
+            return redirect(url_for(".dashboard"))
         else:
             flash("Invalid username or password.")
-            return redirect(url_for("login"))
+            return redirect(url_for(".login"))
     return render_template("login.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for("login"))
+    return redirect(url_for(".login"))
 
 
-@app.route("/")
+def _dashboard_etag(data_version):
+    # The data version is a primary key lookup, so an unchanged board is
+    # answered without touching the task table. Pending flash messages are
+    # part of the page, so such responses are neither tagged nor revalidated.
+    if data_version is not None and data_version.moved:
+        raise UserMovedError(f"The tasks of user {current_user.id} were moved.")
+    version = data_version.version if data_version is not None else 0
+    etag = f"{current_user.id}-{version}-{DASHBOARD_TEMPLATES_FINGERPRINT}"
+    return version, etag, not session.get("_flashes")
+
+
+def _column_query(status):
+    # Only the first page of top-level tasks; subtasks and further pages are
+    # fetched on demand
+    return task_page_query(current_user.id, status=status, parent_task_id=None)
+
+
+def _render_column(etag, status, page):
+    rows, next_cursor = page
+    html = render_template(
+        "task_column.html",
+        status=status,
+        rows=rows,
+        next_url=next_cursor
+        and url_for(".task_column", status=status, after=next_cursor),
+    )
+    render_cache.set(f"dashboard:{etag}:{status}", html)
+    return html
+
+
+def _dashboard_response(version, etag, conditional, columns):
+    """The dashboard page, or a 304 if ``columns`` is None."""
+    if columns is None:
+        response = make_response("", 304)
+    else:
+        columns = {status: Markup(html) for status, html in columns.items()}
+        response = make_response(
+            render_template("dashboard.html", columns=columns, data_version=version)
+        )
+    if conditional:
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@bp.route("/")
 @login_required
 def dashboard():
-    # Retrieve tasks categorized by status for the current user
-    categorized_tasks = {
-        "To Do": Task.query.filter_by(
-            status="To Do", parent_task_id=None, user_id=current_user.id
-        ).all(),
-        "In Progress": Task.query.filter_by(
-            status="In Progress", parent_task_id=None, user_id=current_user.id
-        ).all(),
-        "Done": Task.query.filter_by(
-            status="Done", parent_task_id=None, user_id=current_user.id
-        ).all(),
+    data_version = db.session.get(DataVersion, current_user.id)
+    version, etag, conditional = _dashboard_etag(data_version)
+    if conditional and etag in request.if_none_match:
+        return _dashboard_response(version, etag, conditional, None)
+    columns = {}
+    for status in TASK_STATUSES:
+        columns[status] = render_cache.get(f"dashboard:{etag}:{status}")
+        if columns[status] is None:
+            page_size = current_app.config["TASK_PAGE_SIZE"]
+            page = fetch_task_page(_column_query(status), page_size)
+            columns[status] = _render_column(etag, status, page)
+    return _dashboard_response(version, etag, conditional, columns)
+
+
+async def dashboard_async():
+    # Only the asyncio engine is used on the loop: a session of db would be
+    # scoped to the loop's thread, shared by every request and never closed
+    async with async_db.session() as session:
+        data_version = await session.get(DataVersion, current_user.id)
+    version, etag, conditional = _dashboard_etag(data_version)
+    if conditional and etag in request.if_none_match:
+        return _dashboard_response(version, etag, conditional, None)
+    columns = {
+        status: render_cache.get(f"dashboard:{etag}:{status}")
+        for status in TASK_STATUSES
     }
-    return render_template("dashboard.html", categorized_tasks=categorized_tasks)
+    # The missing columns are queried concurrently, each on its own connection
+    missing = [status for status, html in columns.items() if html is None]
+    page_size = current_app.config["TASK_PAGE_SIZE"]
+    pages = await asyncio.gather(
+        *(
+            fetch_task_page_async(_column_query(status), page_size)
+            for status in missing
+        )
+    )
+    for status, page in zip(missing, pages):
+        columns[status] = _render_column(etag, status, page)
+    return _dashboard_response(version, etag, conditional, columns)
+
+
+def _column_page_query(status):
+    if status not in TASK_STATUSES:
+        abort(404)
+    after, limit = _page_args()
+    query = task_page_query(
+        current_user.id, after, status=status, parent_task_id=None
+    )
+    return query, limit
+
+
+def _column_page_response(status, limit, page):
+    rows, next_cursor = page
+    next_url = next_cursor and url_for(
+        ".task_column",
+        status=status,
+        after=next_cursor,
+        limit=limit,
+        format=request.args.get("format"),
+    )
+    return _task_page_response(rows, next_url, nested=False)
+
+
+@bp.route("/columns/<status>")
+@login_required
+def task_column(status):
+    query, limit = _column_page_query(status)
+    return _column_page_response(status, limit, fetch_task_page(query, limit))
+
+
+async def task_column_async(status):
+    query, limit = _column_page_query(status)
+    page = await fetch_task_page_async(query, limit)
+    return _column_page_response(status, limit, page)
+
+
+def _subtasks_page_response(task_id, limit, page):
+    rows, next_cursor = page
+    next_url = next_cursor and url_for(
+        ".task_subtasks",
+        task_id=task_id,
+        after=next_cursor,
+        limit=limit,
+        format=request.args.get("format"),
+    )
+    return _task_page_response(rows, next_url, nested=True)
+
+
+@bp.route("/tasks/<int:task_id>/subtasks")
+@login_required
+def task_subtasks(task_id):
+    if not get_live_task(task_id, current_user.id):
+        abort(404)
+    after, limit = _page_args()
+    query = task_page_query(current_user.id, after, parent_task_id=task_id)
+    return _subtasks_page_response(task_id, limit, fetch_task_page(query, limit))
+
+
+async def task_subtasks_async(task_id):
+    if not await get_live_task_async(task_id, current_user.id):
+        abort(404)
+    after, limit = _page_args()
+    query = task_page_query(current_user.id, after, parent_task_id=task_id)
+    page = await fetch_task_page_async(query, limit)
+    return _subtasks_page_response(task_id, limit, page)
+
+
+def _use_async_views(app):
+    # Same URLs and login handling, served from the asyncio engine
+    app.view_functions.update(
+        {
+            "todo.dashboard": login_required(dashboard_async),
+            "todo.task_column": login_required(task_column_async),
+            "todo.task_subtasks": login_required(task_subtasks_async),
+        }
+    )
+
+
+@bp.route("/search")
+@login_required
+def search_tasks():
+    """The user's live tasks whose title contains ``q``, best matches first."""
+    query = request.args.get("q", "").strip()
+    offset = max(0, request.args.get("offset", 0, type=int))
+    _, limit = _page_args()
+    if len(query) < MIN_QUERY_LENGTH:
+        error = f"Search for at least {MIN_QUERY_LENGTH} characters."
+        if request.args.get("format") == "json":
+            return {"error": error}, 400
+        return render_template("search.html", query=query, error=error, results=[])
+
+    if db.engine.dialect.name == "sqlite":
+        statement = task_search.search(current_user.id, query)
+    else:
+        statement = (
+            db.select(Task)
+            .where(
+                Task.user_id == current_user.id,
+                db.func.lower(Task.title).contains(query.lower(), autoescape=True),
+            )
+            .order_by(*relevance(Task.title, query), Task.id)
+        )
+    tasks = db.session.scalars(
+        statement.where(Task.deleted_at.is_(None)).limit(limit + 1).offset(offset)
+    ).all()
+    paths = task_tree.paths(db.session, [task.id for task in tasks], _task_is_live)
+    results = [
+        {
+            "id": task.id,
+            "title": task.title,
+            "status": task.status,
+            "path": [{"id": i, "title": title} for i, title in paths[task.id]],
+        }
+        for task in tasks[:limit]
+        # Hits inside a deleted subtree linger until it is purged
+        if task.id in paths
+    ]
+    next_url = None
+    if len(tasks) > limit:
+        next_url = url_for(
+            ".search_tasks",
+            q=query,
+            offset=offset + limit,
+            limit=limit,
+            format=request.args.get("format"),
+        )
+    if request.args.get("format") == "json":
+        return {"results": results, "next": next_url}
+    return render_template(
+        "search.html", query=query, results=results, next_url=next_url
+    )
+
+
+@bp.route("/tasks/export")
+@login_required
+def export_tasks():
+    """Stream the user's live tasks as NDJSON, parents before children."""
+    query = (
+        db.session.query(
+            Task.id, Task.parent_task_id, Task.title, Task.status, Task.is_completed
+        )
+        .filter(Task.id.in_(live_task_ids(current_user.id)))
+        .order_by(Task.id)
+        .yield_per(current_app.config["TASK_EXPORT_FETCH_SIZE"])
+    )
+
+    def generate():
+        for task_id, parent_id, title, status, is_completed in query:
+            record = {
+                "id": task_id,
+                "parent_id": parent_id,
+                "title": title,
+                "status": status,
+                "is_completed": bool(is_completed),
+            }
+            yield json.dumps(record) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=tasks.ndjson"},
+    )
 
 
-@app.route("/add_task/<status>", methods=["GET", "POST"])
+@bp.route("/tasks/import", methods=["POST"])
+@login_required
+def import_tasks_route():
+    """Bulk import tasks from an NDJSON or JSON (array) upload.
+
+    Tasks may be flat records linked by ``id``/``parent_id``, as produced by
+    the export, or nested trees with ``subtasks`` lists.
+    """
+    upload = request.files.get("file")
+    body = (upload.read() if upload else request.get_data()).decode("utf-8")
+    started = time.perf_counter()
+    try:
+        if body.lstrip().startswith("["):
+            records = json.loads(body)
+        else:
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        imported, version = import_tasks(current_user.id, records)
+    except (ValueError, TypeError) as exc:
+        # TaskImportError and json.JSONDecodeError are both ValueErrors
+        db.session.rollback()
+        return {"error": str(exc)}, 400
+    elapsed = time.perf_counter() - started
+    # Too many changes to send one by one; open boards reload instead
+    _publish(current_user.id, version, {"type": "reset"})
+    rate = imported / elapsed if elapsed else 0.0
+    logger.info("Imported %d tasks in %.3fs (%.0f rows/s)", imported, elapsed, rate)
+    return {
+        "imported": imported,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rate),
+    }
+
+
+class TaskNotFoundError(LookupError):
+    pass
+
+
+def _live_task_or_fail(task_id, user_id, message):
+    task = get_live_task(task_id, user_id)
+    if task is None:
+        raise TaskNotFoundError(message)
+    return task
+
+
+# The writes of the mutating routes. They take and return plain values, as
+# they may run on the group commit writer rather than the request's session,
+# and each returns the user's new data version, which numbers its change.
+
+
+def _insert_task(user_id, title, status, parent_task_id):
+    if parent_task_id is not None:
+        _live_task_or_fail(parent_task_id, user_id, "Parent task not found.")
+    task = Task(
+        title=title, status=status, parent_task_id=parent_task_id, user_id=user_id
+    )
+    db.session.add(task)
+    rollups.add_subtree(
+        db.session,
+        Task,
+        "parent_task_id",
+        parent_task_id,
+        completed=int(_task_is_done(task)),
+    )
+    version = bump_data_version(user_id)
+    db.session.flush()
+    return task.id, version
+
+
+def _tombstone_task(user_id, task_id):
+    task = _live_task_or_fail(
+        task_id, user_id, "Task not found or you don't have permission to delete it."
+    )
+    # Tombstone the subtree root; the purger removes the rows afterwards
+    task.deleted_at = datetime.utcnow()
+    rollups.remove_subtree(
+        db.session,
+        Task,
+        "parent_task_id",
+        task,
+        _task_is_done(task),
+        is_live=_task_is_live,
+    )
+    version = bump_data_version(user_id)
+    # Built before the commit: once it is visible, the purger may remove the row
+    return task_change("deleted", task), version
+
+
+def _move_task(user_id, task_id, parent_task_id):
+    task = _live_task_or_fail(
+        task_id, user_id, "Task not found or you don't have permission."
+    )
+    if parent_task_id is not None:
+        _live_task_or_fail(parent_task_id, user_id, "Parent task not found.")
+    previous_parent_id = task.parent_task_id
+    task_tree.move(db.session, task.id, parent_task_id)
+    rollups.move_subtree(
+        db.session,
+        Task,
+        "parent_task_id",
+        task,
+        previous_parent_id,
+        _task_is_done(task),
+        is_live=_task_is_live,
+    )
+    return previous_parent_id, bump_data_version(user_id)
+
+
+def _set_task_status(user_id, task_id, status):
+    task = _live_task_or_fail(task_id, user_id, "Task not found or invalid status.")
+    done_delta = (status == "Done") - _task_is_done(task)
+    rollups.change_completed(
+        db.session, Task, "parent_task_id", task.parent_task_id, done_delta
+    )
+    task.status = status
+    return bump_data_version(user_id)
+
+
+@bp.route("/add_task/<status>", methods=["GET", "POST"])
 @login_required
 def add_task(status):
     parent_task_id = request.args.get("parent_task_id")
     if parent_task_id:
-        parent_task = Task.query.filter_by(
-            id=parent_task_id, user_id=current_user.id
-        ).first()
+        parent_task = get_live_task(parent_task_id, current_user.id)
         if not parent_task:
-            flash("Parent task not found.")
-            return redirect(url_for("dashboard"))
+            return _mutation_failed("Parent task not found.")
     else:
         parent_task = None
 
     if request.method == "POST":
         title = request.form["title"]
-        parent_task_id = request.form.get("parent_task_id")
-
-        # Create a new task and assign parent if it’s a subtask
-        new_task = Task(
-            title=title,
-            status=status,
-            parent_task_id=parent_task_id if parent_task_id else None,
-            user_id=current_user.id,  # Associate the task with the current user
-        )
-        db.session.add(new_task)
-        db.session.commit()
-        return redirect(url_for("dashboard"))
+        # Assign the parent if it's a subtask
+        parent_task_id = request.form.get("parent_task_id", type=int)
+        try:
+            task_id, version = group_commit.run(
+                current_user.shard,
+                _insert_task,
+                current_user.id,
+                title,
+                status,
+                parent_task_id,
+            )
+        except TaskNotFoundError as exc:
+            return _mutation_failed(str(exc))
+        new_task = db.session.get(Task, task_id)
+        return _mutation_response(task_change("added", new_task), version)
 
     return render_template("add_task.html", status=status, parent_task=parent_task)
 
 
-@app.route("/tasks/<int:task_id>/add_subtask", methods=["GET", "POST"])
+@bp.route("/tasks/<int:task_id>/add_subtask", methods=["GET", "POST"])
 @login_required
 def add_subtask(task_id):
-    parent_task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
+    parent_task = get_live_task(task_id, current_user.id)
     if not parent_task:
-        flash("Parent task not found or you don't have permission.")
-        return redirect(url_for("dashboard"))
+        return _mutation_failed("Parent task not found or you don't have permission.")
 
     if request.method == "POST":
         title = request.form["title"]
         status = request.form.get("status", parent_task.status)
-        new_task = Task(
-            title=title,
-            status=status,
-            parent_task_id=task_id,
-            user_id=current_user.id,  # Associate with the current user
-        )
-        db.session.add(new_task)
-        db.session.commit()
-        return redirect(url_for("dashboard"))
+        try:
+            new_task_id, version = group_commit.run(
+                current_user.shard,
+                _insert_task,
+                current_user.id,
+                title,
+                status,
+                task_id,
+            )
+        except TaskNotFoundError as exc:
+            return _mutation_failed(str(exc))
+        new_task = db.session.get(Task, new_task_id)
+        return _mutation_response(task_change("added", new_task), version)
 
     return render_template(
         "add_task.html", status=parent_task.status, parent_task=parent_task
     )
 
 
-@app.route("/tasks/<int:task_id>/delete", methods=["POST"])
+@bp.route("/tasks/<int:task_id>/delete", methods=["POST"])
 @login_required
 def delete_task(task_id):
-    task = Task.query.filter_by(id=task_id, user_id=current_user.id).first()
-    if not task:
-        flash("Task not found or you don't have permission to delete it.")
-        return redirect(url_for("dashboard"))
+    try:
+        change, version = group_commit.run(
+            current_user.shard, _tombstone_task, current_user.id, task_id
+        )
+    except TaskNotFoundError as exc:
+        return _mutation_failed(str(exc))
+    task_purger.notify()
+    return _mutation_response(change, version)
+
+
+@bp.route("/tasks/<int:task_id>/move", methods=["POST"])
+@login_required
+def move_task(task_id):
+    """Move a task with its subtasks below another task, or to the top level."""
+    parent_task_id = request.form.get("parent_task_id", type=int)
+    try:
+        previous_parent_id, version = group_commit.run(
+            current_user.shard, _move_task, current_user.id, task_id, parent_task_id
+        )
+    except TaskNotFoundError as exc:
+        return _mutation_failed(str(exc))
+    except CycleError:
+        return _mutation_failed(
+            "A task cannot be moved below its own subtasks.", status=409
+        )
+    task = db.session.get(Task, task_id)
+    change = task_change("moved", task, previous_parent_id)
+    return _mutation_response(change, version)
+
+
+@bp.route("/tasks/<int:task_id>/status", methods=["POST"])
+@login_required
+def set_task_status(task_id):
+    status = request.form.get("status")
+    if status not in TASK_STATUSES:
+        return _mutation_failed("Invalid status.", status=400)
+    try:
+        version = group_commit.run(
+            current_user.shard, _set_task_status, current_user.id, task_id, status
+        )
+    except TaskNotFoundError as exc:
+        return _mutation_failed(str(exc))
+    task = db.session.get(Task, task_id)
+    return _mutation_response(task_change("updated", task), version)
+
+
+@bp.route("/events")
+@login_required
+def task_events():
+    """Server-Sent Events stream of the current user's task changes.
+
+    Event ids are the user's data versions. A reconnect sends the last one
+    as ``Last-Event-ID``; the first connection passes the version of the
+    page it was opened from as ``?after=``.
+    """
+    if not current_app.config["CHANGE_FEED_ENABLED"]:
+        abort(404)
+    seen = request.headers.get("Last-Event-ID", request.args.get("after"))
+    data_version = db.session.get(DataVersion, current_user.id)
+    # The stream outlives the request context, so it must not touch the
+    # database session or the request
+    events = change_feed.listen(
+        current_user.id,
+        int(seen) if seen and seen.isdigit() else None,
+        data_version.version if data_version is not None else 0,
+        current_app.config["CHANGE_FEED_HEARTBEAT"],
+    )
+
+    def generate():
+        yield "retry: 2000\n\n"
+        for item in events:
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            version, change = item
+            kind = "reset" if change["type"] == "reset" else "change"
+            yield f"id: {version}\nevent: {kind}\ndata: {json.dumps(change)}\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/metrics")
+def metrics():
+    if not instrumentation.enabled:
+        abort(404)
+    return Response(
+        instrumentation.exposition(), mimetype="text/plain; version=0.0.4"
+    )
+
+
+def route_queries(user_id=1, task_id=1, username=""):
+    """The ORM queries issued by each route, keyed by a descriptive name."""
+    return {
+        "load_user": User.query.filter_by(id=user_id),
+        "login/register: user by username": User.query.filter_by(username=username),
+        "dashboard/task_column: column page": task_page_query(
+            user_id, after=task_id, status="To Do", parent_task_id=None
+        ),
+        "task_subtasks: subtasks page": task_page_query(
+            user_id, after=task_id, parent_task_id=task_id
+        ),
+        "add_task/add_subtask/delete_task: owned task": live_task_query(
+            task_id, user_id
+        ),
+        "export_tasks: live tasks of a user": Task.query.filter(
+            Task.id.in_(live_task_ids(user_id))
+        ),
+        "task groups of a user": TaskGroup.query.filter_by(user_id=user_id),
+    }
+
+
+def _scanned_table(plan_detail):
+    """The table a query plan step scans in full, if any.
+
+    Older SQLite versions report "SCAN TABLE task", newer ones "SCAN task".
+    Scans of CTEs and subquery results are not table scans.
+    """
+    words = plan_detail.replace("SCAN TABLE ", "SCAN ").split()
+    if len(words) > 1 and words[0] == "SCAN" and words[1] in db.metadata.tables:
+        return words[1]
+    return None
+
+
+@bp.cli.command("check-query-plans")
+def check_query_plans():
+    """Fail if any route query falls back to a full table scan (SQLite only)."""
+    if db.engine.dialect.name != "sqlite":
+        print("Skipping: query plans are only checked on SQLite.")
+        return
+    failures = 0
+    for shard in shards.each(db.session):
+        if shard is not None:
+            print(f"Shard {shard}:")
+        for name, query in route_queries().items():
+            sql = str(
+                query.statement.compile(
+                    dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+                )
+            )
+            rows = db.session.execute(
+                db.text(f"EXPLAIN QUERY PLAN {sql}"),
+                # Run on the database the query itself would go to
+                bind_arguments={"clause": query.statement},
+            )
+            plan = [row[-1] for row in rows]
+            scans = [detail for detail in plan if _scanned_table(detail)]
+            failures += bool(scans)
+            print(f"{'FAIL' if scans else 'ok  '} {name}: {'; '.join(plan)}")
+    if failures:
+        raise SystemExit(f"{failures} route queries use a full table scan.")
+
+
+@bp.cli.command("precompile-templates")
+@click.argument("target", required=False)
+def precompile_templates_command(target):
+    """Compile every template to a Python module, for TEMPLATE_MODULE_DIR."""
+    target = target or current_app.config["TEMPLATE_MODULE_DIR"]
+    if not target:
+        raise click.UsageError("Pass a target directory or set TEMPLATE_MODULE_DIR.")
+    count = precompile_templates(current_app, target)
+    print(f"Compiled {count} templates into {target}.")
+
+
+@bp.cli.command("rebuild-search")
+def rebuild_search():
+    """Create the task search index if needed and refill it from the tasks."""
+    if db.engine.dialect.name != "sqlite":
+        print("Skipping: the search index is only used on SQLite.")
+        return
+    indexed = sum(task_search.rebuild(db.session) for _ in shards.each(db.session))
+    print(f"Indexed {indexed} tasks.")
+
+
+@bp.cli.command("rebuild-hierarchy")
+def rebuild_hierarchy():
+    """Refill the task closure table from the tasks' parent links."""
+    rows = sum(task_tree.rebuild(db.session) for _ in shards.each(db.session))
+    print(f"Wrote {rows} task closure rows.")
+
+
+@bp.cli.command("purge-deleted")
+def purge_deleted():
+    """Remove every tombstoned subtree now, in bounded batches."""
+    task_purger.purge()
+
+
+@bp.cli.command("repair-rollups")
+def repair_rollups():
+    """Recompute every task's subtree aggregates from scratch."""
+    fixed = sum(
+        rollups.recompute(
+            db.session, Task, "parent_task_id", _task_is_done, _task_is_live
+        )
+        for _ in shards.each(db.session)
+    )
+    print(f"Repaired the aggregates of {fixed} tasks.")
+
+
+@bp.cli.command("rebalance-shards")
+@click.option("--user", "username", help="Move only this user.")
+@click.option("--shard", type=int, help="Move to this shard instead of by hash.")
+def rebalance_shards(username, shard):
+    """Move users whose tasks are not on their shard, one at a time.
+
+    Users go to the shard their id hashes to (e.g. after adding a shard, or
+    from the main database after sharding an existing one), or to --shard.
+    The app keeps serving; only a moving user's writes wait.
+    """
+    if not shards.enabled:
+        raise click.UsageError("Set SHARD_DATABASE_URLS to use shards.")
+    if shard is not None and not 0 <= shard < shards.count:
+        raise click.BadParameter(
+            f"There are {shards.count} shards.", param_hint="--shard"
+        )
+    users = User.query.order_by(User.id)
+    if username is not None:
+        users = users.filter_by(username=username)
+    moved = 0
+    for user in users.all():
+        target = shards.shard_for(user.id) if shard is None else shard
+        if user.shard == target:
+            continue
+        source = "the main database" if user.shard is None else f"shard {user.shard}"
+        tasks = move_user_to_shard(user, target)
+        print(f"Moved {user.username} ({tasks} tasks) from {source} to shard {target}.")
+        moved += 1
+    print(f"Moved {moved} users.")
+
+
+class SchemaError(RuntimeError):
+    """Existing tables lack columns of the models: migrations are pending."""
+
+
+def _database_name(shard):
+    return "main" if shard is None else ShardRouter.bind_key(shard)
+
+
+def _stamp_head(engine):
+    # Record a database just created at the current schema as migrated to the
+    # latest revision, so that `flask db upgrade` leaves it as it is
+    directory = current_app.extensions["migrate"].directory
+    scripts = ScriptDirectory(os.path.join(current_app.root_path, directory))
+    with engine.begin() as connection:
+        MigrationContext.configure(connection).stamp(scripts, "head")
+
+
+def _prepare_schema():
+    """Create the tables of new databases, stamped at the latest migration, and
+    check the other databases against the models. Returns the number of tables
+    created."""
+    created, missing, new = 0, [], []
+    for shard, engine, tables in shards.databases():
+        inspector = inspect(engine)
+        existing = set(inspector.get_table_names())
+        if existing.isdisjoint(table.name for table in tables):
+            created += len(tables)  # a new database, created at the current schema
+            new.append(engine)
+            continue
+        for table in tables:
+            if table.name not in existing:
+                missing.append(f"{_database_name(shard)}: {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            missing += [
+                f"{_database_name(shard)}: {table.name}.{column.name}"
+                for column in table.columns
+                if column.name not in columns
+            ]
+    if missing:
+        raise SchemaError(
+            f"Missing tables or columns (run `flask db upgrade`): {', '.join(missing)}"
+        )
+    shards.create_all()
+    for engine in new:
+        _stamp_head(engine)
+    return created
+
+
+def _fill_pools():
+    """Open as many connections as each pool keeps, and hand them back."""
+    opened = []
+    for shard, engine, _ in shards.databases():
+        size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+        connections = [engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
+        opened.append(f"{_database_name(shard)} {size}")
+    return opened
+
+
+def _rehearse_writes(user_id):
+    # Every statement of the mutating routes, for the caller to roll back
+    task_id, _ = _insert_task(user_id, "warm-up", "To Do", None)
+    subtask_id, _ = _insert_task(user_id, "warm-up", "To Do", task_id)
+    _set_task_status(user_id, subtask_id, "Done")
+    previous_parent_id, _ = _move_task(user_id, subtask_id, None)
+    task_change("moved", db.session.get(Task, subtask_id), previous_parent_id)
+    _tombstone_task(user_id, task_id)
+
+
+def warm_up(app):
+    """Do at startup what the first requests of a worker would pay for.
+
+    Creates the tables of a new database (or shard), stamped at the latest
+    migration, and raises :class:`SchemaError` if an existing one lags behind
+    the models. Then it configures the mappers and the URL map, compiles every
+    template, runs the route queries and task writes once (for a throwaway
+    user, rolled back) so their SQL is compiled and cached, and fills the
+    connection pools. Returns ``(step, seconds, detail)`` for each step.
+    """
+    timings = []
+    started = time.perf_counter()
+
+    def done(step, detail):
+        nonlocal started
+        now = time.perf_counter()
+        timings.append((step, now - started, detail))
+        started = now
+
+    with app.app_context():
+        created = _prepare_schema()
+        done("schema", f"{created} tables created")
+        configure_mappers()
+        app.url_map.update()
+        done("mappers", f"{len(db.Model.registry.mappers)} models")
+        names = app.jinja_loader.list_templates()
+        for name in names:
+            app.jinja_env.get_template(name)
+        done("templates", f"{len(names)} compiled")
+    with app.test_request_context():
+        queries = route_queries(user_id=0, task_id=0)  # nothing matches
+        user = User(username=f"warm-up-{os.getpid()}", password_hash="")
+        db.session.add(user)
+        db.session.flush()
+        try:
+            for _ in shards.each(db.session):
+                for query in queries.values():
+                    query.all()
+                _rehearse_writes(user.id)
+        finally:
+            db.session.rollback()
+        done("statements", f"{len(queries)} queries and the task writes")
+        done("pools", ", ".join(_fill_pools()))
+    return timings
+
+
+# The engines of every app built in this process
+_engines = weakref.WeakSet()
+
+
+def _dispose_engines():
+    # In a forked worker: start with empty pools rather than share the
+    # connections of the parent, which stay open for the parent to close
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+# The password hasher, group commit writers and asyncio loop restart by
+# themselves in a forked worker
+os.register_at_fork(after_in_child=_dispose_engines)
+
+
+def create_app(config=None):
+    """Build the app from the environment, with ``config`` taking precedence.
+
+    Building it opens no connections, so `flask` commands (`flask db upgrade`
+    included) can load it, and a prefork server can build it once in its
+    master (gunicorn --preload "app:create_app()") and fork the workers from
+    it. With ``WARM_UP`` set, :func:`warm_up` runs before the app is returned.
+    """
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "your_secret_key"
+    app.config.update(engine_config(os.environ))
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Deleted subtrees are purged in the background, this many rows per
+    # transaction
+    app.config["TASK_PURGE_BATCH_SIZE"] = 500
+    app.config["TASK_PURGE_PAUSE"] = 0.05  # seconds between purge batches
+    app.config["TASK_PURGE_INTERVAL"] = 60  # seconds between idle purge sweeps
+    # Rendered dashboard columns are cached per user and data version
+    app.config["RENDER_CACHE_MAX_BYTES"] = 64 * 1024 * 1024
+    app.config["RENDER_CACHE_BACKEND"] = None  # optional shared get/set store
+    # Columns and subtask lists are served in id-ordered pages of this many tasks
+    app.config["TASK_PAGE_SIZE"] = 50
+    app.config["TASK_PAGE_MAX_SIZE"] = 500
+    # Rows per executemany() batch when bulk importing tasks
+    app.config["TASK_IMPORT_CHUNK_SIZE"] = 5000
+    app.config["TASK_EXPORT_FETCH_SIZE"] = 1000
+    # Password hashing runs on a process pool; raise the cost (e.g.
+    # "pbkdf2:sha256:600000") and stored hashes are upgraded at next login
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256"
+    app.config["PASSWORD_HASH_SALT_LENGTH"] = 16
+    app.config["PASSWORD_HASH_WORKERS"] = min(4, os.cpu_count() or 1)
+    app.config["PASSWORD_HASH_MAX_PENDING"] = 16  # beyond this, logins get a 503
+    # Server-Timing headers and Prometheus histograms at /metrics
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED") == "1"
+    # Open dashboards follow changes over Server-Sent Events from /events. Every
+    # open stream holds a worker for as long as its tab is open, so enable it
+    # only on an async worker class (gunicorn -k gevent), and give several
+    # processes a CHANGE_FEED_BACKEND so that they see each other's changes
+    app.config["CHANGE_FEED_ENABLED"] = os.environ.get("CHANGE_FEED") == "1"
+    app.config["CHANGE_FEED_HISTORY"] = 100  # events kept per user for reconnects
+    app.config["CHANGE_FEED_HEARTBEAT"] = 15  # seconds between keepalives
+    app.config["CHANGE_FEED_BACKEND"] = None  # optional cross-process pub/sub
+    # Keep compiled templates across restarts (TEMPLATE_CACHE_DIR), or load the
+    # modules written by `flask precompile-templates` (TEMPLATE_MODULE_DIR)
+    app.config["TEMPLATE_CACHE_DIR"] = os.environ.get("TEMPLATE_CACHE_DIR")
+    app.config["TEMPLATE_MODULE_DIR"] = os.environ.get("TEMPLATE_MODULE_DIR")
+    # Serve the read-heavy views as async views on an asyncio engine (aiosqlite
+    # or asyncpg) rather than on the request thread's session
+    app.config["ASYNC_MODE"] = os.environ.get("ASYNC_MODE") == "1"
+    # Queue the single-task writes of concurrent requests to one writer thread
+    # per database, which commits up to a batch of them at once after a short
+    # window
+    app.config["GROUP_COMMIT"] = os.environ.get("GROUP_COMMIT") == "1"
+    app.config["GROUP_COMMIT_WINDOW"] = 0.002  # seconds
+    app.config["GROUP_COMMIT_MAX_BATCH"] = 64
+    # Create missing tables, compile templates and fill the connection pools
+    # when the app is built rather than on each worker's first requests
+    app.config["WARM_UP"] = os.environ.get("WARM_UP") == "1"
+    app.config.update(config or {})
+
+    configure_templates(app)
+    app.jinja_env.globals["TASK_STATUSES"] = TASK_STATUSES
+    db.init_app(app)
+    instrumentation.init_app(app)
+    async_db.init_app(app)
+    migrate.init_app(app)
+    login_manager.init_app(app)
+    router = app.extensions["shards"] = ShardRouter(
+        db, SHARDED_MODELS, [task_tree.table]
+    )
+    router.init_app(app)
+    app.extensions["group_commit"] = GroupCommitter(
+        db, app, router=router, instrumentation=instrumentation
+    )
+    app.extensions["task_purger"] = TaskPurger(app)
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        salt_length=app.config["PASSWORD_HASH_SALT_LENGTH"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
+    app.extensions["render_cache"] = RenderCache(
+        app.config["RENDER_CACHE_MAX_BYTES"], app.config["RENDER_CACHE_BACKEND"]
+    )
+    app.extensions["change_feed"] = ChangeFeed(
+        history=app.config["CHANGE_FEED_HISTORY"],
+        backend=app.config["CHANGE_FEED_BACKEND"],
+    )
+    app.register_blueprint(bp)
+    if app.config["ASYNC_MODE"]:
+        _use_async_views(app)
+
+    # The engines exist from here on, without connections yet
+    for _, engine, _ in router.databases():
+        configure_sqlite_connections(engine, app.config["SQLITE_PRAGMAS"])
+        _engines.add(engine)
+    if app.config["WARM_UP"]:
+        for step, seconds, detail in warm_up(app):
+            logger.info("Warm-up %s: %.1fms (%s)", step, 1000 * seconds, detail)
+    return app
+
+
+COLD_START = """
+import time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{module}.create_app({{"WARM_UP": True}})
+print(imported - started, time.perf_counter() - imported)
+"""
 
-    db.session.delete(task)
-    db.session.commit()
-    return redirect(url_for("dashboard"))
 
+@bp.cli.command("warmup")
+def warmup():
+    """Warm the app up as a server does at startup, reporting the timings.
 
-# Initialize database tables if they don’t exist
-@app.before_first_request
-def create_tables():
-    db.create_all()
+    Also times a cold start in a fresh interpreter: importing the app and
+    building it with WARM_UP, which every worker pays without --preload.
+    """
+    try:
+        timings = warm_up(current_app)
+    except SchemaError as exc:
+        raise SystemExit(str(exc))
+    for step, seconds, detail in timings:
+        print(f"{step:<10} {1000 * seconds:>8.1f}ms  {detail}")
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START.format(module=__name__)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    import_seconds, startup_seconds = map(float, output.split()[-2:])
+    print(f"{'import':<10} {1000 * import_seconds:>8.1f}ms  in a fresh interpreter")
+    print(f"{'startup':<10} {1000 * startup_seconds:>8.1f}ms  create_app(), warmed up")
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app({"WARM_UP": True}).run(debug=True)
@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import os
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from connections import configure_sqlite_connections
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(uri):
+    """The asyncio-driver equivalent of a synchronous database URL."""
+    scheme, separator, rest = uri.partition("://")
+    dialect = scheme.partition("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver is known for {scheme} databases")
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+
+async def _run_in_context(context, coroutine):
+    # A task runs in a copy of the context current when it is created
+    return await context.run(asyncio.ensure_future, coroutine)
+
+
+class AsyncDatabase:
+    """Run ``async def`` views on one event loop shared by the whole process.
+
+    Flask calls :meth:`Flask.async_to_sync` for coroutine views, and its
+    default starts a new event loop per request, which rules out pooled
+    asyncio connections. With ``ASYNC_MODE`` set this replaces it: views are
+    sent to a long-lived loop on a daemon thread, together with the caller's
+    context (so ``request``, ``g`` and ``current_user`` work as usual), and
+    :meth:`session` hands out sessions on an asyncio engine for the current
+    app's database. The loop is shared by every app that enables it; each app
+    gets its own engine. Both are created lazily, and again in a forked child.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get("ASYNC_MODE"):
+            return
+        # The app's engine, and the process it was created in
+        app.extensions["async_db"] = {"engine": None, "pid": None}
+        app.async_to_sync = self.async_to_sync
+
+    @property
+    def enabled(self):
+        """Whether the current app serves async views from this instance."""
+        return has_app_context() and "async_db" in current_app.extensions
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._loop.run_forever, name="async-db", daemon=True
+                ).start()
+            return self._loop
+
+    @staticmethod
+    def _create_engine(config):
+        options = dict(config["SQLALCHEMY_ENGINE_OPTIONS"])
+        # aiosqlite gives every connection its own thread anyway
+        options.pop("connect_args", None)
+        if options.get("poolclass") is QueuePool:
+            options["poolclass"] = AsyncAdaptedQueuePool
+        engine = create_async_engine(
+            async_database_url(config["SQLALCHEMY_DATABASE_URI"]), **options
+        )
+        configure_sqlite_connections(engine.sync_engine, config["SQLITE_PRAGMAS"])
+        return engine
+
+    @property
+    def engine(self):
+        """The current app's asyncio engine."""
+        state = current_app.extensions["async_db"]
+        with self._lock:
+            if state["pid"] != os.getpid():
+                state["engine"] = self._create_engine(current_app.config)
+                state["pid"] = os.getpid()
+            return state["engine"]
+
+    def session(self):
+        """A new :class:`AsyncSession`, for use as ``async with``."""
+        return AsyncSession(self.engine, expire_on_commit=False)
+
+    def async_to_sync(self, func):
+        def run(*args, **kwargs):
+            context = contextvars.copy_context()
+            future = asyncio.run_coroutine_threadsafe(
+                _run_in_context(context, func(*args, **kwargs)), self._start()
+            )
+            return future.result()
+
+        return run
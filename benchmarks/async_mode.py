@@ -0,0 +1,166 @@
+"""Read throughput of the sync and async serving modes under many clients.
+
+Each mode runs in a fresh interpreter (``ASYNC_MODE`` is read by create_app)
+against the same generated data set. ``--clients`` threads, each logged in as
+one of ``--users`` users, request column pages, subtask pages and the
+dashboard for ``--duration`` seconds::
+
+    python -m benchmarks.async_mode --clients 128 --duration 10
+    python -m benchmarks.async_mode --database-url postgresql://localhost/todo
+
+The async mode needs aiosqlite (or asyncpg for PostgreSQL) and greenlet.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import datagen
+from benchmarks.routes import percentile
+
+MODES = ("sync", "async")
+
+
+def login(app, username):
+    client = app.test_client()
+    # Logging everybody in at once overruns the password hashing queue
+    while client.post(
+        "/login", data={"username": username, "password": datagen.PASSWORD}
+    ).status_code == 503:
+        time.sleep(0.1)
+    return client
+
+
+def client_loop(todo, client, task_ids, deadline, seed, results):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        kind = rng.choice(("column", "subtasks", "dashboard"))
+        if kind == "column":
+            path = f"/columns/{rng.choice(todo.TASK_STATUSES)}"
+            query = {"after": rng.choice(task_ids)}
+        elif kind == "subtasks":
+            path, query = f"/tasks/{rng.choice(task_ids)}/subtasks", {}
+        else:
+            path, query = "/", {}
+        started = time.perf_counter()
+        response = client.get(path, query_string=query)
+        elapsed = time.perf_counter() - started
+        results.append((kind, response.status_code == 200, elapsed))
+
+
+def run_mode(args):
+    """Run one mode in this interpreter and print its result as JSON."""
+    import app as todo
+
+    app = todo.create_app()
+    app.logger.setLevel(logging.CRITICAL)  # failed requests are counted
+    with app.app_context():
+        task_ids = {
+            user.username: [
+                task_id
+                for (task_id,) in todo.db.session.query(todo.Task.id).filter_by(
+                    user_id=user.id
+                )
+            ]
+            for user in todo.User.query
+        }
+    usernames = [sorted(task_ids)[n % len(task_ids)] for n in range(args.clients)]
+    with ThreadPoolExecutor(16) as executor:
+        clients = list(executor.map(lambda name: login(app, name), usernames))
+    deadline = time.monotonic() + args.duration
+    results = []
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(todo, client, task_ids[username], deadline, n, results),
+        )
+        for n, (client, username) in enumerate(zip(clients, usernames))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.extensions["password_hasher"].shutdown()
+
+    summary = {"mode": args.run_mode}
+    for kind in ("column", "subtasks", "dashboard"):
+        rows = [row for row in results if row[0] == kind]
+        latencies = sorted(latency for _, ok, latency in rows if ok)
+        summary[kind] = {
+            "ok_per_second": len(latencies) / args.duration,
+            "errors": sum(not ok for _, ok, _ in rows),
+            "p50_ms": 1000 * (percentile(latencies, 0.50) or 0),
+            "p95_ms": 1000 * (percentile(latencies, 0.95) or 0),
+        }
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--roots", type=int, default=30)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_mode:
+        return run_mode(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["DATABASE_URL"] = url
+        import app as todo
+
+        app = todo.create_app()
+        with app.app_context():
+            todo.db.drop_all()
+            todo.db.create_all()
+            datagen.generate(
+                todo.db,
+                todo.User,
+                todo.Task,
+                args.users,
+                args.roots,
+                args.depth,
+                args.fanout,
+                datagen.parse_status_mix("To Do=5,In Progress=3,Done=2"),
+                tree=todo.task_tree,
+            )
+            todo.db.engine.dispose()
+
+        print(f"{args.clients} clients, {args.duration:g}s per mode")
+        print(
+            f"{'mode':<6} {'route':<10} {'ok/s':>8} {'errors':>7}"
+            f" {'p50':>10} {'p95':>10}"
+        )
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.async_mode", "--run-mode", mode]
+                + [f"--clients={args.clients}", f"--duration={args.duration}"],
+                env={**os.environ, "ASYNC_MODE": "1" if mode == "async" else "0"},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            for kind in ("column", "subtasks", "dashboard"):
+                row = result[kind]
+                print(
+                    f"{mode:<6} {kind:<10} {row['ok_per_second']:>8.1f}"
+                    f" {row['errors']:>7} {row['p50_ms']:>8.1f}ms"
+                    f" {row['p95_ms']:>8.1f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""First-request latency of a freshly started worker, with and without WARM_UP.
+
+The data set is generated once. Each mode then runs in a fresh interpreter
+that builds the app and makes ``--rounds`` passes over the same requests, as
+one user: log in, load the dashboard, a column page and a subtask page,
+search, add a task and set a status. The first pass is what a new worker's
+first requests cost; the median of the others is steady state::
+
+    python -m benchmarks.cold_start --rounds 20
+    python -m benchmarks.cold_start --template-cache-dir /tmp/jinja
+
+Password hashing runs on its process pool as configured, so the first login
+also pays for starting the pool's workers.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen
+
+MODES = ("cold", "warm")
+
+
+def requests(client, username, task_ids, round_):
+    """(name, request function) for one pass, in order."""
+    task_id = task_ids[round_ % len(task_ids)]
+    return [
+        (
+            "POST /login",
+            lambda: client.post(
+                "/login", data={"username": username, "password": datagen.PASSWORD}
+            ),
+        ),
+        ("GET /", lambda: client.get("/")),
+        ("GET /columns/<status>", lambda: client.get("/columns/To Do")),
+        (
+            "GET /tasks/<id>/subtasks",
+            lambda: client.get(f"/tasks/{task_id}/subtasks"),
+        ),
+        ("GET /search", lambda: client.get("/search", query_string={"q": "task"})),
+        (
+            "POST /add_task/<status>",
+            lambda: client.post(
+                "/add_task/To Do", query_string={"format": "json"}, data={"title": "t"}
+            ),
+        ),
+        (
+            "POST /tasks/<id>/status",
+            lambda: client.post(
+                f"/tasks/{task_id}/status",
+                query_string={"format": "json"},
+                data={"status": "In Progress" if round_ % 2 else "Done"},
+            ),
+        ),
+    ]
+
+
+def run_mode(args):
+    """Run one mode in this interpreter and print its result as JSON."""
+    started = time.perf_counter()
+    import app as todo
+
+    imported = time.perf_counter()
+    app = todo.create_app({"WARM_UP": args.run_mode == "warm"})
+    built = time.perf_counter()
+    (username, task_ids), = json.loads(args.task_ids).items()
+    latencies = {}
+    for round_ in range(args.rounds):
+        client = app.test_client()
+        for name, request in requests(client, username, task_ids, round_):
+            request_started = time.perf_counter()
+            response = request()
+            if response.status_code >= 400:
+                raise SystemExit(f"{name}: {response.status_code}")
+            latencies.setdefault(name, []).append(
+                time.perf_counter() - request_started
+            )
+    app.extensions["password_hasher"].shutdown()
+    print(
+        json.dumps(
+            {
+                "import": imported - started,
+                "create_app": built - imported,
+                "first": {name: values[0] for name, values in latencies.items()},
+                "steady": {
+                    name: statistics.median(values[1:])
+                    for name, values in latencies.items()
+                },
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--roots", type=int, default=50)
+    parser.add_argument("--template-cache-dir", help="sets TEMPLATE_CACHE_DIR")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--task-ids", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_mode:
+        return run_mode(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp}/bench.db"}
+        if args.template_cache_dir:
+            env["TEMPLATE_CACHE_DIR"] = args.template_cache_dir
+        os.environ.update(env)
+        import app as todo
+
+        app = todo.create_app()
+        with app.app_context():
+            todo.shards.create_all()
+            task_ids = datagen.generate(
+                todo.db,
+                todo.User,
+                todo.Task,
+                1,
+                args.roots,
+                2,
+                3,
+                datagen.parse_status_mix("To Do=5,In Progress=3,Done=2"),
+                tree=todo.task_tree,
+            )
+            todo.db.engine.dispose()
+
+        results = {}
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.cold_start", "--run-mode", mode]
+                + [f"--rounds={args.rounds}", f"--task-ids={json.dumps(task_ids)}"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    for mode in MODES:
+        result = results[mode]
+        print(
+            f"{mode}: import {1000 * result['import']:.0f}ms,"
+            f" create_app() {1000 * result['create_app']:.0f}ms"
+        )
+    print(
+        f"{'route':<26}"
+        + "".join(f" {f'{mode} first':>11}" for mode in MODES)
+        + f" {'steady':>9}"
+    )
+    for name in results["cold"]["first"]:
+        steady = statistics.mean(results[mode]["steady"][name] for mode in MODES)
+        print(
+            f"{name:<26}"
+            + "".join(
+                f" {1000 * results[mode]['first'][name]:>9.1f}ms" for mode in MODES
+            )
+            + f" {1000 * steady:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
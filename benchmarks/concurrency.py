@@ -0,0 +1,159 @@
+"""Throughput of a mixed read/write workload under several database setups.
+
+Each setup runs in a fresh interpreter with ``--processes`` forked workers,
+like gunicorn, of ``--threads`` client threads each. Clients are logged in
+as their own user and either load the dashboard or add a task::
+
+    python -m benchmarks.concurrency --processes 4 --threads 4 --duration 10
+    python -m benchmarks.concurrency --postgres-url postgresql://localhost/todo
+
+Setups:
+
+* ``sqlite-default``: no pragmas and a new connection per checkout, which is
+  how the app used to connect
+* ``sqlite-tuned``: the WAL/pragma and pool settings from ``engine_config``
+* ``postgresql``: only with ``--postgres-url``, using the tuned QueuePool
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SETUPS = ("sqlite-default", "sqlite-tuned", "postgresql")
+
+
+def client_loop(app, username, deadline, write_ratio, results):
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": "bench"})
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        if random.random() < write_ratio:
+            kind = "write"
+            response = client.post("/add_task/To Do", data={"title": "bench task"})
+        else:
+            kind = "read"
+            response = client.get("/")
+        elapsed = time.perf_counter() - started
+        results.append((kind, response.status_code < 400, elapsed))
+
+
+def worker(app, index, args, queue):
+    # The app disposes its engines in forked children by itself
+    deadline = time.monotonic() + args.duration
+    results = []
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(app, f"bench{index}-{n}", deadline, args.write_ratio, results),
+        )
+        for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def run_setup(args):
+    """Run one setup in this interpreter and print its result as JSON."""
+    import app as todo
+
+    config = {"PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "PASSWORD_HASH_WORKERS": 0}
+    if args.run_setup == "sqlite-default":
+        config.update(SQLITE_PRAGMAS={}, SQLALCHEMY_ENGINE_OPTIONS={})
+    app = todo.create_app(config)
+    app.logger.setLevel(logging.CRITICAL)  # failed requests are counted
+    with app.app_context():
+        todo.db.drop_all()
+        todo.db.create_all()
+        for index in range(args.processes):
+            for n in range(args.threads):
+                user = todo.User(username=f"bench{index}-{n}")
+                user.set_password("bench")
+                todo.db.session.add(user)
+        todo.db.session.commit()
+        todo.db.engine.dispose()
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(app, index, args, queue))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    results = [row for _ in processes for row in queue.get()]
+    for process in processes:
+        process.join()
+
+    summary = {"setup": args.run_setup}
+    for kind in ("read", "write"):
+        rows = [row for row in results if row[0] == kind]
+        latencies = sorted(latency for _, ok, latency in rows if ok)
+        summary[kind] = {
+            "ok_per_second": len(latencies) / args.duration,
+            "errors": sum(not ok for _, ok, _ in rows),
+            "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))]
+            if latencies
+            else None,
+        }
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--postgres-url")
+    parser.add_argument("--run-setup", choices=SETUPS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_setup:
+        return run_setup(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = {
+            "sqlite-default": f"sqlite:///{os.path.join(tmp, 'default.db')}",
+            "sqlite-tuned": f"sqlite:///{os.path.join(tmp, 'tuned.db')}",
+            "postgresql": args.postgres_url,
+        }
+        print(
+            f"{'setup':<15} {'reads/s':>8} {'writes/s':>9} {'errors':>7}"
+            f" {'read p95':>10} {'write p95':>10}"
+        )
+        for setup, url in urls.items():
+            if url is None:
+                continue
+            options = [
+                f"--{name}={getattr(args, name.replace('-', '_'))}"
+                for name in ("processes", "threads", "duration", "write-ratio")
+            ]
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.concurrency", "--run-setup", setup]
+                + options,
+                env={**os.environ, "DATABASE_URL": url},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            read, write = result["read"], result["write"]
+            print(
+                f"{setup:<15} {read['ok_per_second']:>8.1f}"
+                f" {write['ok_per_second']:>9.1f}"
+                f" {read['errors'] + write['errors']:>7}"
+                f" {read['p95_ms'] or 0:>8.1f}ms {write['p95_ms'] or 0:>8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
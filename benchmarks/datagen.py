@@ -0,0 +1,111 @@
+"""Synthetic users and task trees for benchmarks.
+
+Every user gets ``roots`` top-level tasks, each the root of a tree with
+``fanout`` subtasks per task down to ``depth`` levels below it. Statuses are
+drawn from ``status_mix``, a mapping of status to relative weight.
+"""
+import random
+
+from werkzeug.security import generate_password_hash
+
+import rollups
+from sequences import reserve_ids
+
+PASSWORD = "bench-password"
+
+
+def parse_status_mix(text):
+    """Parse ``"To Do=5,In Progress=3,Done=2"`` into a weight mapping."""
+    mix = {}
+    for part in text.split(","):
+        status, _, weight = part.partition("=")
+        mix[status.strip()] = float(weight or 1)
+    return mix
+
+
+def tasks_per_user(roots, depth, fanout):
+    return roots * sum(fanout**level for level in range(depth + 1))
+
+
+def generate(
+    db,
+    User,
+    Task,
+    users,
+    roots,
+    depth,
+    fanout,
+    status_mix,
+    seed=0,
+    chunk_size=5000,
+    title=None,
+    tree=None,
+):
+    """Insert the data set and return ``{username: [task ids]}``.
+
+    Rows go in through executemany() with ids reserved up front, so generating
+    millions of tasks takes seconds rather than minutes. ``title(rng,
+    task_id)`` replaces the default ``"Task <id>"`` titles, and the closure
+    rows of the new tasks are added to ``tree`` (a ``ClosureTable``).
+    """
+    rng = random.Random(seed)
+    statuses, weights = zip(*status_mix.items())
+    # One hash for everybody: generating the data should not cost a hash per user
+    password_hash = generate_password_hash(PASSWORD)
+    user_ids = reserve_ids(db.session, User.id, users)
+    new_task_ids = reserve_ids(
+        db.session, Task.id, users * tasks_per_user(roots, depth, fanout)
+    )
+    reserved = iter(new_task_ids)
+    task_ids = {}
+    rows = []
+
+    def flush():
+        if rows:
+            db.session.execute(Task.__table__.insert(), rows)
+            rows.clear()
+
+    for user_id in user_ids:
+        username = f"bench{user_id}"
+        db.session.execute(
+            User.__table__.insert(),
+            {"id": user_id, "username": username, "password_hash": password_hash},
+        )
+        ids = task_ids[username] = []
+        level = [None] * roots
+        for _ in range(depth + 1):
+            children = []
+            for parent_id in level:
+                for _ in range(1 if parent_id is None else fanout):
+                    task_id = next(reserved)
+                    rows.append(
+                        {
+                            "id": task_id,
+                            "title": title(rng, task_id)
+                            if title
+                            else f"Task {task_id}",
+                            "status": rng.choices(statuses, weights)[0],
+                            "is_completed": False,
+                            "parent_task_id": parent_id,
+                            "user_id": user_id,
+                        }
+                    )
+                    ids.append(task_id)
+                    children.append(task_id)
+                    if len(rows) >= chunk_size:
+                        flush()
+            level = children
+    flush()
+    if tree is not None and new_task_ids:
+        tree.insert_nodes(
+            db.session,
+            db.and_(
+                Task.id.between(new_task_ids[0], new_task_ids[-1]),
+                Task.user_id.in_(list(user_ids)),
+            ),
+        )
+    db.session.commit()
+    rollups.recompute(
+        db.session, Task, "parent_task_id", lambda task: task.status == "Done"
+    )
+    return task_ids
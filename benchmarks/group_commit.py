@@ -0,0 +1,161 @@
+"""Write throughput and latency with per-request commits and with group commit.
+
+Each mode runs in a fresh interpreter (``GROUP_COMMIT`` is read by create_app)
+with ``--threads`` clients, each logged in as its own user. Clients add a
+task now and then and otherwise flip the status of one of their tasks, like
+a burst of checkbox toggles::
+
+    python -m benchmarks.group_commit --threads 32 --duration 10
+    python -m benchmarks.group_commit --synchronous FULL --window 0.005
+
+The group commit run also reports the mean batch size and queue wait from
+the ``todo_group_commit_*`` histograms.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.routes import percentile
+
+MODES = ("per-request", "group")
+
+
+def client_loop(todo, app, username, deadline, results):
+    rng = random.Random(username)
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": "bench"})
+    task_ids = []
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        if len(task_ids) < 5 or rng.random() < 0.2:
+            response = client.post(
+                "/add_task/To Do", query_string={"format": "json"}, data={"title": "t"}
+            )
+            if response.status_code == 200:
+                task_ids.append(response.json["task"]["id"])
+        else:
+            response = client.post(
+                f"/tasks/{rng.choice(task_ids)}/status",
+                query_string={"format": "json"},
+                data={"status": rng.choice(todo.TASK_STATUSES)},
+            )
+        results.append((response.status_code == 200, time.perf_counter() - started))
+
+
+def histogram_mean(exposition, name):
+    totals = {}
+    for line in exposition.splitlines():
+        for suffix in ("_sum", "_count"):
+            if line.startswith(name + suffix + "{"):
+                totals[suffix] = totals.get(suffix, 0.0) + float(line.split()[-1])
+    return totals["_sum"] / totals["_count"] if totals.get("_count") else None
+
+
+def run_mode(args):
+    """Run one mode in this interpreter and print its result as JSON."""
+    import app as todo
+
+    app = todo.create_app(
+        {
+            "GROUP_COMMIT_WINDOW": args.window,
+            "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+            "PASSWORD_HASH_WORKERS": 0,
+        }
+    )
+    app.logger.setLevel(logging.CRITICAL)  # failed requests are counted
+    with app.app_context():
+        todo.shards.create_all()
+        for n in range(args.threads):
+            user = todo.User(username=f"bench{n}")
+            user.set_password("bench")
+            todo.db.session.add(user)
+        todo.db.session.commit()
+
+    deadline = time.monotonic() + args.duration
+    results = []
+    threads = [
+        threading.Thread(
+            target=client_loop, args=(todo, app, f"bench{n}", deadline, results)
+        )
+        for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    exposition = todo.instrumentation.exposition()
+    latencies = sorted(latency for ok, latency in results if ok)
+    print(
+        json.dumps(
+            {
+                "mode": args.run_mode,
+                "ok_per_second": len(latencies) / args.duration,
+                "errors": sum(not ok for ok, _ in results),
+                "p50_ms": 1000 * (percentile(latencies, 0.50) or 0),
+                "p95_ms": 1000 * (percentile(latencies, 0.95) or 0),
+                "batch_size": histogram_mean(
+                    exposition, "todo_group_commit_batch_size"
+                ),
+                "queue_wait": histogram_mean(
+                    exposition, "todo_group_commit_queue_seconds"
+                ),
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--window", type=float, default=0.002, help="seconds")
+    parser.add_argument("--synchronous", default="NORMAL", help="SQLite pragma")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_mode:
+        return run_mode(args)
+
+    print(
+        f"{args.threads} clients, synchronous={args.synchronous},"
+        f" window {1000 * args.window:g}ms, {args.duration:g}s per mode"
+    )
+    print(
+        f"{'mode':<12} {'writes/s':>9} {'errors':>7} {'p50':>9} {'p95':>9}"
+        f" {'batch':>6} {'queue wait':>11}"
+    )
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.group_commit", "--run-mode", mode]
+                + [f"--{name}={getattr(args, name)}" for name in ("threads", "window")]
+                + [f"--duration={args.duration}"],
+                env={
+                    **os.environ,
+                    "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                    "GROUP_COMMIT": "1" if mode == "group" else "0",
+                    "METRICS_ENABLED": "1",
+                    "SQLITE_SYNCHRONOUS": args.synchronous,
+                },
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        batch, wait = result["batch_size"], result["queue_wait"]
+        print(
+            f"{mode:<12} {result['ok_per_second']:>9.1f} {result['errors']:>7}"
+            f" {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms"
+            f" {batch or 1:>6.1f} {1000 * (wait or 0):>9.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Subtree, ancestor and move timings: recursive queries against the closure table.
+
+Generates ``--users`` users' task trees, then times, for random tasks, the
+subtree fetch and the ancestor lookup both as a recursive CTE over
+``parent_task_id`` and as a single query on the closure table, and finally
+``POST /tasks/<id>/move`` between random parents::
+
+    python -m benchmarks.hierarchy --users 10 --roots 20 --depth 6 --fanout 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import datagen
+from benchmarks.routes import percentile
+
+
+def recursive_subtree(todo, task_id):
+    Task = todo.Task
+    subtree = (
+        todo.db.select(Task.id).where(Task.id == task_id).cte("subtree", recursive=True)
+    )
+    subtree = subtree.union_all(
+        todo.db.select(Task.id).where(Task.parent_task_id == subtree.c.id)
+    )
+    return todo.db.select(subtree.c.id)
+
+
+def recursive_ancestors(todo, task_id):
+    Task = todo.Task
+    ancestors = (
+        todo.db.select(Task.id, Task.parent_task_id)
+        .where(Task.id == task_id)
+        .cte("ancestors", recursive=True)
+    )
+    ancestors = ancestors.union_all(
+        todo.db.select(Task.id, Task.parent_task_id).where(
+            Task.id == ancestors.c.parent_task_id
+        )
+    )
+    return todo.db.select(ancestors.c.id)
+
+
+def timed(repeat, fn):
+    latencies = []
+    for n in range(repeat):
+        started = time.perf_counter()
+        fn(n)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return percentile(latencies, 0.50), percentile(latencies, 0.95)
+
+
+def report(name, timings):
+    p50, p95 = timings
+    print(f"  {name:<32} p50 {1000 * p50:7.2f}ms  p95 {1000 * p95:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--roots", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import app as todo
+
+        app = todo.create_app()
+        rng = random.Random(args.seed)
+        with app.app_context():
+            todo.db.create_all()
+            task_ids = datagen.generate(
+                todo.db,
+                todo.User,
+                todo.Task,
+                args.users,
+                args.roots,
+                args.depth,
+                args.fanout,
+                datagen.parse_status_mix("To Do=5,In Progress=3,Done=2"),
+                seed=args.seed,
+                tree=todo.task_tree,
+            )
+            all_ids = [task_id for ids in task_ids.values() for task_id in ids]
+            roots = [
+                task_id
+                for (task_id,) in todo.db.session.query(todo.Task.id).filter(
+                    todo.Task.parent_task_id.is_(None)
+                )
+            ]
+            print(f"{len(all_ids)} tasks, trees {args.depth + 1} levels deep")
+
+            def run(statement):
+                return lambda n: todo.db.session.execute(statement(n)).all()
+
+            cases = {
+                "subtree of a root, recursive": run(
+                    lambda n: recursive_subtree(todo, rng.choice(roots))
+                ),
+                "subtree of a root, closure": run(
+                    lambda n: todo.task_tree.descendant_ids([rng.choice(roots)])
+                ),
+                "ancestors, recursive": run(
+                    lambda n: recursive_ancestors(todo, rng.choice(all_ids))
+                ),
+                "ancestors, closure": run(
+                    lambda n: todo.task_tree.ancestor_ids(rng.choice(all_ids))
+                ),
+            }
+            for name, case in cases.items():
+                report(name, timed(args.repeat, case))
+
+        username = sorted(task_ids)[0]
+        ids = task_ids[username]
+        client = app.test_client()
+        client.post("/login", data={"username": username, "password": datagen.PASSWORD})
+
+        def move(n):
+            task_id, parent_id = rng.choice(ids), rng.choice(ids + [None])
+            client.post(
+                f"/tasks/{task_id}/move",
+                query_string={"format": "json"},
+                data={} if parent_id is None else {"parent_task_id": parent_id},
+            )
+
+        report("POST /tasks/<id>/move", timed(args.repeat, move))
+        app.extensions["password_hasher"].shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Login throughput at various password hashing pool sizes.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.login --pool-sizes 0 1 2 4 --clients 16 --logins 200
+
+Pool size 0 hashes inline on the request thread, as before the pool existed.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as todo
+from hashing import PasswordHasher
+
+
+def setup_database(path):
+    app = todo.create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+    with app.app_context():
+        todo.db.create_all()
+        user = todo.User(username="bench")
+        user.set_password("bench-password")
+        todo.db.session.add(user)
+        todo.db.session.commit()
+    return app
+
+
+def login_once(app):
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post(
+        "/login", data={"username": "bench", "password": "bench-password"}
+    )
+    return response.status_code, time.perf_counter() - started
+
+
+def run(app, pool_size, clients, logins, max_pending):
+    app.extensions["password_hasher"].shutdown()
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        salt_length=app.config["PASSWORD_HASH_SALT_LENGTH"],
+        workers=pool_size,
+        max_pending=max_pending,
+    )
+    login_once(app)  # start the pool's processes outside the measurement
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(lambda _: login_once(app), range(logins)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for status, latency in results if status == 302)
+    rejected = sum(status == 503 for status, _ in results)
+    return {
+        "pool_size": pool_size,
+        "logins_per_second": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else None,
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))]
+        if latencies
+        else None,
+        "rejected": rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        help="hashing queue depth (default: one slot per client, no rejections)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = setup_database(os.path.join(tmp, "bench.db"))
+        print(f"{'pool':>4} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'503s':>5}")
+        for pool_size in args.pool_sizes:
+            result = run(
+                app,
+                pool_size,
+                args.clients,
+                args.logins,
+                args.max_pending or args.clients,
+            )
+            print(
+                f"{result['pool_size']:>4} {result['logins_per_second']:>9.1f}"
+                f" {result['p50_ms'] or 0:>8.1f} {result['p95_ms'] or 0:>8.1f}"
+                f" {result['rejected']:>5}"
+            )
+        app.extensions["password_hasher"].shutdown()
+
+
+if __name__ == "__main__":
+    main()
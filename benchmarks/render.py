@@ -0,0 +1,180 @@
+"""Render time of large item trees and template load time at boot.
+
+Renders a ``--nodes`` item tree with the old per-node ``{% include %}``
+recursion and with the flattened pre-order rows of
+:func:`templating.flatten_tree`, then loads every template from source,
+from a warm ``FileSystemBytecodeCache`` and from precompiled modules::
+
+    python -m benchmarks.render --nodes 10000 --fanout 4 --repeat 5
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from jinja2 import (
+    DictLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+)
+
+import tmp as todo
+from templating import flatten_tree, precompile_templates
+
+# templates/item.html and the loop of templates/list.html as they were
+RECURSIVE_TEMPLATES = {
+    "list_items.html": """
+{% for item in items %}
+{% include 'item.html' with context %}
+{% endfor %}
+""",
+    "item.html": """
+<li>
+    <div>
+        <form action="{{ url_for('complete_item', item_id=item.id) }}" method="post" style="display:inline;">
+            <input type="checkbox" name="completed" onchange="this.form.submit()" {% if item.is_completed %}checked{%
+                endif %}>
+        </form>
+        {% if item.children|length > 0 %}
+        <button class="toggler">[-]</button>
+        {% endif %}
+        <span {% if item.is_completed %}class="completed" {% endif %}>
+            {{ item.title }}
+        </span>
+        {% if item.descendant_count %}
+        <small>{{ item.completed_descendant_count }}/{{ item.descendant_count }} done</small>
+        {% endif %}
+        <a href="{{ url_for('edit_item', item_id=item.id) }}">Edit</a>
+        <form action="{{ url_for('delete_item', item_id=item.id) }}" method="post" style="display:inline;">
+            <input type="submit" value="Delete">
+        </form>
+        {% if item.parent_item_id is none %}
+        <a href="{{ url_for('move_item', item_id=item.id) }}">Move</a>
+        {% endif %}
+    </div>
+    {% if item.children %}
+    <ul>
+        {% for child in item.children %}
+        {% set item = child %}
+        {% include 'item.html' %}
+
+        {% endfor %}
+    </ul>
+    {% endif %}
+</li>
+""",
+}
+
+
+def build_tree(nodes, fanout, seed):
+    """``nodes`` in-memory items, each with up to ``fanout`` children."""
+    rng = random.Random(seed)
+    items = []
+    for item_id in range(1, nodes + 1):
+        parent = items[(item_id - 2) // fanout] if item_id > 1 else None
+        item = SimpleNamespace(
+            id=item_id,
+            title=f"Item {item_id}",
+            is_completed=rng.random() < 0.3,
+            parent_item_id=parent and parent.id,
+            descendant_count=0,
+            completed_descendant_count=0,
+            children=[],
+        )
+        if parent is not None:
+            parent.children.append(item)
+        items.append(item)
+    for item in reversed(items):
+        for child in item.children:
+            item.descendant_count += child.descendant_count + 1
+            item.completed_descendant_count += child.completed_descendant_count + int(
+                child.is_completed
+            )
+    return items
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings)
+
+
+def report(name, timings):
+    best, median = timings
+    print(f"  {name:<20} best {1000 * best:8.1f}ms  median {1000 * median:8.1f}ms")
+
+
+def load_all(env, names=None):
+    for name in names or env.list_templates():
+        env.get_template(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    items = build_tree(args.nodes, args.fanout, args.seed)
+    roots = [item for item in items if item.parent_item_id is None]
+    children = {item.id: item.children for item in items}
+    recursive = todo.app.jinja_env.overlay(loader=DictLoader(RECURSIVE_TEMPLATES))
+
+    print(f"Rendering {args.nodes} items, fanout {args.fanout}")
+    with todo.app.test_request_context():
+        before = recursive.get_template("list_items.html")
+        after = todo.app.jinja_env.get_template("item.html")
+        results = {
+            "recursive include": best_of(
+                args.repeat, lambda: before.render(items=roots)
+            ),
+            "flattened rows": best_of(
+                args.repeat,
+                lambda: after.render(rows=flatten_tree(roots, children)),
+            ),
+        }
+    for name, timings in results.items():
+        report(name, timings)
+
+    template_folder = os.path.join(todo.app.root_path, todo.app.template_folder)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "cache")
+        module_dir = os.path.join(tmp, "modules")
+        os.makedirs(cache_dir)
+        count = precompile_templates(todo.app, module_dir)
+
+        def source_env(bytecode_cache=None):
+            return Environment(
+                loader=FileSystemLoader(template_folder),
+                bytecode_cache=bytecode_cache,
+                autoescape=True,
+            )
+
+        load_all(source_env(FileSystemBytecodeCache(cache_dir)))  # warm the cache
+        loads = {
+            "from source": lambda: load_all(source_env()),
+            "bytecode cache": lambda: load_all(
+                source_env(FileSystemBytecodeCache(cache_dir))
+            ),
+            "precompiled": lambda: load_all(
+                Environment(loader=ModuleLoader(module_dir), autoescape=True),
+                todo.app.jinja_env.list_templates(),
+            ),
+        }
+        print(f"Loading {count} templates into a fresh environment")
+        for name, load in loads.items():
+            report(name, best_of(args.repeat, load))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Latency, throughput and SQL statement counts for every route.
+
+Generates a synthetic data set, then drives each route through the Flask
+test client from ``--concurrency`` threads, each logged in as its own user::
+
+    python -m benchmarks.routes --users 20 --roots 30 --depth 3 --fanout 4 \\
+        --requests 500 --concurrency 8 --output results.json
+
+The JSON report has, per route, p50/p95/p99 latency, requests per second and
+SQL statements per request (counted with SQLAlchemy engine events). Pass
+``--baseline`` with an earlier report to exit non-zero when any route's p95
+latency or statement count regressed by more than ``--tolerance``.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+
+_local = threading.local()
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    _local.statements = getattr(_local, "statements", 0) + 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def routes(todo):
+    """(name, request function) for every route. Each function takes a
+    logged-in client, its user's task ids and a random generator."""
+    statuses = todo.TASK_STATUSES
+
+    def login(client, task_ids, rng):
+        username = client.bench_username
+        return client.application.test_client().post(
+            "/login", data={"username": username, "password": datagen.PASSWORD}
+        )
+
+    return [
+        ("POST /login", login),
+        ("GET /", lambda client, ids, rng: client.get("/")),
+        (
+            "GET /columns/<status>",
+            lambda client, ids, rng: client.get(
+                f"/columns/{rng.choice(statuses)}",
+                query_string={"after": rng.choice(ids)},
+            ),
+        ),
+        (
+            "GET /tasks/<id>/subtasks",
+            lambda client, ids, rng: client.get(f"/tasks/{rng.choice(ids)}/subtasks"),
+        ),
+        (
+            "POST /add_task/<status>",
+            lambda client, ids, rng: client.post(
+                f"/add_task/{rng.choice(statuses)}", data={"title": "bench task"}
+            ),
+        ),
+        (
+            "POST /tasks/<id>/add_subtask",
+            lambda client, ids, rng: client.post(
+                f"/tasks/{rng.choice(ids)}/add_subtask", data={"title": "bench subtask"}
+            ),
+        ),
+        # Deletes run last, as they hide parts of the data set
+        (
+            "POST /tasks/<id>/delete",
+            lambda client, ids, rng: client.post(
+                f"/tasks/{ids.pop() if ids else 0}/delete"
+            ),
+        ),
+    ]
+
+
+def run_route(todo, clients, task_ids, request, total):
+    """Send ``total`` requests spread over one thread per client."""
+    latencies, statements, errors = [], [], []
+
+    def loop(client, count, seed):
+        rng = random.Random(seed)
+        ids = list(task_ids[client.bench_username])
+        rng.shuffle(ids)
+        for _ in range(count):
+            _local.statements = 0
+            started = time.perf_counter()
+            response = request(client, ids, rng)
+            latencies.append(time.perf_counter() - started)
+            statements.append(_local.statements)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+    per_client = [total // len(clients)] * len(clients)
+    for index in range(total % len(clients)):
+        per_client[index] += 1
+    threads = [
+        threading.Thread(target=loop, args=(client, count, seed))
+        for seed, (client, count) in enumerate(zip(clients, per_client))
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+        "statements_per_request": round(sum(statements) / total, 2),
+    }
+
+
+def regressions(report, baseline, tolerance):
+    """Describe every route whose p95 latency or statement count regressed."""
+    found = []
+    for route, result in report["routes"].items():
+        previous = baseline["routes"].get(route)
+        if previous is None:
+            continue
+        for metric in ("p95_ms", "statements_per_request"):
+            limit = previous[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                found.append(
+                    f"{route}: {metric} {result[metric]} > {limit:.2f}"
+                    f" (baseline {previous[metric]})"
+                )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--roots", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument(
+        "--status-mix",
+        type=datagen.parse_status_mix,
+        default=datagen.parse_status_mix("To Do=5,In Progress=3,Done=2"),
+    )
+    parser.add_argument("--requests", type=int, default=200, help="per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--output", help="write the JSON report here, not stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.concurrency > args.users:
+        parser.error("--concurrency cannot exceed --users (one user per thread)")
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = args.database_url or (
+        f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    )
+    import app as todo
+    from sqlalchemy import event
+
+    app = todo.create_app()
+    with app.app_context():
+        todo.db.drop_all()
+        todo.db.create_all()
+        started = time.perf_counter()
+        task_ids = datagen.generate(
+            todo.db,
+            todo.User,
+            todo.Task,
+            args.users,
+            args.roots,
+            args.depth,
+            args.fanout,
+            args.status_mix,
+            seed=args.seed,
+            tree=todo.task_tree,
+        )
+        print(
+            f"Generated {sum(map(len, task_ids.values()))} tasks for {args.users}"
+            f" users in {time.perf_counter() - started:.1f}s",
+            file=sys.stderr,
+        )
+        event.listen(todo.db.engine, "before_cursor_execute", count_statement)
+
+    clients = []
+    for username in list(task_ids)[: args.concurrency]:
+        client = app.test_client()
+        client.bench_username = username
+        client.post("/login", data={"username": username, "password": datagen.PASSWORD})
+        clients.append(client)
+
+    report = {"config": {k: v for k, v in vars(args).items() if k != "baseline"}}
+    report["routes"] = {}
+    for name, request in routes(todo):
+        result = run_route(todo, clients, task_ids, request, args.requests)
+        report["routes"][name] = result
+        print(
+            f"{name:<30} {result['requests_per_second']:>8} req/s"
+            f"  p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms"
+            f"  p99 {result['p99_ms']:>8}ms"
+            f"  {result['statements_per_request']:>6} stmts/req",
+            file=sys.stderr,
+        )
+    app.extensions["password_hasher"].shutdown()
+    tmp.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Task search latency over a large generated data set.
+
+Generates ``--users`` users' task trees (about a million tasks with the
+defaults) with titles of random words, then times ``--queries`` searches
+per query length through ``GET /search``, each as a random user::
+
+    python -m benchmarks.search --users 100 --roots 100 --depth 2 --fanout 10
+
+Reports p50/p95 latency and the mean hit count for each query length, and
+the same for the unindexed ``LIKE`` scan the search replaces.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks import datagen
+from benchmarks.routes import percentile
+from search import relevance
+
+WORDS = (
+    "invoice report garden kitchen backup review release budget meeting "
+    "travel dentist laundry groceries server deploy refactor taxes birthday "
+    "library insurance painting plumbing marketing hiring onboarding"
+).split()
+
+
+def random_title(rng, task_id):
+    return " ".join(rng.sample(WORDS, 3)) + f" #{task_id}"
+
+
+def random_query(rng, length):
+    word = rng.choice([word for word in WORDS if len(word) >= length])
+    start = rng.randrange(len(word) - length + 1)
+    return word[start : start + length]
+
+
+def timed(fn, repeat):
+    latencies, hits = [], []
+    for n in range(repeat):
+        started = time.perf_counter()
+        hits.append(fn(n))
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies, statistics.mean(hits)
+
+
+def report(name, latencies, hits):
+    p50, p95 = percentile(latencies, 0.50), percentile(latencies, 0.95)
+    print(
+        f"  {name:<24} p50 {1000 * p50:7.2f}ms  p95 {1000 * p95:7.2f}ms"
+        f"  hits {hits:6.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--roots", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import app as todo
+
+        app = todo.create_app()
+        with app.app_context():
+            todo.db.create_all()
+            started = time.perf_counter()
+            task_ids = datagen.generate(
+                todo.db,
+                todo.User,
+                todo.Task,
+                args.users,
+                args.roots,
+                args.depth,
+                args.fanout,
+                datagen.parse_status_mix("To Do=5,In Progress=3,Done=2"),
+                seed=args.seed,
+                title=random_title,
+                tree=todo.task_tree,
+            )
+            total = sum(len(ids) for ids in task_ids.values())
+            print(f"Generated {total} tasks in {time.perf_counter() - started:.1f}s")
+            user_ids = [user_id for (user_id,) in todo.db.session.query(todo.User.id)]
+
+            rng = random.Random(args.seed)
+
+            def scan(length):
+                def run(n):
+                    query = random_query(rng, length)
+                    return len(
+                        todo.db.session.execute(
+                            todo.db.select(todo.Task.id)
+                            .where(
+                                todo.Task.user_id == rng.choice(user_ids),
+                                todo.Task.title.contains(query, autoescape=True),
+                                todo.Task.deleted_at.is_(None),
+                            )
+                            .order_by(*relevance(todo.Task.title, query), todo.Task.id)
+                            .limit(20)
+                        ).all()
+                    )
+
+                return run
+
+            print("Unindexed LIKE scan (ranked, first 20)")
+            for length in (3, 5, 8):
+                report(f"{length} characters", *timed(scan(length), args.scan_queries))
+
+        clients = {}
+        for username in task_ids:
+            client = clients[username] = app.test_client()
+            client.post(
+                "/login", data={"username": username, "password": datagen.PASSWORD}
+            )
+        usernames = sorted(clients)
+
+        def search(length):
+            def run(n):
+                client = clients[rng.choice(usernames)]
+                response = client.get(
+                    "/search",
+                    query_string={
+                        "q": random_query(rng, length),
+                        "format": "json",
+                        "limit": 20,
+                    },
+                )
+                assert response.status_code == 200, response.status_code
+                return len(response.get_json()["results"])
+
+            return run
+
+        print("GET /search (first page of 20)")
+        for length in (3, 5, 8):
+            report(f"{length} characters", *timed(search(length), args.queries))
+        app.extensions["password_hasher"].shutdown()
+
+
+if __name__ == "__main__":
+    main()
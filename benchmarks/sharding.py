@@ -0,0 +1,176 @@
+"""Write throughput of add_task/add_subtask/delete_task against shard count.
+
+Each shard count runs in a fresh interpreter (``SHARD_DATABASE_URLS`` is read
+by create_app) with ``--processes`` forked workers, like gunicorn, of
+``--threads`` client threads each. Every client is logged in as its own user,
+placed on a shard by the usual hash, and only writes: it adds top-level
+tasks, adds subtasks below them and deletes subtasks again::
+
+    python -m benchmarks.sharding --shard-counts 1,2,4,8 --duration 10
+    python -m benchmarks.sharding --synchronous FULL
+
+With ``--synchronous FULL`` every commit waits for an fsync while holding its
+database's write lock, which is where spreading users over files pays most.
+The workers need a core each to overlap their writes; on fewer cores the run
+is bound by request CPU time whatever the shard count.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.routes import percentile
+
+
+def client_loop(app, username, deadline, results):
+    rng = random.Random(username)
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": "bench"})
+    roots, leaves = [], []
+    while time.monotonic() < deadline:
+        roll = rng.random()
+        if len(roots) < 5 or roll < 0.3:
+            kind, path, data = "add_task", "/add_task/To Do", {"title": "bench"}
+        elif not leaves or roll < 0.7:
+            kind, data = "add_subtask", {"title": "bench subtask"}
+            path = f"/tasks/{rng.choice(roots)}/add_subtask"
+        else:
+            kind, data = "delete_task", {}
+            path = f"/tasks/{leaves.pop(rng.randrange(len(leaves)))}/delete"
+        started = time.perf_counter()
+        response = client.post(path, query_string={"format": "json"}, data=data)
+        elapsed = time.perf_counter() - started
+        ok = response.status_code == 200
+        if ok and kind == "add_task":
+            roots.append(response.json["task"]["id"])
+        elif ok and kind == "add_subtask":
+            leaves.append(response.json["task"]["id"])
+        results.append((kind, ok, elapsed))
+
+
+def worker(app, index, args, queue):
+    # The app disposes its engines in forked children by itself
+    deadline = time.monotonic() + args.duration
+    results = []
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(app, f"bench{index}-{n}", deadline, results),
+        )
+        for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def run_shards(args):
+    """Run one shard count in this interpreter and print its result as JSON."""
+    import app as todo
+
+    app = todo.create_app(
+        {"PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "PASSWORD_HASH_WORKERS": 0}
+    )
+    app.logger.setLevel(logging.CRITICAL)  # failed requests are counted
+    with app.app_context():
+        placement = [0] * todo.shards.count
+        todo.shards.create_all()
+        for index in range(args.processes):
+            for n in range(args.threads):
+                user = todo.User(username=f"bench{index}-{n}")
+                user.set_password("bench")
+                todo.db.session.add(user)
+                todo.db.session.flush()
+                user.shard = todo.shards.shard_for(user.id)
+                placement[user.shard] += 1
+        todo.db.session.commit()
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(app, index, args, queue))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    results = [row for _ in processes for row in queue.get()]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for _, ok, latency in results if ok)
+    summary = {
+        "shards": args.run_shards,
+        "placement": placement,
+        "ok_per_second": len(latencies) / args.duration,
+        "errors": sum(not ok for _, ok, _ in results),
+        "p50_ms": 1000 * (percentile(latencies, 0.50) or 0),
+        "p95_ms": 1000 * (percentile(latencies, 0.95) or 0),
+    }
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shard-counts", default="1,2,4,8")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--synchronous", default="NORMAL", help="SQLite pragma")
+    parser.add_argument("--run-shards", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_shards:
+        return run_shards(args)
+
+    print(
+        f"{args.processes} processes x {args.threads} writers,"
+        f" synchronous={args.synchronous}, {args.duration:g}s per run"
+    )
+    print(
+        f"{'shards':>6} {'writes/s':>9} {'speedup':>8} {'errors':>7}"
+        f" {'p50':>9} {'p95':>9}  users per shard"
+    )
+    baseline = None
+    for count in [int(part) for part in args.shard_counts.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            urls = [
+                f"sqlite:///{os.path.join(tmp, f'shard{shard}.db')}"
+                for shard in range(count)
+            ]
+            options = [
+                f"--{name}={getattr(args, name)}"
+                for name in ("processes", "threads", "duration")
+            ]
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.sharding", f"--run-shards={count}"]
+                + options,
+                env={
+                    **os.environ,
+                    "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'directory.db')}",
+                    "SHARD_DATABASE_URLS": ",".join(urls),
+                    "SQLITE_SYNCHRONOUS": args.synchronous,
+                },
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        baseline = baseline or result["ok_per_second"]
+        print(
+            f"{count:>6} {result['ok_per_second']:>9.1f}"
+            f" {result['ok_per_second'] / baseline:>7.2f}x {result['errors']:>7}"
+            f" {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms"
+            f"  {result['placement']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache bounded by the memory of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= sys.getsizeof(old)
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= sys.getsizeof(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RenderCache:
+    """Cache of rendered HTML fragments.
+
+    Lookups go to the local LRU first and then to the optional shared
+    ``backend``, any object with ``get(key)`` and ``set(key, value)`` methods
+    (for example a thin wrapper around a Redis client). Keys embed a data
+    version, so entries are never invalidated explicitly: stale ones simply
+    stop being read and age out of the LRU.
+    """
+
+    def __init__(self, max_bytes, backend=None):
+        self.local = LRUCache(max_bytes)
+        self.backend = backend
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value)
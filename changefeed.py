@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict, deque
+
+RESET = {"type": "reset"}
+
+
+class _Channel:
+    def __init__(self, history):
+        self.condition = threading.Condition()
+        self.sequence = 0  # counts deliveries in this process
+        self.history = deque(maxlen=history)  # (sequence, version, event)
+        self.subscribers = 0
+
+
+class ChangeFeed:
+    """Per-user feeds of small change events, for Server-Sent Events.
+
+    Every event carries the user's data version it was committed with, which
+    is also its event id. Each user has a channel holding the last
+    ``history`` events. A subscriber remembers only how far it has read and
+    sleeps on its channel's condition, so idle subscribers cost a parked
+    thread (or greenlet) and no polling; a publish wakes just the
+    subscribers of that user. A client reconnecting with the version it saw
+    last gets the events it missed, or a ``reset`` event if any of them is
+    not in this process's history. Since the versions come from the
+    database, that works on whichever worker the reconnect lands on. Events
+    may arrive out of version order and repeat after a reconnect, so
+    applying one must not depend on having applied the previous ones.
+
+    Without a ``backend`` events only reach subscribers in this process. A
+    backend is any object with ``publish(user_id, version, event)`` and
+    ``subscribe(callback)`` methods (for example a thin wrapper around Redis
+    pub/sub) that calls ``callback(user_id, version, event)`` in every
+    process, including the publishing one.
+    """
+
+    def __init__(self, history=100, max_channels=10000, backend=None):
+        self.history = history
+        self.max_channels = max_channels
+        self.backend = backend
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+        if backend is not None:
+            backend.subscribe(self._deliver)
+
+    def _channel(self, user_id, subscribers=0):
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel is None:
+                channel = self._channels[user_id] = _Channel(self.history)
+                if len(self._channels) > self.max_channels:
+                    # Forget the least recently used channel nobody listens to
+                    for key, other in self._channels.items():
+                        if not other.subscribers:
+                            del self._channels[key]
+                            break
+            self._channels.move_to_end(user_id)
+            channel.subscribers += subscribers
+            return channel
+
+    def publish(self, user_id, version, event):
+        """Send ``event``, committed at the user's data ``version``."""
+        if self.backend is not None:
+            self.backend.publish(user_id, version, event)
+        else:
+            self._deliver(user_id, version, event)
+
+    def _deliver(self, user_id, version, event):
+        channel = self._channel(user_id)
+        with channel.condition:
+            channel.sequence += 1
+            channel.history.append((channel.sequence, version, event))
+            channel.condition.notify_all()
+
+    def _missed(self, channel, seen, current):
+        """The held events after version ``seen``, or ``None`` if any of the
+        versions up to ``current`` is not held."""
+        if current - seen > len(channel.history):
+            return None
+        events = [item for item in channel.history if item[1] > seen]
+        if {version for _, version, _ in events} >= set(range(seen + 1, current + 1)):
+            return events
+        return None
+
+    def listen(self, user_id, seen=None, current=0, heartbeat=15.0):
+        """Yield ``(version, event)`` pairs for the user as they are published.
+
+        ``seen`` is the last version the client has applied, if it has one,
+        and ``current`` the user's data version now. ``None`` is yielded
+        after ``heartbeat`` idle seconds, so the caller can write a keepalive
+        and notice closed connections.
+        """
+        channel = self._channel(user_id, subscribers=1)
+        with channel.condition:
+            sequence = channel.sequence
+            missed = [] if seen is None else self._missed(channel, seen, current)
+        try:
+            if missed is None:
+                yield current, RESET
+            else:
+                for _, version, event in missed:
+                    yield version, event
+            while True:
+                with channel.condition:
+                    channel.condition.wait_for(
+                        lambda: channel.sequence > sequence, heartbeat
+                    )
+                    events = [item for item in channel.history if item[0] > sequence]
+                    overrun = events and events[0][0] > sequence + 1
+                    sequence = channel.sequence
+                if not events:
+                    yield None
+                elif overrun:
+                    # Too slow a reader; let it start over
+                    yield events[-1][1], RESET
+                else:
+                    for _, version, event in events:
+                        yield version, event
+        finally:
+            self._channel(user_id, subscribers=-1)
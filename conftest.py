@@ -0,0 +1,91 @@
+"""Fixtures shared by the tests in tests/.
+
+At the root of the repository, this file also puts it on ``sys.path``, so
+that a plain ``pytest`` imports the app's modules as ``python -m pytest`` does.
+"""
+import pytest
+from sqlalchemy import event
+
+import app as todo
+import tmp as lists
+
+
+@pytest.fixture(scope="session")
+def make_app(tmp_path_factory):
+    """Build an app, warmed up on a new database, with ``config`` on top.
+
+    Passwords are hashed in-process at a low cost, to keep the tests fast.
+    """
+
+    def make_app(**config):
+        path = tmp_path_factory.mktemp("todo") / "todo.db"
+        return todo.create_app(
+            {
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+                "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+                "PASSWORD_HASH_WORKERS": 0,
+                "TASK_PURGE_PAUSE": 0,
+                "WARM_UP": True,
+                **config,
+            }
+        )
+
+    return make_app
+
+
+def _enforce_foreign_keys(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+
+@pytest.fixture(scope="session")
+def list_app(tmp_path_factory):
+    """tmp.py's app, on a new database enforcing foreign keys.
+
+    tmp.py builds its app at import, so it is pointed at a database of its
+    own for the tests, then back at its configured one.
+    """
+    path = tmp_path_factory.mktemp("lists") / "lists.db"
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(
+            lists.app.config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}"
+        )
+        with lists.app.app_context():
+            engine = lists.db.engine
+            event.listen(engine, "connect", _enforce_foreign_keys)
+            lists.db.create_all()
+        yield lists.app
+    event.remove(engine, "connect", _enforce_foreign_keys)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def login():
+    """Register ``username`` on ``app``; returns a test client logged in as it."""
+
+    def login(app, username, password="secret"):
+        client = app.test_client()
+        client.post("/register", data={"username": username, "password": password})
+        client.post("/login", data={"username": username, "password": password})
+        return client
+
+    return login
+
+
+@pytest.fixture(scope="session")
+def add_task():
+    """Add a task through the routes; returns the task's JSON."""
+
+    def add_task(client, title, parent_id=None, status="To Do"):
+        if parent_id is None:
+            url = f"/add_task/{status}"
+        else:
+            url = f"/tasks/{parent_id}/add_subtask"
+        response = client.post(
+            url,
+            query_string={"format": "json"},
+            data={"title": title, "status": status},
+        )
+        assert response.status_code == 200, response.json
+        return response.json["task"]
+
+    return add_task
@@ -0,0 +1,20 @@
+"""Per-connection setup of the app's database engines.
+
+SQLite settings such as the journal mode and the busy timeout are per
+connection, so they are applied as each pooled connection is opened, on the
+synchronous engines and on the asyncio one alike.
+"""
+from sqlalchemy import event
+
+
+def configure_sqlite_connections(engine, pragmas):
+    """Give every new connection of ``engine`` the ``pragmas``, if it is SQLite."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
@@ -0,0 +1,142 @@
+"""Group commit: the writes of concurrent requests committed together.
+
+On SQLite every commit takes the database's write lock and ends with a sync,
+so a burst of one-row writes from concurrent requests (checkbox toggles,
+quick task additions) goes through the lock one commit at a time. With
+``GROUP_COMMIT`` set, mutating routes hand their writes to a writer thread
+per database instead. The writer collects what arrives within
+``GROUP_COMMIT_WINDOW`` seconds of the first write, up to
+``GROUP_COMMIT_MAX_BATCH`` writes, runs each in a savepoint of a single
+transaction and commits them at once. A request gets its write's result (or
+its exception) only after that commit, so the response still reports a
+durable outcome; a write that fails is rolled back to its savepoint without
+taking the rest of the batch with it.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitter:
+    """Run writes and commit them, batched per database when enabled.
+
+    ``router`` maps a key to its database with ``engine(key)`` and binds a
+    session to it with ``use(session, key)``, as :class:`sharding.ShardRouter`
+    does; without one every key means the app's main database. Batch sizes and
+    queue waits go to ``instrumentation``, if given.
+    """
+
+    def __init__(self, db, app=None, router=None, instrumentation=None):
+        self.db = db
+        self.router = router
+        self.instrumentation = instrumentation
+        self.enabled = False
+        self.app = None
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = bool(app.config.get("GROUP_COMMIT"))
+
+    def run(self, key, write, *args):
+        """Run ``write(*args)`` on the database of ``key`` and commit it.
+
+        Returns the result of ``write`` once it is committed, or raises its
+        exception. When enabled, ``write`` runs on the writer thread's session,
+        outside the request: it must take and return plain values (ids, not
+        the request's ORM objects). Otherwise it runs and commits on the
+        request's session.
+        """
+        if not self.enabled:
+            result = write(*args)
+            self.db.session.commit()
+            return result
+        future = Future()
+        self._queue(key).put((write, args, future, time.perf_counter()))
+        if self.instrumentation is None:
+            return future.result()
+        with self.instrumentation.timer("group-commit"):
+            return future.result()
+
+    def _queue(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Writer threads do not survive a fork; start new ones
+                self._queues, self._pid = {}, os.getpid()
+            writes = self._queues.get(key)
+            if writes is None:
+                writes = self._queues[key] = queue.Queue()
+                threading.Thread(
+                    target=self._writer,
+                    args=(key, writes),
+                    name=f"group-commit-{self._database(key)}",
+                    daemon=True,
+                ).start()
+            return writes
+
+    @staticmethod
+    def _database(key):
+        return "main" if key is None else f"shard{key}"
+
+    def _engine(self, key):
+        if self.router is not None:
+            return self.router.engine(key)
+        return self.db.get_engine(self.app)
+
+    def _writer(self, key, writes):
+        window = self.app.config["GROUP_COMMIT_WINDOW"]
+        max_batch = self.app.config["GROUP_COMMIT_MAX_BATCH"]
+        with self.app.app_context():
+            if self.router is not None:
+                self.router.use(self.db.session, key)
+            while True:
+                batch = [writes.get()]
+                deadline = batch[0][3] + window
+                while len(batch) < max_batch:
+                    # Once the window is over, still take whatever is queued
+                    timeout = max(0.0, deadline - time.perf_counter())
+                    try:
+                        batch.append(writes.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                self._commit(key, batch)
+
+    def _commit(self, key, batch):
+        session = self.db.session
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            engine = self._engine(key)
+            connection = session.connection(bind_arguments={"bind": engine})
+            if engine.dialect.name == "sqlite":
+                # pysqlite begins transactions at the first write only, and
+                # releasing a savepoint outside of one commits it. Open the
+                # batch's transaction, with the write lock, up front.
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            for write, args, future, _ in batch:
+                try:
+                    with session.begin_nested():
+                        outcomes.append((future, write(*args), None))
+                except Exception as exc:
+                    outcomes.append((future, None, exc))
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            outcomes = [(future, None, exc) for _, _, future, _ in batch]
+        finally:
+            session.close()  # no stale objects in the next batch
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+        if self.instrumentation is not None:
+            self.instrumentation.observe_group_commit(
+                self._database(key), [started - queued for *_, queued in batch]
+            )
@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised instead of queueing when too many hashes are already pending,
+    or when a hash waited ``timeout`` seconds for the pool."""
+
+
+def _normalize_method(method):
+    # werkzeug records the iteration count it used, so compare against that
+    if method.startswith("pbkdf2:") and method.count(":") == 1:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+class PasswordHasher:
+    """Hash and verify passwords on a bounded process pool.
+
+    Hashing is deliberately slow, so it is kept off the request threads: at
+    most ``workers`` hashes run at a time in worker processes and at most
+    ``max_pending`` may be queued or running. Beyond that, calls fail fast
+    with :class:`PasswordHasherBusy` rather than stalling the caller; so do
+    calls whose hash is not done within ``timeout`` seconds. With
+    ``workers=0`` hashing runs inline on the calling thread.
+
+    The pool is created lazily, and again in a forked child, so a hasher
+    built at import time is safe to use from prefork servers.
+    """
+
+    def __init__(
+        self,
+        method="pbkdf2:sha256",
+        salt_length=16,
+        workers=0,
+        max_pending=None,
+        timeout=30,
+    ):
+        self.method = _normalize_method(method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.max_pending = max_pending or 4 * max(workers, 1)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # A hash the caller stopped waiting for still holds its slot until the
+        # pool is done with it
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()  # unless a worker has started on it
+            raise PasswordHasherBusy() from None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def hash(self, password):
+        return self._run(
+            generate_password_hash, password, self.method, self.salt_length
+        )
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash was made with other parameters than ours."""
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.method or len(salt) != self.salt_length
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,306 @@
+"""Closure tables for self-referencing tree models.
+
+Next to the model's ``parent`` adjacency column, a closure table holds one
+``(ancestor_id, descendant_id, depth)`` row for every node and each of its
+ancestors, the node itself included at depth 0. A subtree or an ancestor
+path is then a single indexed lookup instead of a recursive query walking
+one level at a time, and a move rewrites the subtree's rows with two
+set-based statements, however many subtrees it detaches. Nodes inserted
+through the ORM get their rows from a mapper event; bulk inserts, moves and
+deletes go through the helpers below, inside the caller's transaction. The
+rows reference their nodes, so they are removed before the nodes are deleted.
+"""
+from functools import lru_cache
+
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    Table,
+    bindparam,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.orm import aliased
+
+
+class CycleError(ValueError):
+    pass
+
+
+class ClosureTable:
+    """The ``{table}_closure`` table of ``model``, linked by ``parent_attr``."""
+
+    def __init__(self, model, parent_attr):
+        self.model = model
+        self.parent_attr = parent_attr
+        name = f"{model.__tablename__}_closure"
+        target = f"{model.__tablename__}.id"
+        self.table = Table(
+            name,
+            model.metadata,
+            Column("ancestor_id", Integer, ForeignKey(target), primary_key=True),
+            Column("descendant_id", Integer, ForeignKey(target), primary_key=True),
+            Column("depth", Integer, nullable=False),
+            # The primary key serves subtrees; this serves ancestor paths
+            Index(f"ix_{name}_descendant_id_depth", "descendant_id", "depth"),
+        )
+        event.listen(model, "after_insert", self._after_insert)
+
+    def _after_insert(self, mapper, connection, node):
+        # The unit of work inserts parents first, so their rows are there
+        table, node_id = self.table, node.id
+        connection.execute(
+            insert(table).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(table.c.ancestor_id, literal(node_id), table.c.depth + 1)
+                .where(table.c.descendant_id == getattr(node, self.parent_attr))
+                .union_all(select(literal(node_id), literal(node_id), literal(0))),
+            )
+        )
+
+    def descendant_ids(self, node_ids):
+        """Select of the ids in the subtrees of ``node_ids`` (a list or select)."""
+        return select(self.table.c.descendant_id).where(
+            self.table.c.ancestor_id.in_(node_ids)
+        )
+
+    def ancestor_ids(self, node_id):
+        """Select of the ids of ``node_id`` and its ancestors."""
+        return select(self.table.c.ancestor_id).where(
+            self.table.c.descendant_id == node_id
+        )
+
+    def has_ancestor(self, node_id, condition):
+        """Whether ``node_id`` or one of its ancestors matches ``condition``,
+        a function of a model alias returning a SQL expression."""
+        ancestor = aliased(self.model)
+        return (
+            exists()
+            .where(
+                self.table.c.descendant_id == node_id,
+                ancestor.id == self.table.c.ancestor_id,
+            )
+            .where(condition(ancestor))
+        )
+
+    def insert_nodes(self, session, condition):
+        """Add the rows of nodes bulk inserted without the ORM that match
+        ``condition``.
+
+        The nodes' parents must be recorded already or be among the new nodes,
+        so bulk inserts of whole trees need a single call.
+        """
+        model, parent = self.model, getattr(self.model, self.parent_attr)
+        up = (
+            select(
+                model.id.label("descendant_id"),
+                model.id.label("ancestor_id"),
+                parent.label("parent_id"),
+                literal(0).label("depth"),
+            )
+            .where(condition)
+            .cte("up", recursive=True)
+        )
+        step = aliased(model)
+        up = up.union_all(
+            select(
+                up.c.descendant_id,
+                step.id,
+                getattr(step, self.parent_attr),
+                up.c.depth + 1,
+            ).where(step.id == up.c.parent_id)
+        )
+        session.execute(
+            insert(self.table).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(up.c.ancestor_id, up.c.descendant_id, up.c.depth),
+            )
+        )
+
+    def remove(self, session, node_ids):
+        """Drop the rows of the subtrees of ``node_ids``, before deleting them."""
+        session.execute(
+            delete(self.table)
+            .where(
+                self.table.c.descendant_id.in_(
+                    select(self.descendant_ids(node_ids).subquery().c.descendant_id)
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def delete_subtrees(self, session, node_ids, chunk_size=500):
+        """Delete the subtrees of ``node_ids``, their rows here first.
+
+        The rows reference the nodes, so they go before them, and the nodes
+        go deepest first, so that no statement deletes the parent of a node
+        that is left. Returns the number of nodes deleted.
+        """
+        table, model = self.table, self.model
+        subtree = session.scalars(
+            select(table.c.descendant_id)
+            .where(table.c.ancestor_id.in_(node_ids))
+            .group_by(table.c.descendant_id)
+            .order_by(func.max(table.c.depth).desc())
+        ).all()
+        self.remove(session, node_ids)
+        for start in range(0, len(subtree), chunk_size):
+            session.execute(
+                delete(model)
+                .where(model.id.in_(subtree[start : start + chunk_size]))
+                .execution_options(synchronize_session=False)
+            )
+        return len(subtree)
+
+    def move(self, session, node_id, parent_id):
+        """Move the subtree of ``node_id`` below ``parent_id`` (``None``: a root).
+
+        Raises :class:`CycleError` if ``parent_id`` lies within the subtree.
+        """
+        table = self.table
+        if parent_id is not None and session.scalar(
+            select(
+                exists().where(
+                    table.c.ancestor_id == node_id, table.c.descendant_id == parent_id
+                )
+            )
+        ):
+            raise CycleError("A node cannot be moved below itself.")
+        subtree = select(table.c.descendant_id).where(table.c.ancestor_id == node_id)
+        outside = select(table.c.ancestor_id).where(
+            table.c.descendant_id == node_id, table.c.depth > 0
+        )
+        session.execute(
+            delete(table)
+            .where(
+                table.c.descendant_id.in_(select(subtree.subquery().c.descendant_id)),
+                table.c.ancestor_id.in_(select(outside.subquery().c.ancestor_id)),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if parent_id is not None:
+            above, below = table.alias("above"), table.alias("below")
+            session.execute(
+                insert(table).from_select(
+                    ["ancestor_id", "descendant_id", "depth"],
+                    select(
+                        above.c.ancestor_id,
+                        below.c.descendant_id,
+                        above.c.depth + below.c.depth + 1,
+                    )
+                    # Every new ancestor with every node of the subtree
+                    .select_from(above.join(below, below.c.ancestor_id == node_id))
+                    .where(above.c.descendant_id == parent_id),
+                )
+            )
+        session.execute(
+            update(self.model)
+            .where(self.model.id == node_id)
+            .values({self.parent_attr: parent_id})
+        )
+
+    def _cut(self, node_ids):
+        # Whether a row links a node of the subtrees of node_ids to an ancestor
+        # above the nearest of node_ids on its path
+        table = self.table
+        above, below = table.alias("above"), table.alias("below")
+        return exists().where(
+            below.c.ancestor_id.in_(node_ids),
+            below.c.descendant_id == table.c.descendant_id,
+            above.c.descendant_id == below.c.ancestor_id,
+            above.c.ancestor_id == table.c.ancestor_id,
+            above.c.depth > 0,
+        )
+
+    def cut_rows(self, node_ids):
+        """Select of the ``(ancestor_id, descendant_id)`` rows that
+        :meth:`detach` removes: one for every node that leaves the subtree of
+        an ancestor."""
+        table = self.table
+        return select(table.c.ancestor_id, table.c.descendant_id).where(
+            self._cut(node_ids)
+        )
+
+    def detach(self, session, node_ids):
+        """Make roots of ``node_ids``, each keeping its subtree, in two
+        statements. Nodes of the list below others of it are detached too."""
+        session.execute(
+            delete(self.table)
+            .where(self._cut(node_ids))
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            update(self.model)
+            .where(self.model.id.in_(node_ids))
+            .values({self.parent_attr: None})
+            .execution_options(synchronize_session=False)
+        )
+
+    def height(self, node_id, detaching=None):
+        """Scalar select of how many levels of descendants lie below
+        ``node_id`` (a value or a column, e.g. the model's id); with
+        ``detaching``, once :meth:`detach` has made roots of those."""
+        table = self.table
+        condition = table.c.ancestor_id == node_id
+        if detaching is not None:
+            condition &= ~self._cut(detaching)
+        return (
+            select(func.coalesce(func.max(table.c.depth), 0))
+            .where(condition)
+            .scalar_subquery()
+        )
+
+    def paths(self, session, node_ids, is_live=None):
+        """The ancestors of each node, root first, with a single query.
+
+        Returns ``{node_id: [ancestor, ...]}`` of ``(id, title)`` pairs. Nodes
+        that are hidden themselves or sit below a hidden ancestor, by
+        ``is_live``, are left out.
+        """
+        if not node_ids:
+            return {}
+        rows = session.execute(
+            self._paths_statement(is_live), {"node_ids": list(node_ids)}
+        )
+        paths, hidden = {}, set()
+        for node_id, ancestor_id, title, live in rows:
+            if not live:
+                hidden.add(node_id)
+            path = paths.setdefault(node_id, [])
+            if ancestor_id != node_id:
+                path.append((ancestor_id, title))
+        return {
+            node_id: path for node_id, path in paths.items() if node_id not in hidden
+        }
+
+    @lru_cache(maxsize=None)
+    def _paths_statement(self, is_live):
+        # Built once: constructing the statement costs more than running it
+        table, ancestor = self.table, aliased(self.model)
+        return (
+            select(
+                table.c.descendant_id,
+                ancestor.id,
+                ancestor.title,
+                is_live(ancestor) if is_live is not None else literal(True),
+            )
+            .join(ancestor, ancestor.id == table.c.ancestor_id)
+            .where(table.c.descendant_id.in_(bindparam("node_ids", expanding=True)))
+            .order_by(table.c.descendant_id, table.c.depth.desc())
+        )
+
+    def rebuild(self, session):
+        """Refill the table from the adjacency column; returns the rows written."""
+        session.execute(delete(self.table))
+        self.insert_nodes(session, true())
+        session.commit()
+        return session.scalar(select(func.count()).select_from(self.table))
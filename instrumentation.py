@@ -0,0 +1,251 @@
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import (
+    before_render_template,
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_invalid_token_chars = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class Histogram:
+    """A labelled Prometheus histogram with fixed buckets."""
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{label}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{label}}} {values[-1]}")
+        return "\n".join(lines)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.templates = {}  # template name -> seconds
+        self.timers = {}  # timer name -> seconds
+        self._render_starts = []
+
+
+class Instrumentation:
+    """Per-request timings of SQL, template rendering and named code blocks.
+
+    Each response gets a ``Server-Timing`` header, and the timings feed
+    per-endpoint histograms that :meth:`exposition` renders in the Prometheus
+    text format. Nothing is hooked up unless an app has ``METRICS_ENABLED``
+    set, so a disabled instance costs nothing beyond a check in :meth:`timer`.
+    One instance serves every app of the process that enables it, and the
+    histograms are the process's.
+    """
+
+    def __init__(self, app=None):
+        self._listening = False
+        self._lock = threading.Lock()
+        self.request_seconds = Histogram(
+            "todo_request_duration_seconds",
+            "Time spent handling a request.",
+            "endpoint",
+            DURATION_BUCKETS,
+        )
+        self.sql_seconds = Histogram(
+            "todo_request_sql_seconds",
+            "Time spent executing SQL per request.",
+            "endpoint",
+            DURATION_BUCKETS,
+        )
+        self.sql_statements = Histogram(
+            "todo_request_sql_statements",
+            "SQL statements executed per request.",
+            "endpoint",
+            COUNT_BUCKETS,
+        )
+        self.template_seconds = Histogram(
+            "todo_template_render_seconds",
+            "Time spent rendering a template.",
+            "template",
+            DURATION_BUCKETS,
+        )
+        self.timer_seconds = Histogram(
+            "todo_timer_seconds",
+            "Time spent in instrumented blocks such as password hashing.",
+            "timer",
+            DURATION_BUCKETS,
+        )
+        self.group_commit_batch_size = Histogram(
+            "todo_group_commit_batch_size",
+            "Writes committed together by a group commit writer.",
+            "database",
+            COUNT_BUCKETS,
+        )
+        self.group_commit_queue_seconds = Histogram(
+            "todo_group_commit_queue_seconds",
+            "Time a write waited in the queue before its batch started.",
+            "database",
+            DURATION_BUCKETS,
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get("METRICS_ENABLED"):
+            return
+        app.extensions["instrumentation"] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+        with self._lock:
+            if not self._listening:
+                # Statements only count towards the timings of a request of
+                # an enabled app, so the listeners can be shared
+                event.listen(Engine, "before_cursor_execute", self._before_execute)
+                event.listen(Engine, "after_cursor_execute", self._after_execute)
+                event.listen(Engine, "handle_error", self._on_execute_error)
+                self._listening = True
+
+    @property
+    def enabled(self):
+        """Whether the current app records metrics."""
+        return (
+            has_app_context()
+            and current_app.extensions.get("instrumentation") is self
+        )
+
+    @staticmethod
+    def _current():
+        if has_request_context():
+            return g.get("_request_timings")
+        return None
+
+    def _before_request(self):
+        g._request_timings = RequestTimings()
+
+    def _after_request(self, response):
+        timings = self._current()
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        endpoint = request.endpoint or "<unmatched>"
+        self.request_seconds.observe(endpoint, total)
+        self.sql_seconds.observe(endpoint, timings.sql_seconds)
+        self.sql_statements.observe(endpoint, timings.sql_statements)
+
+        entries = [
+            f"sql;dur={1000 * timings.sql_seconds:.2f};"
+            f'desc="{timings.sql_statements} statements"'
+        ]
+        for name, seconds in timings.templates.items():
+            token = _invalid_token_chars.sub("_", name)
+            entries.append(f"tpl-{token};dur={1000 * seconds:.2f}")
+        for name, seconds in timings.timers.items():
+            entries.append(f"{name};dur={1000 * seconds:.2f}")
+        entries.append(f"total;dur={1000 * total:.2f}")
+        response.headers.add("Server-Timing", ", ".join(entries))
+        return response
+
+    def _before_render(self, sender, template, context, **extra):
+        timings = self._current()
+        if timings is not None:
+            timings._render_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        timings = self._current()
+        if timings is None or not timings._render_starts:
+            return
+        seconds = time.perf_counter() - timings._render_starts.pop()
+        name = template.name or "<string>"
+        timings.templates[name] = timings.templates.get(name, 0.0) + seconds
+        self.template_seconds.observe(name, seconds)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("_query_starts", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, many):
+        seconds = time.perf_counter() - conn.info["_query_starts"].pop()
+        timings = self._current()
+        if timings is not None:
+            timings.sql_statements += 1
+            timings.sql_seconds += seconds
+
+    def _on_execute_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("_query_starts"):
+            connection.info["_query_starts"].pop()
+
+    def timer(self, name):
+        """Context manager timing a block under ``name`` (a Server-Timing token)."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.timer_seconds.observe(name, seconds)
+            timings = self._current()
+            if timings is not None:
+                timings.timers[name] = timings.timers.get(name, 0.0) + seconds
+
+    def observe_group_commit(self, database, waits):
+        """Record a committed batch, given the queue wait of each of its writes."""
+        if not self.enabled:
+            return
+        self.group_commit_batch_size.observe(database, len(waits))
+        for seconds in waits:
+            self.group_commit_queue_seconds.observe(database, seconds)
+
+    def exposition(self):
+        histograms = (
+            self.request_seconds,
+            self.sql_seconds,
+            self.sql_statements,
+            self.template_seconds,
+            self.timer_seconds,
+            self.group_commit_batch_size,
+            self.group_commit_queue_seconds,
+        )
+        return "\n".join(h.exposition() for h in histograms) + "\n"
@@ -0,0 +1,27 @@
+"""index subtask pages
+
+Revision ID: 1b6d4f08a9e3
+Revises: e7a90b3c6f12
+Create Date: 2026-10-17 15:20:38.671054
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1b6d4f08a9e3'
+down_revision = 'e7a90b3c6f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_parent_task_id')
+        batch_op.create_index('ix_task_parent_task_id_user_id', ['parent_task_id', 'user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_parent_task_id_user_id')
+        batch_op.create_index('ix_task_parent_task_id', ['parent_task_id'], unique=False)
@@ -0,0 +1,47 @@
+"""add task closure table
+
+Revision ID: 4c7e2a9f1d63
+Revises: 9d2f6b41c8e7
+Create Date: 2026-10-17 20:12:37.402915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7e2a9f1d63'
+down_revision = '9d2f6b41c8e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('task_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['task.id'], ),
+    sa.ForeignKeyConstraint(['descendant_id'], ['task.id'], ),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    with op.batch_alter_table('task_closure', schema=None) as batch_op:
+        batch_op.create_index('ix_task_closure_descendant_id_depth', ['descendant_id', 'depth'], unique=False)
+
+    # Every task paired with itself and each of its ancestors
+    op.execute(
+        "INSERT INTO task_closure (ancestor_id, descendant_id, depth) "
+        "WITH RECURSIVE up (descendant_id, ancestor_id, parent_id, depth) AS ("
+        " SELECT id, id, parent_task_id, 0 FROM task"
+        " UNION ALL"
+        " SELECT up.descendant_id, task.id, task.parent_task_id, up.depth + 1"
+        " FROM up JOIN task ON task.id = up.parent_id"
+        ") SELECT ancestor_id, descendant_id, depth FROM up"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('task_closure', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_closure_descendant_id_depth')
+
+    op.drop_table('task_closure')
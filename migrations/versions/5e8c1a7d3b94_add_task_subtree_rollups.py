@@ -0,0 +1,50 @@
+"""add task subtree rollups
+
+Revision ID: 5e8c1a7d3b94
+Revises: 1b6d4f08a9e3
+Create Date: 2026-10-17 17:02:11.904385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c1a7d3b94'
+down_revision = '1b6d4f08a9e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('descendant_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('completed_descendant_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('max_depth', sa.Integer(), server_default='0', nullable=False))
+
+    # Every live task paired with itself and each live ancestor up to the
+    # first deleted one (which hides it); summed per ancestor, as
+    # `flask repair-rollups` does
+    op.execute(
+        "WITH RECURSIVE up (descendant_id, ancestor_id, parent_id, depth, done) AS ("
+        " SELECT id, id, parent_task_id, 0,"
+        " CASE WHEN status = 'Done' THEN 1 ELSE 0 END"
+        " FROM task WHERE deleted_at IS NULL"
+        " UNION ALL"
+        " SELECT up.descendant_id, task.id, task.parent_task_id, up.depth + 1, up.done"
+        " FROM up JOIN task ON task.id = up.parent_id"
+        " WHERE task.deleted_at IS NULL"
+        "), totals (id, descendants, completed, height) AS ("
+        " SELECT ancestor_id, COUNT(*), SUM(done), MAX(depth) FROM up"
+        " WHERE depth > 0 GROUP BY ancestor_id"
+        ") UPDATE task SET descendant_count = totals.descendants,"
+        " completed_descendant_count = totals.completed, max_depth = totals.height"
+        " FROM totals WHERE totals.id = task.id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_column('max_depth')
+        batch_op.drop_column('completed_descendant_count')
+        batch_op.drop_column('descendant_count')
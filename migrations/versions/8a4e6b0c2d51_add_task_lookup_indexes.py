@@ -0,0 +1,35 @@
+"""add task lookup indexes
+
+Revision ID: 8a4e6b0c2d51
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-17 09:31:02.557418
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b0c2d51'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.create_index('ix_task_parent_task_id', ['parent_task_id'], unique=False)
+        batch_op.create_index('ix_task_user_id_id', ['user_id', 'id'], unique=False)
+        batch_op.create_index('ix_task_user_id_parent_task_id_status', ['user_id', 'parent_task_id', 'status'], unique=False)
+
+    with op.batch_alter_table('task_group', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_task_group_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task_group', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_task_group_user_id'))
+
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_user_id_parent_task_id_status')
+        batch_op.drop_index('ix_task_user_id_id')
+        batch_op.drop_index('ix_task_parent_task_id')
@@ -0,0 +1,61 @@
+"""add task search index
+
+Revision ID: 9d2f6b41c8e7
+Revises: 5e8c1a7d3b94
+Create Date: 2026-10-17 19:05:42.118730
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2f6b41c8e7'
+down_revision = '5e8c1a7d3b94'
+branch_labels = None
+depends_on = None
+
+# Contentless FTS5 trigram index of task titles, each row tagged with an
+# owner token ("u<user id>u"); see search.SearchIndex
+INDEXED = "{row}.id, 'u' || ({row}.user_id) || 'u', {row}.title"
+DELETE = (
+    "INSERT INTO task_search(task_search, rowid, owner, title)"
+    " VALUES ('delete', " + INDEXED.format(row='old') + ");"
+)
+INSERT = (
+    "INSERT INTO task_search(rowid, owner, title)"
+    " VALUES (" + INDEXED.format(row='new') + ");"
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5("
+        "owner, title, content='', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS task_search_insert AFTER INSERT ON task"
+        f" BEGIN {INSERT} END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS task_search_delete AFTER DELETE ON task"
+        f" BEGIN {DELETE} END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS task_search_update AFTER UPDATE OF title"
+        f" ON task BEGIN {DELETE} {INSERT} END"
+    )
+    op.execute(
+        "INSERT INTO task_search(rowid, owner, title)"
+        " SELECT " + INDEXED.format(row='task') + " FROM task"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS task_search_update")
+    op.execute("DROP TRIGGER IF EXISTS task_search_delete")
+    op.execute("DROP TRIGGER IF EXISTS task_search_insert")
+    op.execute("DROP TABLE IF EXISTS task_search")
@@ -0,0 +1,46 @@
+"""move data versions next to the tasks
+
+Revision ID: abbc5e38019d
+Revises: 4c7e2a9f1d63
+Create Date: 2026-10-17 21:05:18.530442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'abbc5e38019d'
+down_revision = '4c7e2a9f1d63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('moved', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Carry the versions over: starting again at 0 would reuse old ETags
+    op.execute(
+        "INSERT INTO data_version (user_id, version, moved) "
+        "SELECT id, data_version, false FROM \"user\" WHERE data_version > 0"
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shard', sa.Integer(), nullable=True))
+        batch_op.drop_column('data_version')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.INTEGER(), server_default=sa.text("'0'"), nullable=False))
+        batch_op.drop_column('shard')
+
+    op.execute(
+        "UPDATE \"user\" SET data_version = (SELECT version FROM data_version"
+        " WHERE data_version.user_id = \"user\".id AND NOT moved)"
+        " WHERE id IN (SELECT user_id FROM data_version WHERE NOT moved)"
+    )
+    op.drop_table('data_version')
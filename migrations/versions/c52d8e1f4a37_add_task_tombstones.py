@@ -0,0 +1,28 @@
+"""add task tombstones
+
+Revision ID: c52d8e1f4a37
+Revises: 8a4e6b0c2d51
+Create Date: 2026-10-17 11:04:19.830562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d8e1f4a37'
+down_revision = '8a4e6b0c2d51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_task_deleted_at', ['deleted_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_deleted_at')
+        batch_op.drop_column('deleted_at')
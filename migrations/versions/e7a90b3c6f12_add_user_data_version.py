@@ -0,0 +1,26 @@
+"""add user data version
+
+Revision ID: e7a90b3c6f12
+Revises: c52d8e1f4a37
+Create Date: 2026-10-17 13:47:55.206931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a90b3c6f12'
+down_revision = 'c52d8e1f4a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
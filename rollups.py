@@ -0,0 +1,313 @@
+"""Denormalized subtree aggregates for self-referencing tree models.
+
+A model taking part has integer ``descendant_count``,
+``completed_descendant_count`` and ``max_depth`` columns (``max_depth`` being
+how many levels of descendants lie below the node). The helpers below keep
+them up to date along the ancestor path of a change, inside the caller's
+transaction, and :func:`recompute` rebuilds them from scratch.
+"""
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, func, literal, select, update
+from sqlalchemy.orm import aliased
+
+
+def _ancestors(model, parent_attr, parent_id):
+    """CTE of ``(id, parent_id, distance)`` for ``parent_id`` and its ancestors.
+
+    ``distance`` counts the levels from a new child of ``parent_id``, so the
+    parent itself is at distance 1.
+    """
+    parent_column = getattr(model, parent_attr)
+    ancestors = (
+        select(
+            model.id, parent_column.label("parent_id"), literal(1).label("distance")
+        )
+        .where(model.id == parent_id)
+        .cte("ancestors", recursive=True)
+    )
+    return ancestors.union_all(
+        select(model.id, parent_column, ancestors.c.distance + 1).where(
+            model.id == ancestors.c.parent_id
+        )
+    )
+
+
+def add_subtree(
+    session, model, parent_attr, parent_id, count=1, completed=0, height=0
+):
+    """Account for ``count`` new nodes attached below ``parent_id``.
+
+    ``completed`` of them are complete and the deepest lies ``height`` levels
+    below the attached root (0 when a single leaf is added).
+    """
+    if parent_id is None:
+        return
+    ancestors = _ancestors(model, parent_attr, parent_id)
+    distance = (
+        select(ancestors.c.distance)
+        .where(ancestors.c.id == model.id)
+        .scalar_subquery()
+    )
+    depth = distance + height
+    session.execute(
+        update(model)
+        .where(model.id.in_(select(ancestors.c.id)))
+        .values(
+            descendant_count=model.descendant_count + count,
+            completed_descendant_count=model.completed_descendant_count + completed,
+            max_depth=case((model.max_depth < depth, depth), else_=model.max_depth),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def change_completed(session, model, parent_attr, parent_id, delta):
+    """Account for ``delta`` nodes below ``parent_id`` becoming (in)complete."""
+    if parent_id is None or not delta:
+        return
+    ancestors = _ancestors(model, parent_attr, parent_id)
+    session.execute(
+        update(model)
+        .where(model.id.in_(select(ancestors.c.id)))
+        .values(completed_descendant_count=model.completed_descendant_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_ancestors(session, model, parent_attr, deltas):
+    """Apply many count changes in one statement.
+
+    ``deltas`` is a select with columns labelled ``id``, ``count`` and
+    ``completed``: a parent and the changes below it. Every row's deltas are
+    added to that parent and all its ancestors, summed where paths overlap.
+    """
+    parent_column = getattr(model, parent_attr)
+    parent_id, count, completed = deltas.subquery().c
+    path = (
+        select(parent_id, count, completed)
+        .where(parent_id.isnot(None))
+        .cte("path", recursive=True)
+    )
+    path = path.union_all(
+        select(parent_column.label("id"), path.c.count, path.c.completed).where(
+            model.id == path.c.id, parent_column.isnot(None)
+        )
+    )
+
+    def total(column):
+        return (
+            select(func.coalesce(func.sum(column), 0))
+            .where(path.c.id == model.id)
+            .scalar_subquery()
+        )
+
+    session.execute(
+        update(model)
+        .where(model.id.in_(select(path.c.id)))
+        .values(
+            descendant_count=model.descendant_count + total(path.c.count),
+            completed_descendant_count=model.completed_descendant_count
+            + total(path.c.completed),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_descendants(session, model, rows, is_completed):
+    """Account for nodes leaving the subtrees of some of their ancestors, in
+    one statement.
+
+    ``rows`` is a select of ``ancestor_id`` and ``descendant_id`` columns, one
+    row for every ancestor losing a descendant, as a closure table has them;
+    ``is_completed`` is as for :func:`recompute`. Heights are left as they are.
+    """
+    rows = rows.subquery()
+    descendant = aliased(model)
+    completed = func.coalesce(is_completed(descendant), False)
+
+    def total(column):
+        return (
+            select(func.coalesce(func.sum(column), 0))
+            .select_from(rows)
+            .join(descendant, descendant.id == rows.c.descendant_id)
+            .where(rows.c.ancestor_id == model.id)
+            .scalar_subquery()
+        )
+
+    session.execute(
+        update(model)
+        .where(model.id.in_(select(rows.c.ancestor_id)))
+        .values(
+            descendant_count=model.descendant_count - total(literal(1)),
+            completed_descendant_count=model.completed_descendant_count
+            - total(case((completed, 1), else_=0)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_heights(session, model, parent_attr, node_ids, is_live=None):
+    """Re-derive ``max_depth`` upwards from each of ``node_ids`` after removals."""
+    for node_id in node_ids:
+        _update_heights(session, model, parent_attr, node_id, is_live)
+
+
+def remove_subtree(session, model, parent_attr, node, completed, is_live=None):
+    """Account for ``node`` and its descendants leaving the tree.
+
+    Call this after the node has been deleted or hidden, but with its own
+    aggregates still loaded; ``completed`` tells whether the node itself was
+    complete and ``is_live`` filters out hidden children, as in
+    :func:`recompute`.
+    """
+    parent_id = getattr(node, parent_attr)
+    if parent_id is None:
+        return
+    _remove_from_ancestors(session, model, parent_attr, parent_id, node, completed)
+    _update_heights(session, model, parent_attr, parent_id, is_live)
+
+
+def move_subtree(
+    session, model, parent_attr, node, old_parent_id, completed, is_live=None
+):
+    """Account for ``node`` and its descendants moving from below
+    ``old_parent_id`` to below the node's current parent.
+
+    Call this once the node has been attached to its new parent, with its own
+    aggregates loaded; the arguments are as for :func:`remove_subtree`.
+    """
+    if old_parent_id is not None:
+        _remove_from_ancestors(
+            session, model, parent_attr, old_parent_id, node, completed
+        )
+        _update_heights(session, model, parent_attr, old_parent_id, is_live)
+    add_subtree(
+        session,
+        model,
+        parent_attr,
+        getattr(node, parent_attr),
+        node.descendant_count + 1,
+        node.completed_descendant_count + int(completed),
+        node.max_depth,
+    )
+
+
+def _remove_from_ancestors(session, model, parent_attr, parent_id, node, completed):
+    ancestors = _ancestors(model, parent_attr, parent_id)
+    session.execute(
+        update(model)
+        .where(model.id.in_(select(ancestors.c.id)))
+        .values(
+            descendant_count=model.descendant_count - (node.descendant_count + 1),
+            completed_descendant_count=model.completed_descendant_count
+            - (node.completed_descendant_count + int(completed)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _update_heights(session, model, parent_attr, node_id, is_live):
+    # A height can only be recomputed from the remaining children; walk up one
+    # ancestor at a time and stop as soon as one is unaffected.
+    session.flush()
+    child = aliased(model)
+    while node_id is not None:
+        conditions = [getattr(child, parent_attr) == node_id]
+        if is_live is not None:
+            conditions.append(is_live(child))
+        height = (
+            select(func.coalesce(func.max(child.max_depth) + 1, 0))
+            .where(*conditions)
+            .scalar_subquery()
+        )
+        old, new, parent_id = session.execute(
+            select(model.max_depth, height, getattr(model, parent_attr)).where(
+                model.id == node_id
+            )
+        ).one()
+        if old == new:
+            break
+        session.execute(
+            update(model)
+            .where(model.id == node_id)
+            .values(max_depth=new)
+            .execution_options(synchronize_session=False)
+        )
+        node_id = parent_id
+
+
+def subtree_totals(nodes):
+    """Aggregate in-memory nodes given as ``{id: (parent_id, completed)}``.
+
+    Returns ``{id: (descendant_count, completed_descendant_count, max_depth)}``
+    counting only descendants within ``nodes``.
+    """
+    children = defaultdict(list)
+    for node_id, (parent_id, _) in nodes.items():
+        if parent_id in nodes:
+            children[parent_id].append(node_id)
+    order = []
+    stack = [
+        node_id for node_id, (parent_id, _) in nodes.items() if parent_id not in nodes
+    ]
+    while stack:
+        node_id = stack.pop()
+        order.append(node_id)
+        stack.extend(children[node_id])
+
+    totals = {}
+    for node_id in reversed(order):
+        count = completed = depth = 0
+        for child_id in children[node_id]:
+            child_count, child_completed, child_depth = totals[child_id]
+            count += child_count + 1
+            completed += child_completed + int(nodes[child_id][1])
+            depth = max(depth, child_depth + 1)
+        totals[node_id] = (count, completed, depth)
+    return totals
+
+
+def recompute(
+    session, model, parent_attr, is_completed, is_live=None, chunk_size=5000
+):
+    """Rebuild every node's aggregates with one scan; returns the rows fixed.
+
+    ``is_completed`` and ``is_live`` map the model (or an alias of it) to SQL
+    expressions telling whether a node counts as complete, and whether it is
+    visible at all; hidden nodes do not count towards their ancestors.
+    """
+    live = is_live(model) if is_live is not None else literal(True)
+    rows = session.execute(
+        select(
+            model.id,
+            getattr(model, parent_attr),
+            # A nullable flag may be NULL, which counts as not complete
+            func.coalesce(is_completed(model), False),
+            live,
+            model.descendant_count,
+            model.completed_descendant_count,
+            model.max_depth,
+        )
+    ).all()
+    totals = subtree_totals({row[0]: (row[1], row[2]) for row in rows if row[3]})
+    table = model.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("node_id"))
+        .values(
+            descendant_count=bindparam("count"),
+            completed_descendant_count=bindparam("completed"),
+            max_depth=bindparam("depth"),
+        )
+    )
+    changed = [
+        {"node_id": row[0], "count": count, "completed": completed, "depth": depth}
+        for row in rows
+        for count, completed, depth in [totals.get(row[0], (0, 0, 0))]
+        if (count, completed, depth) != tuple(row[4:])
+    ]
+    for start in range(0, len(changed), chunk_size):
+        session.execute(statement, changed[start : start + chunk_size])
+    session.commit()
+    return len(changed)
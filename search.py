@@ -0,0 +1,134 @@
+"""Per-user full-text search over titles with SQLite FTS5.
+
+Every searchable model gets an FTS5 table using the trigram tokenizer, so
+any substring of three or more characters matches. The index is contentless
+(it keeps only the index, not the text). Triggers keep it in step with
+inserts, updates and deletes, and they store an owner token next to the
+title. Because of that token, a user's query only walks that user's part of
+the index instead of filtering everybody's matches afterwards.
+"""
+from sqlalchemy import (
+    DDL,
+    column,
+    event,
+    func,
+    literal_column,
+    select,
+    table,
+    text,
+)
+
+MIN_QUERY_LENGTH = 3  # shorter strings have no trigrams
+
+
+def owner_token(user_id):
+    return f"u{user_id}u"
+
+
+def match_expression(user_id, query):
+    """FTS5 query for ``query`` as a substring of the user's titles."""
+    phrase = '"' + query.replace('"', '""') + '"'
+    return f'owner : "{owner_token(user_id)}" AND title : {phrase}'
+
+
+def relevance(title, query):
+    """ORDER BY clauses for titles containing ``query``: earliest match, then
+    shortest title (the query covers more of it).
+    """
+    position = func.instr(func.lower(title), query.lower())
+    length = func.length(title)
+    return func.coalesce(func.nullif(position, 0), length), length
+
+
+class SearchIndex:
+    """Trigram index over ``model.title``, kept in sync by triggers.
+
+    ``owner`` is SQL giving the id of the user a row belongs to, with
+    ``{row}`` standing for the trigger's ``NEW`` or ``OLD`` row; ``watch``
+    lists the columns whose updates can change the title or the owner. The
+    table and triggers are created along with the model's table on SQLite,
+    and by :meth:`rebuild` for existing databases.
+    """
+
+    def __init__(self, model, owner, watch=("title",)):
+        self.model = model
+        self.source = model.__tablename__
+        self.name = f"{self.source}_search"
+        self.owner = owner
+        self.watch = watch
+        self.table = table(self.name, column("rowid"), column("owner"), column("title"))
+        for statement in self.ddl():
+            event.listen(
+                model.__table__,
+                "after_create",
+                DDL(statement).execute_if(dialect="sqlite"),
+            )
+
+    def _values(self, row):
+        owner = self.owner.format(row=row)
+        return f"{row}.id, 'u' || ({owner}) || 'u', {row}.title"
+
+    def ddl(self):
+        name, source = self.name, self.source
+        delete = (
+            f"INSERT INTO {name}({name}, rowid, owner, title)"
+            f" VALUES ('delete', {self._values('old')});"
+        )
+        insert = (
+            f"INSERT INTO {name}(rowid, owner, title)"
+            f" VALUES ({self._values('new')});"
+        )
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+            f"owner, title, content='', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {source}"
+            f" BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {source}"
+            f" BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {name}_update"
+            f" AFTER UPDATE OF {', '.join(self.watch)} ON {source}"
+            f" BEGIN {delete} {insert} END",
+        ]
+
+    def drop_ddl(self):
+        return [
+            f"DROP TRIGGER IF EXISTS {self.name}_update",
+            f"DROP TRIGGER IF EXISTS {self.name}_delete",
+            f"DROP TRIGGER IF EXISTS {self.name}_insert",
+            f"DROP TABLE IF EXISTS {self.name}",
+        ]
+
+    def rebuild(self, session):
+        """Create the index if missing and refill it; returns the rows indexed."""
+        # Plain SQL goes to the database the session binds the model to
+        bind = {"mapper": self.model.__mapper__}
+        for statement in self.ddl():
+            session.execute(text(statement), bind_arguments=bind)
+        name = self.name
+        session.execute(
+            text(f"INSERT INTO {name}({name}) VALUES ('delete-all')"),
+            bind_arguments=bind,
+        )
+        result = session.execute(
+            text(
+                f"INSERT INTO {name}(rowid, owner, title)"
+                f" SELECT {self._values(self.source)} FROM {self.source}"
+            ),
+            bind_arguments=bind,
+        )
+        session.commit()
+        return result.rowcount
+
+    def search(self, user_id, query):
+        """Select the ``model`` rows matching ``query``, best first.
+
+        Callers add their own filters, then a limit and offset.
+        """
+        index = literal_column(self.name)
+        return (
+            select(self.model)
+            .select_from(self.table)
+            .join(self.model, self.model.id == self.table.c.rowid)
+            .where(index.op("MATCH")(match_expression(user_id, query)))
+            .order_by(*relevance(self.model.title, query), self.model.id)
+        )
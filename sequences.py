@@ -0,0 +1,34 @@
+"""Primary keys for rows bulk inserted with executemany().
+
+Bulk inserts assign their ids up front, so that children can reference their
+parents within the same batches. The ids must still come from the database.
+On PostgreSQL they are drawn from the column's sequence: later ordinary
+inserts then do not collide with them, and concurrent bulk inserts draw
+disjoint ids. SQLite has no sequences and numbers new rows after the table's
+largest id, so the ids following it are free for as long as the transaction
+holds the database's write lock.
+"""
+from sqlalchemy import func, select
+
+
+def reserve_ids(session, column, count):
+    """Reserve ``count`` new values of the integer primary key ``column``.
+
+    Returns them in ascending order. On PostgreSQL they may have gaps, where
+    concurrent inserts drew from the sequence meanwhile. On SQLite, reserve
+    them after the transaction's first write, which takes the write lock.
+    """
+    if count <= 0:
+        return []
+    connection = session.connection(bind_arguments={"clause": column.table})
+    if connection.dialect.name == "postgresql":
+        sequence = func.pg_get_serial_sequence(column.table.name, column.name)
+        return sorted(
+            session.scalars(
+                select(func.nextval(sequence)).select_from(
+                    func.generate_series(1, count)
+                )
+            )
+        )
+    last_id = session.scalar(select(func.coalesce(func.max(column), 0)))
+    return range(last_id + 1, last_id + 1 + count)
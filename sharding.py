@@ -0,0 +1,135 @@
+"""Per-user sharding of the task tables over several SQLite databases.
+
+SQLite lets one writer at a time into a database file. With every user in one
+file, writes queue on that lock however many workers serve them. With
+``SHARD_DATABASE_URLS`` set, each user's rows of the sharded models and
+tables live in one of the shard databases, the one recorded in the user's
+directory row in the main database. New users are placed by a stable hash of
+their id, and ``flask rebalance-shards`` moves existing users to theirs, e.g.
+after adding a shard. Requests bind the sharded tables of their session to
+the current user's shard, so queries and the ORM run unchanged, and writes to
+different shards no longer wait for each other.
+
+Shards hold only the sharded tables, so they are created from copies that
+leave out the foreign keys to the other tables (those of ``user``), which
+exist in the main database alone. The copies keep the DDL the tables create
+along with themselves, such as the search indexes.
+"""
+import zlib
+
+from sqlalchemy import MetaData, event
+from sqlalchemy.orm import scoped_session
+
+
+class UserMovedError(RuntimeError):
+    """The user's rows were moved to another shard while a request ran."""
+
+
+def shard_urls(environ):
+    """Shard database URLs from the comma-separated ``SHARD_DATABASE_URLS``."""
+    urls = environ.get("SHARD_DATABASE_URLS", "").split(",")
+    return [url.strip() for url in urls if url.strip()]
+
+
+class ShardRouter:
+    """Route ``models`` and ``tables`` to the shard binds of ``db``.
+
+    Shard ``n`` is the Flask-SQLAlchemy bind ``shard<n>``; ``None`` stands for
+    the main database, which holds everything when sharding is off and keeps
+    the rows of users who have not been moved to a shard yet.
+    """
+
+    def __init__(self, db, models, tables=()):
+        self.db = db
+        self.models = models
+        self.tables = tables
+        self.app = None
+        self.count = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.count = len(app.config.get("SHARD_DATABASE_URLS") or ())
+        if self.count and app.config.get("ASYNC_MODE"):
+            raise RuntimeError("ASYNC_MODE does not support sharded databases")
+
+    @property
+    def enabled(self):
+        return self.count > 0
+
+    @staticmethod
+    def bind_key(shard):
+        return f"shard{shard}"
+
+    def shard_for(self, user_id):
+        """The shard a new user goes to, or ``None`` when sharding is off."""
+        if not self.enabled:
+            return None
+        return zlib.crc32(str(user_id).encode()) % self.count
+
+    def engine(self, shard):
+        bind = None if shard is None else self.bind_key(shard)
+        return self.db.get_engine(self.app, bind=bind)
+
+    def sharded_tables(self):
+        return [model.__table__ for model in self.models] + list(self.tables)
+
+    def shard_tables(self):
+        """Copies of the sharded tables without their foreign keys to tables
+        that are not sharded, which a shard database lacks."""
+        metadata = MetaData()
+        tables = []
+        for original in self.sharded_tables():
+            table = original.to_metadata(metadata)
+            for name in ("before_create", "after_create"):
+                for listener in getattr(original.dispatch, name):
+                    event.listen(table, name, listener)
+            tables.append(table)
+        for table in tables:
+            for constraint in list(table.foreign_key_constraints):
+                referred = {
+                    key.target_fullname.rpartition(".")[0]
+                    for key in constraint.elements
+                }
+                if referred <= metadata.tables.keys():
+                    continue
+                table.constraints.discard(constraint)
+                for key in constraint.elements:
+                    key.parent.foreign_keys.discard(key)
+                    table.foreign_keys.discard(key)
+        return tables
+
+    def use(self, session, shard):
+        """Send the sharded statements of ``session`` to ``shard`` from now on.
+
+        Rebind only between transactions: a transaction already open on the
+        previous shard is not moved.
+        """
+        if isinstance(session, scoped_session):
+            session = session()  # binds belong to the session, not the registry
+        engine = self.engine(shard)
+        for model in self.models:
+            session.bind_mapper(model, engine)
+        for table in self.tables:
+            session.bind_table(table, engine)
+
+    def each(self, session):
+        """Bind ``session`` to every database holding sharded rows in turn,
+        yielding the shard; commit before taking the next one."""
+        yield None
+        for shard in range(self.count):
+            self.use(session, shard)
+            yield shard
+        self.use(session, None)
+
+    def databases(self):
+        """``(shard, engine, tables)`` of every database: the main one with all
+        tables, then each shard with :meth:`shard_tables`."""
+        yield None, self.engine(None), self.db.metadata.sorted_tables
+        tables = self.shard_tables() if self.count else []
+        for shard in range(self.count):
+            yield shard, self.engine(shard), tables
+
+    def create_all(self):
+        """Create the missing tables of every database."""
+        for _, engine, tables in self.databases():
+            tables[0].metadata.create_all(engine, tables=tables)
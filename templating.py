@@ -0,0 +1,53 @@
+"""Template loading options and tree flattening for non-recursive rendering.
+
+Templates are compiled to Python on first use by every worker. Setting
+``TEMPLATE_CACHE_DIR`` keeps the compiled bytecode on disk across restarts,
+and ``TEMPLATE_MODULE_DIR`` loads templates precompiled with
+:func:`precompile_templates` instead, falling back to the template folder
+for any template missing there. Precompiled modules are not checked against
+their sources, so compile them again whenever the templates change.
+"""
+import os
+
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, ModuleLoader
+
+
+def configure_templates(app):
+    cache_dir = app.config.get("TEMPLATE_CACHE_DIR")
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    module_dir = app.config.get("TEMPLATE_MODULE_DIR")
+    if module_dir and os.path.isdir(module_dir):
+        app.jinja_env.loader = ChoiceLoader(
+            [ModuleLoader(module_dir), app.jinja_env.loader]
+        )
+
+
+def precompile_templates(app, target):
+    """Compile every template of the app into Python modules in ``target``."""
+    os.makedirs(target, exist_ok=True)
+    app.jinja_env.compile_templates(target, zip=None, ignore_errors=False)
+    return len(app.jinja_env.list_templates())
+
+
+def flatten_tree(roots, children):
+    """Pre-order ``(node, depth, has_children, closes)`` rows of a tree.
+
+    ``children`` maps a node id to its child nodes, in display order. Nested
+    lists can be rendered from the rows in one loop: a node with children
+    opens a level, and ``closes`` is the number of levels that end right
+    after the node.
+    """
+    rows = []
+    stack = [(node, 0) for node in reversed(roots)]
+    while stack:
+        node, depth = stack.pop()
+        kids = children.get(node.id, ())
+        rows.append((node, depth, bool(kids)))
+        stack.extend((child, depth + 1) for child in reversed(kids))
+    depths = [depth for _, depth, _ in rows[1:]] + [0]
+    return [
+        (node, depth, has_children, 0 if has_children else depth - next_depth)
+        for (node, depth, has_children), next_depth in zip(rows, depths)
+    ]
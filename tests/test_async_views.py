@@ -0,0 +1,37 @@
+"""The read-heavy views served from the asyncio engine (ASYNC_MODE)."""
+import threading
+
+import pytest
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+pytest.importorskip("aiosqlite")
+
+
+@pytest.fixture
+def session_threads():
+    """Names of the threads that begin a transaction on a session of db."""
+    names = []
+
+    def record(session, transaction, connection):
+        names.append(threading.current_thread().name)
+
+    event.listen(SignallingSession, "after_begin", record)
+    yield names
+    event.remove(SignallingSession, "after_begin", record)
+
+
+def test_dashboard_stays_off_the_request_session(make_app, login, session_threads):
+    app = make_app(ASYNC_MODE=True)
+    client = login(app, "async")
+    client.post(
+        "/add_task/To Do", query_string={"format": "json"}, data={"title": "first task"}
+    )
+
+    client.get("/")  # shows the login's flash messages, so it is not tagged
+    response = client.get("/")
+    assert response.status_code == 200
+    assert b"first task" in response.data
+    etag = response.headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+    assert "async-db" not in session_threads
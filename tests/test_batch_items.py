@@ -0,0 +1,182 @@
+"""POST /items/batch of tmp.py: many item changes in one transaction."""
+import pytest
+from sqlalchemy import select
+
+import rollups
+import tmp as lists
+
+
+def add_lists(username, *titles):
+    user = lists.User.query.filter_by(username=username).one()
+    todo_lists = [lists.List(title=title, user=user) for title in titles]
+    lists.db.session.add_all(todo_lists)
+    lists.db.session.commit()
+    return [todo_list.id for todo_list in todo_lists]
+
+
+def add_items(list_id, tree, parent=None):
+    """Add ``{title: subtree}`` below ``parent``; returns ``{title: id}``.
+
+    Titles starting with "done" are complete.
+    """
+    ids = {}
+    for title, subtree in tree.items():
+        item = lists.Item(
+            title=title,
+            list_id=list_id,
+            parent=parent,
+            is_completed=title.startswith("done"),
+        )
+        lists.db.session.add(item)
+        lists.db.session.flush()
+        ids[title] = item.id
+        ids.update(add_items(list_id, subtree, item))
+    if parent is None:
+        lists.db.session.commit()
+        rollups.recompute(
+            lists.db.session, lists.Item, "parent_item_id", lists._item_is_completed
+        )
+    return ids
+
+
+def closure_rows():
+    table = lists.item_tree.table
+    return set(lists.db.session.execute(select(table)).all())
+
+
+def test_move_detaches_subtrees_in_bulk(list_app, login):
+    client = login(list_app, "mover")
+    with list_app.app_context():
+        source_id, target_id = add_lists("mover", "source", "target")
+        ids = add_items(
+            source_id,
+            {
+                "root": {
+                    "a": {"b": {"c": {"done d": {}}}},
+                    "done e": {},
+                },
+                "other": {"f": {}},
+            },
+        )
+
+    response = client.post(
+        "/items/batch",
+        json={
+            "operations": [
+                {
+                    "op": "move",
+                    "item_ids": [ids["a"], ids["c"], ids["f"]],
+                    "list_id": target_id,
+                }
+            ]
+        },
+    )
+    assert response.json == {"results": [{"op": "move", "changed": 5}]}
+
+    with list_app.app_context():
+        items = {
+            item.title: item
+            for item in lists.Item.query.filter(
+                lists.Item.list_id.in_([source_id, target_id])
+            )
+        }
+        moved = {title for title, item in items.items() if item.list_id == target_id}
+        assert moved == {"a", "b", "c", "done d", "f"}
+        assert [items[title].parent_item_id for title in ("a", "c", "f")] == [None] * 3
+        root = items["root"]
+        assert (
+            root.descendant_count,
+            root.completed_descendant_count,
+            root.max_depth,
+        ) == (1, 1, 1)
+        assert (items["a"].descendant_count, items["a"].max_depth) == (1, 1)
+        assert items["other"].max_depth == 0
+
+        # The bulk statements leave what rebuilding from scratch gives
+        rows = closure_rows()
+        lists.item_tree.rebuild(lists.db.session)
+        assert closure_rows() == rows
+        assert (
+            rollups.recompute(
+                lists.db.session, lists.Item, "parent_item_id", lists._item_is_completed
+            )
+            == 0
+        )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"operations": {"op": "delete", "item_ids": [1]}},
+        {"operations": ["delete"]},
+        {"operations": [{"op": "rename", "item_ids": [1]}]},
+        {"operations": [{"op": "delete", "item_ids": 1}]},
+        {"operations": [{"op": "delete", "item_ids": [True]}]},
+        {"operations": [{"op": "delete", "item_ids": ["1"]}]},
+        {"operations": [{"op": "move", "item_ids": [1]}]},
+        {"operations": [{"op": "move", "item_ids": [1], "list_id": False}]},
+    ],
+)
+def test_malformed_batches_are_rejected(list_app, login, body):
+    client = login(list_app, "malformed")
+    response = client.post("/items/batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.json
+
+
+def test_batches_apply_entirely_or_not_at_all(list_app, login, monkeypatch):
+    client = login(list_app, "owner")
+    login(list_app, "stranger")
+    with list_app.app_context():
+        (list_id,) = add_lists("owner", "mine")
+        (other_list_id,) = add_lists("stranger", "theirs")
+        ids = add_items(list_id, {"root": {"a": {}, "b": {}}})
+        (stranger_id,) = add_items(other_list_id, {"theirs": {}}).values()
+
+    def completed():
+        with list_app.app_context():
+            root = lists.db.session.get(lists.Item, ids["root"])
+            return root.completed_descendant_count
+
+    response = client.post(
+        "/items/batch",
+        json={
+            "operations": [
+                {"op": "complete", "item_ids": [ids["a"], ids["b"]]},
+                {"op": "delete", "item_ids": [stranger_id]},
+            ]
+        },
+    )
+    assert response.status_code == 403
+    assert response.json["item_ids"] == [stranger_id]
+    response = client.post(
+        "/items/batch",
+        json={
+            "operations": [
+                {"op": "complete", "item_ids": [ids["a"]]},
+                {"op": "move", "item_ids": [ids["b"]], "list_id": other_list_id},
+            ]
+        },
+    )
+    assert response.status_code == 403
+    assert response.json["list_ids"] == [other_list_id]
+    assert completed() == 0
+
+    # Each operation counts its ids and its list
+    monkeypatch.setitem(list_app.config, "ITEM_BATCH_MAX_IDS", 3)
+    operations = [{"op": "complete", "item_ids": [ids["a"], ids["b"]]}]
+    response = client.post(
+        "/items/batch",
+        json={"operations": operations + [{"op": "delete", "item_ids": []}]},
+    )
+    assert response.status_code == 400
+    response = client.post("/items/batch", json={"operations": operations})
+    assert response.json == {"results": [{"op": "complete", "changed": 2}]}
+    assert completed() == 2
+    response = client.post(
+        "/items/batch",
+        json={"operations": [{"op": "uncomplete", "item_ids": [ids["a"], ids["a"]]}]},
+    )
+    assert response.json == {"results": [{"op": "uncomplete", "changed": 1}]}
+    assert completed() == 1
@@ -0,0 +1,74 @@
+"""Task changes pushed to open dashboards over Server-Sent Events."""
+import json
+
+from changefeed import RESET, ChangeFeed
+
+
+def read_events(response, count):
+    """Parse ``count`` events off a streamed /events response."""
+    events = []
+    buffer = ""
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            block, buffer = buffer.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in block.splitlines())
+            if "id" in fields:
+                events.append(
+                    (int(fields["id"]), fields["event"], json.loads(fields["data"]))
+                )
+            if len(events) == count:
+                response.close()
+                return events
+    return events
+
+
+def test_change_feed_is_opt_in(make_app, login, add_task):
+    app = make_app()
+    client = login(app, "no feed")
+    add_task(client, "task")
+    assert client.get("/events").status_code == 404
+    assert not app.extensions["change_feed"]._channels
+
+
+def test_events_are_numbered_by_data_version(make_app, login, add_task):
+    app = make_app(CHANGE_FEED_ENABLED=True, CHANGE_FEED_HEARTBEAT=0.05)
+    client = login(app, "feed")
+    task_ids = [add_task(client, f"task {i}")["id"] for i in range(3)]
+    client.post(f"/tasks/{task_ids[0]}/status", data={"status": "Done"})
+
+    response = client.get("/events", query_string={"after": 2}, buffered=False)
+    events = read_events(response, 2)
+    assert [(version, kind) for version, kind, _ in events] == [
+        (3, "change"),
+        (4, "change"),
+    ]
+    assert events[0][2]["type"] == "added"
+    assert events[0][2]["task"]["id"] == task_ids[2]
+    assert events[1][2]["type"] == "updated"
+
+    # A reconnect resumes after the last event it saw
+    response = client.get("/events", headers={"Last-Event-ID": "0"}, buffered=False)
+    assert [event[0] for event in read_events(response, 4)] == [1, 2, 3, 4]
+
+    # Versions this process does not hold, as on another worker, reset the board
+    app.extensions["change_feed"]._channels.clear()
+    response = client.get("/events", headers={"Last-Event-ID": "1"}, buffered=False)
+    assert read_events(response, 1) == [(4, "reset", RESET)]
+
+
+def test_listening_waits_for_publishes():
+    feed = ChangeFeed(history=2)
+    events = feed.listen(1, heartbeat=0.01)
+    # Nothing published yet: a keepalive
+    assert next(events) is None
+
+    feed.publish(2, 1, {"type": "added"})
+    feed.publish(1, 1, {"type": "added"})
+    assert next(events) == (1, {"type": "added"})
+    for version in (2, 3, 4):
+        feed.publish(1, version, {"type": "updated"})
+    # More than the history missed at once: start over at the last version
+    assert next(events) == (4, RESET)
+    events.close()
+    assert feed._channels[1].subscribers == 0
@@ -0,0 +1,44 @@
+"""Several apps built by create_app() in one process, as tests and tools do.
+
+Each app keeps its own shard router, group committer and settings; building
+another one does not change them.
+"""
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+import app as todo
+
+
+def add_task(client):
+    return client.post(
+        "/add_task/To Do", query_string={"format": "json"}, data={"title": "task"}
+    )
+
+
+def test_apps_keep_their_own_settings(make_app, login):
+    grouped = make_app(GROUP_COMMIT=True)
+    measured = make_app(METRICS_ENABLED=True)
+
+    with grouped.app_context():
+        assert todo.group_commit.enabled
+        assert todo.shards.app is grouped
+        assert not todo.instrumentation.enabled
+    with measured.app_context():
+        assert not todo.group_commit.enabled
+        assert todo.instrumentation.enabled
+
+    response = add_task(login(grouped, "grouped"))
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    response = add_task(login(measured, "measured"))
+    assert response.status_code == 200
+    assert "Server-Timing" in response.headers
+
+
+def test_new_database_is_stamped_at_head(make_app):
+    app = make_app()
+    with app.app_context():
+        directory = app.extensions["migrate"].directory
+        head = ScriptDirectory(f"{app.root_path}/{directory}").get_current_head()
+        with todo.db.engine.connect() as connection:
+            assert MigrationContext.configure(connection).get_current_revision() == head
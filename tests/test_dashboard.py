@@ -0,0 +1,64 @@
+"""The dashboard and the pages of tasks it loads on demand."""
+
+
+def test_unchanged_dashboard_is_not_modified(make_app, login, add_task):
+    app = make_app()
+    client = login(app, "etag")
+    add_task(client, "first")
+    # The first page after logging in shows its flash, and is not tagged
+    assert "ETag" not in client.get("/").headers
+
+    response = client.get("/")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    add_task(client, "second")
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert b"second" in response.data
+
+    # Another user's board is tagged apart, even at the same version
+    other = login(app, "other")
+    add_task(other, "first")
+    add_task(other, "second")
+    other.get("/")
+    response = other.get("/", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+
+
+def read_pages(client, url):
+    """Follow the ``next`` links from ``url``; returns the pages' task ids."""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([task["id"] for task in response.json["tasks"]])
+        url = response.json["next"]
+    return pages
+
+
+def test_paging_by_cursor(make_app, login, add_task):
+    app = make_app()
+    client = login(app, "pages")
+    top_ids = [add_task(client, f"task {i}")["id"] for i in range(5)]
+    subtask_ids = [add_task(client, f"sub {i}", top_ids[0])["id"] for i in range(3)]
+    add_task(client, "elsewhere", status="Done")
+
+    pages = read_pages(client, "/columns/To Do?format=json&limit=2")
+    assert pages == [top_ids[:2], top_ids[2:4], top_ids[4:]]
+    pages = read_pages(client, f"/tasks/{top_ids[0]}/subtasks?format=json&limit=2")
+    assert pages == [subtask_ids[:2], subtask_ids[2:]]
+
+    # A cursor only skips what the previous pages returned
+    response = client.get(
+        "/columns/To Do",
+        query_string={"format": "json", "after": top_ids[2], "limit": 10},
+    )
+    assert [task["id"] for task in response.json["tasks"]] == top_ids[3:]
+    assert response.json["next"] is None
+    assert response.json["tasks"][0]["has_subtasks"] is False
+    assert client.get("/columns/Nowhere").status_code == 404
@@ -0,0 +1,87 @@
+"""GET /tasks/export and POST /tasks/import."""
+import json
+
+import app as todo
+
+
+def export(client):
+    response = client.get("/tasks/export")
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.data.splitlines()]
+
+
+def shape(records):
+    """The records by title, with parents named by title rather than id."""
+    titles = {record["id"]: record["title"] for record in records}
+    return {
+        record["title"]: (
+            titles.get(record["parent_id"]),
+            record["status"],
+            record["is_completed"],
+        )
+        for record in records
+    }
+
+
+def test_export_import_round_trip(make_app, login, add_task):
+    app = make_app()
+    source = login(app, "source")
+    root = add_task(source, "root")
+    child = add_task(source, "child", root["id"])
+    add_task(source, "grandchild", child["id"], status="Done")
+    add_task(source, "sibling", root["id"])
+    add_task(source, "other root", status="In Progress")
+    records = export(source)
+
+    target = login(app, "target")
+    add_task(target, "existing")
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    response = target.post("/tasks/import", data=body)
+    assert response.status_code == 200
+    assert response.json["imported"] == 5
+
+    imported = [record for record in export(target) if record["title"] != "existing"]
+    assert shape(imported) == shape(records)
+    # The tasks got new ids, and the parent references followed them
+    assert not {record["id"] for record in imported} & {r["id"] for r in records}
+    (root_id,) = [record["id"] for record in imported if record["title"] == "root"]
+    with app.app_context():
+        new_root = todo.db.session.get(todo.Task, root_id)
+        assert (
+            new_root.descendant_count,
+            new_root.completed_descendant_count,
+            new_root.max_depth,
+        ) == (3, 1, 2)
+
+
+def test_import_below_existing_tasks(make_app, login, add_task):
+    app = make_app()
+    client = login(app, "nested")
+    parent = add_task(client, "parent")
+    stranger = add_task(login(app, "stranger"), "not yours")
+    tree = {
+        "title": "imported",
+        "parent_id": parent["id"],
+        "subtasks": [{"title": "below", "status": "Done"}],
+    }
+
+    response = client.post("/tasks/import", json=[tree])
+    assert response.json["imported"] == 2
+    response = client.get(
+        f"/tasks/{parent['id']}/subtasks", query_string={"format": "json"}
+    )
+    (task,) = response.json["tasks"]
+    assert (task["title"], task["descendant_count"]) == ("imported", 1)
+    with app.app_context():
+        parent_task = todo.db.session.get(todo.Task, parent["id"])
+        assert (
+            parent_task.descendant_count,
+            parent_task.completed_descendant_count,
+            parent_task.max_depth,
+        ) == (2, 1, 2)
+
+    # Parents must be the user's own live tasks; nothing of a failed upload stays
+    tree["parent_id"] = stranger["id"]
+    response = client.post("/tasks/import", json=[tree])
+    assert response.status_code == 400
+    assert len(export(client)) == 3
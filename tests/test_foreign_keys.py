@@ -0,0 +1,100 @@
+"""Deleting trees with SQLite enforcing foreign keys, as server databases do.
+
+The closure table rows reference their tasks and items, so every delete
+path must drop them before the rows they point to.
+"""
+import pytest
+from sqlalchemy import func, select, text
+
+import app as todo
+import rollups
+import tmp as lists
+
+
+def count(db, table):
+    return db.session.scalar(select(func.count()).select_from(table))
+
+
+@pytest.fixture(scope="module")
+def task_app(make_app):
+    pragmas = dict(todo.engine_config({})["SQLITE_PRAGMAS"], foreign_keys="ON")
+    return make_app(SQLITE_PRAGMAS=pragmas)
+
+
+def test_purging_deleted_tasks(task_app, login):
+    client = login(task_app, "purge")
+    response = client.post(
+        "/add_task/To Do", query_string={"format": "json"}, data={"title": "root"}
+    )
+    root_id = parent_id = response.json["task"]["id"]
+    for title in ("child", "grandchild"):
+        response = client.post(
+            f"/tasks/{parent_id}/add_subtask",
+            query_string={"format": "json"},
+            data={"title": title},
+        )
+        parent_id = response.json["task"]["id"]
+
+    response = client.post(f"/tasks/{root_id}/delete", query_string={"format": "json"})
+    assert response.status_code == 200
+    with task_app.app_context():
+        assert todo.db.session.scalar(text("PRAGMA foreign_keys")) == 1
+        todo.task_purger.purge()
+        assert count(todo.db, todo.Task.__table__) == 0
+        assert count(todo.db, todo.task_tree.table) == 0
+
+
+def make_tree(username):
+    user = lists.User(username=username)
+    user.set_password("secret")
+    lists.db.session.add(user)
+    todo_list = lists.List(title="list", user=user)
+    root = lists.Item(title="root", list=todo_list)
+    child = lists.Item(title="child", list=todo_list, parent=root)
+    grandchild = lists.Item(title="grandchild", list=todo_list, parent=child)
+    lists.db.session.add(todo_list)
+    lists.db.session.commit()
+    rollups.recompute(
+        lists.db.session, lists.Item, "parent_item_id", lists._item_is_completed
+    )
+    return root.id, child.id, grandchild.id
+
+
+def closure_count(item_ids):
+    # Other tests share the database: count the rows of these items only
+    table = lists.item_tree.table
+    return lists.db.session.scalar(
+        select(func.count()).where(table.c.descendant_id.in_(item_ids))
+    )
+
+
+def test_deleting_items(list_app):
+    with list_app.app_context():
+        item_ids = make_tree("delete")
+        root_id = item_ids[0]
+    client = list_app.test_client()
+    client.post("/login", data={"username": "delete", "password": "secret"})
+
+    response = client.post(f"/items/{root_id}/delete")
+    assert response.status_code == 302
+    with list_app.app_context():
+        assert lists.db.session.get(lists.Item, root_id) is None
+        assert closure_count(item_ids) == 0
+
+
+def test_batch_deleting_items(list_app):
+    with list_app.app_context():
+        item_ids = make_tree("batch")
+        root_id, child_id, _ = item_ids
+    client = list_app.test_client()
+    client.post("/login", data={"username": "batch", "password": "secret"})
+
+    response = client.post(
+        "/items/batch",
+        json={"operations": [{"op": "delete", "item_ids": [child_id]}]},
+    )
+    assert response.json == {"results": [{"op": "delete", "changed": 2}]}
+    with list_app.app_context():
+        root = lists.db.session.get(lists.Item, root_id)
+        assert (root.descendant_count, root.max_depth) == (0, 0)
+        assert closure_count(item_ids) == 1
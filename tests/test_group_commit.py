@@ -0,0 +1,49 @@
+"""Concurrent writes committed together by a writer thread (groupcommit.py)."""
+import threading
+
+import app as todo
+
+
+def test_failing_write_leaves_the_rest_of_its_batch(make_app, login):
+    # A window long enough for the three writes below to share a batch
+    app = make_app(GROUP_COMMIT=True, GROUP_COMMIT_WINDOW=0.5)
+    login(app, "grouped")
+    with app.app_context():
+        user_id = todo.User.query.filter_by(username="grouped").one().id
+    group_commit = app.extensions["group_commit"]
+    transactions = []
+
+    def add(title):
+        task = todo.Task(title=title, status="To Do", user_id=user_id)
+        todo.db.session.add(task)
+        todo.db.session.flush()
+        transactions.append(todo.db.session().get_transaction())
+        if title == "failing":
+            raise ValueError(title)
+        return task.id
+
+    outcomes = {}
+
+    def run(title):
+        try:
+            outcomes[title] = group_commit.run(None, add, title)
+        except ValueError as exc:
+            outcomes[title] = exc
+
+    threads = [
+        threading.Thread(target=run, args=(title,))
+        for title in ("first", "failing", "last")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(transactions) == 3 and len(set(map(id, transactions))) == 1
+    assert isinstance(outcomes["failing"], ValueError)
+    with app.app_context():
+        titles = todo.db.session.scalars(
+            todo.db.select(todo.Task.title).where(todo.Task.user_id == user_id)
+        ).all()
+        assert sorted(titles) == ["first", "last"]
+        assert todo.db.session.get(todo.Task, outcomes["first"]).title == "first"
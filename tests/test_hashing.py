@@ -0,0 +1,35 @@
+"""Password hashing on a bounded process pool (hashing.py)."""
+import pytest
+
+from hashing import PasswordHasher, PasswordHasherBusy
+
+SLOW = "pbkdf2:sha256:400000"
+
+
+def test_hash_timing_out_counts_as_busy():
+    hasher = PasswordHasher(SLOW, workers=1, max_pending=1, timeout=0.01)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash("secret")
+        # The hash still runs in the pool and keeps its slot meanwhile
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash("secret")
+    finally:
+        hasher.shutdown()
+
+
+def test_saturated_pool_answers_login_with_503(make_app):
+    app = make_app(PASSWORD_HASH_METHOD=SLOW, PASSWORD_HASH_WORKERS=1)
+    hasher = app.extensions["password_hasher"]
+    client = app.test_client()
+    try:
+        client.post("/register", data={"username": "busy", "password": "secret"})
+        hasher.timeout = 0.01
+        for path, username in (("/login", "busy"), ("/register", "other")):
+            response = client.post(
+                path, data={"username": username, "password": "secret"}
+            )
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+    finally:
+        hasher.shutdown()
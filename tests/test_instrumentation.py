@@ -0,0 +1,45 @@
+"""Server-Timing headers and the Prometheus /metrics route."""
+import re
+
+from instrumentation import Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("sizes", "Sizes.", "kind", (1, 5))
+    for value in (0, 3, 9):
+        histogram.observe("a", value)
+
+    assert histogram.exposition().splitlines() == [
+        "# HELP sizes Sizes.",
+        "# TYPE sizes histogram",
+        'sizes_bucket{kind="a",le="1"} 1',
+        'sizes_bucket{kind="a",le="5"} 2',
+        'sizes_bucket{kind="a",le="+Inf"} 3',
+        'sizes_sum{kind="a"} 12',
+        'sizes_count{kind="a"} 3',
+    ]
+
+
+def request_count(client, endpoint):
+    # The histograms are the process's, so other tests may have counted too
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    name = f'todo_request_duration_seconds_count{{endpoint="{endpoint}"}}'
+    match = re.search(rf"^{re.escape(name)} (\d+)$", response.text, re.M)
+    return int(match.group(1)) if match else 0
+
+
+def test_requests_are_timed(make_app, login):
+    client = login(make_app(METRICS_ENABLED=True), "timed")
+    before = request_count(client, "todo.dashboard")
+
+    response = client.get("/")
+    timing = response.headers["Server-Timing"]
+    assert re.match(r'sql;dur=[\d.]+;desc="\d+ statements", ', timing)
+    assert "tpl-dashboard.html;dur=" in timing
+    assert re.search(r"total;dur=[\d.]+$", timing)
+    assert request_count(client, "todo.dashboard") == before + 1
+
+    client = login(make_app(), "untimed")
+    assert "Server-Timing" not in client.get("/").headers
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,111 @@
+"""Subtree counts and depths kept on tasks and items (rollups.py)."""
+import app as todo
+import rollups
+import tmp as lists
+
+
+def task_rollups(app, *task_ids):
+    with app.app_context():
+        tasks = [todo.db.session.get(todo.Task, task_id) for task_id in task_ids]
+        return [
+            (task.descendant_count, task.completed_descendant_count, task.max_depth)
+            for task in tasks
+        ]
+
+
+def test_task_rollups_follow_each_change(make_app, login, add_task):
+    app = make_app()
+    client = login(app, "rollups")
+    root = add_task(client, "root")["id"]
+    child = add_task(client, "child", root)["id"]
+    done = add_task(client, "done", child, status="Done")["id"]
+    assert task_rollups(app, root, child) == [(2, 1, 2), (1, 1, 1)]
+
+    leaf = add_task(client, "leaf", root)["id"]
+    client.post(f"/tasks/{leaf}/status", data={"status": "Done"})
+    assert task_rollups(app, root) == [(3, 2, 2)]
+    client.post(f"/tasks/{done}/status", data={"status": "To Do"})
+    assert task_rollups(app, root, child) == [(3, 1, 2), (1, 0, 1)]
+
+    client.post(f"/tasks/{leaf}/move", data={"parent_task_id": done})
+    assert task_rollups(app, root, child, done) == [
+        (3, 1, 3),
+        (2, 1, 2),
+        (1, 1, 1),
+    ]
+    with app.app_context():
+        # What the updates left is what a full recount gives
+        assert (
+            rollups.recompute(
+                todo.db.session,
+                todo.Task,
+                "parent_task_id",
+                todo._task_is_done,
+                todo._task_is_live,
+            )
+            == 0
+        )
+
+    client.post(f"/tasks/{child}/delete")
+    assert task_rollups(app, root) == [(0, 0, 0)]
+
+
+def test_repairing_items_with_null_completion(list_app, login):
+    login(list_app, "nulls")
+    with list_app.app_context():
+        user = lists.User.query.filter_by(username="nulls").one()
+        todo_list = lists.List(title="list", user=user)
+        root = lists.Item(title="root", list=todo_list)
+        lists.Item(title="child", list=todo_list, parent=root)
+        lists.db.session.add(todo_list)
+        lists.db.session.commit()
+        lists.db.session.execute(
+            lists.db.update(lists.Item)
+            .where(lists.Item.list_id == todo_list.id)
+            .values(is_completed=None)
+        )
+        lists.db.session.commit()
+        root_id = root.id
+
+    result = list_app.test_cli_runner().invoke(args=["repair-rollups"])
+    assert result.exception is None
+    with list_app.app_context():
+        root = lists.db.session.get(lists.Item, root_id)
+        assert (root.descendant_count, root.completed_descendant_count) == (1, 0)
+
+
+def test_item_rollups_follow_each_change(list_app, login):
+    client = login(list_app, "item rollups")
+    with list_app.app_context():
+        user = lists.User.query.filter_by(username="item rollups").one()
+        todo_list = lists.List(title="list", user=user)
+        lists.db.session.add(todo_list)
+        lists.db.session.commit()
+        list_id = todo_list.id
+
+    def add_item(title, parent_id=None):
+        client.post(
+            f"/lists/{list_id}/items/new",
+            data={"title": title, "parent_item_id": parent_id or ""},
+        )
+        with list_app.app_context():
+            return lists.Item.query.filter_by(list_id=list_id, title=title).one().id
+
+    def item_rollups(item_id):
+        with list_app.app_context():
+            item = lists.db.session.get(lists.Item, item_id)
+            return (
+                item.descendant_count,
+                item.completed_descendant_count,
+                item.max_depth,
+            )
+
+    root = add_item("root")
+    child = add_item("child", root)
+    leaf = add_item("leaf", child)
+    assert item_rollups(root) == (2, 0, 2)
+    client.post(f"/items/{leaf}/complete")
+    assert item_rollups(root) == (2, 1, 2)
+    assert item_rollups(child) == (1, 1, 1)
+    client.post(f"/items/{child}/delete")
+    assert item_rollups(root) == (0, 0, 0)
@@ -0,0 +1,75 @@
+"""Per-user full-text search over task and item titles (search.py)."""
+import tmp as lists
+
+
+def titles(response):
+    return [result["title"] for result in response.json["results"]]
+
+
+def test_tasks_are_searched_per_user(make_app, login, add_task):
+    app = make_app()
+    # Ten users apart, the owner tokens differ by a digit: u1u and u11u
+    clients = [login(app, f"user {i}") for i in range(11)]
+    first, last = clients[0], clients[-1]
+    parent = add_task(first, "Groceries")
+    add_task(first, "Buy oat milk", parent["id"])
+    add_task(first, 'The "milky" way')
+    add_task(last, "Buy milk")
+
+    response = first.get("/search", query_string={"q": "MILK", "format": "json"})
+    # Earlier matches first
+    assert titles(response) == ['The "milky" way', "Buy oat milk"]
+    assert response.json["results"][1]["path"] == [
+        {"id": parent["id"], "title": "Groceries"}
+    ]
+    response = last.get("/search", query_string={"q": "milk", "format": "json"})
+    assert titles(response) == ["Buy milk"]
+    response = first.get("/search", query_string={"q": '"milky', "format": "json"})
+    assert titles(response) == ['The "milky" way']
+
+    response = first.get(
+        "/search", query_string={"q": "milk", "limit": 1, "format": "json"}
+    )
+    assert titles(response) == ['The "milky" way']
+    assert titles(first.get(response.json["next"])) == ["Buy oat milk"]
+    response = first.get("/search", query_string={"q": "mi", "format": "json"})
+    assert response.status_code == 400
+
+
+def test_items_are_searched_per_user(list_app, login):
+    owner = login(list_app, "item owner")
+    stranger = login(list_app, "item stranger")
+    with list_app.app_context():
+        users = lists.User.query.filter(
+            lists.User.username.in_(["item owner", "item stranger"])
+        )
+        mine, theirs = (
+            lists.List(title="list", user=user)
+            for user in sorted(users, key=lambda user: user.id)
+        )
+        tea = lists.Item(title="tea", list=mine)
+        lists.Item(title="green tea", list=mine, parent=tea)
+        iced_tea = lists.Item(title="iced tea", list=mine)
+        lists.Item(title="black tea", list=theirs)
+        lists.db.session.add_all([mine, theirs])
+        lists.db.session.commit()
+        tea_id, iced_tea_id, theirs_id = tea.id, iced_tea.id, theirs.id
+
+    response = owner.get("/items/search", query_string={"q": "tea"})
+    assert titles(response) == ["tea", "iced tea", "green tea"]
+    assert response.json["results"][2]["path"] == [{"id": tea_id, "title": "tea"}]
+    response = stranger.get("/items/search", query_string={"q": "tea"})
+    assert titles(response) == ["black tea"]
+
+    # An item moving to another user's list takes its index entry along
+    with list_app.app_context():
+        lists.db.session.execute(
+            lists.db.update(lists.Item)
+            .where(lists.Item.id == iced_tea_id)
+            .values(list_id=theirs_id)
+        )
+        lists.db.session.commit()
+    response = owner.get("/items/search", query_string={"q": "tea"})
+    assert titles(response) == ["tea", "green tea"]
+    response = stranger.get("/items/search", query_string={"q": "tea"})
+    assert titles(response) == ["iced tea", "black tea"]
@@ -0,0 +1,83 @@
+"""Users' tasks spread over several SQLite databases (sharding.py)."""
+import json
+
+import pytest
+from sqlalchemy import text
+
+import app as todo
+
+
+@pytest.fixture
+def sharded_app(make_app, tmp_path):
+    urls = ",".join(f"sqlite:///{tmp_path}/shard{n}.db" for n in range(2))
+    config = todo.engine_config({"SHARD_DATABASE_URLS": urls})
+    return make_app(
+        SQLALCHEMY_BINDS=config["SQLALCHEMY_BINDS"],
+        SHARD_DATABASE_URLS=config["SHARD_DATABASE_URLS"],
+        SQLITE_PRAGMAS=dict(config["SQLITE_PRAGMAS"], foreign_keys="ON"),
+    )
+
+
+def test_shards_take_tasks_with_foreign_keys_enforced(sharded_app, login):
+    # The shards have no user table for the tasks to reference
+    for username in ("ann", "bob", "cid", "dee"):
+        client = login(sharded_app, username)
+        response = client.post(
+            "/add_task/To Do", query_string={"format": "json"}, data={"title": "task"}
+        )
+        assert response.status_code == 200
+        # The search index is created and kept on the shards too
+        response = client.get("/search", query_string={"q": "task", "format": "json"})
+        assert len(response.json["results"]) == 1
+    with sharded_app.app_context():
+        for shard in range(2):
+            engine = todo.shards.engine(shard)
+            with engine.connect() as connection:
+                assert connection.scalar(text("PRAGMA foreign_keys")) == 1
+                assert connection.scalar(text("SELECT count(*) FROM task")) > 0
+
+
+def test_moving_a_user_to_another_shard(sharded_app, login, add_task):
+    client = login(sharded_app, "mover")
+    root = add_task(client, "root")
+    child = add_task(client, "child", root["id"])
+    add_task(client, "grandchild", child["id"], status="Done")
+    deleted = add_task(client, "deleted", root["id"])
+    client.post(f"/tasks/{deleted['id']}/delete")
+    with sharded_app.app_context():
+        source = todo.User.query.filter_by(username="mover").one().shard
+    target = 1 - source
+
+    result = sharded_app.test_cli_runner().invoke(
+        args=["rebalance-shards", "--user", "mover", "--shard", str(target)]
+    )
+    assert result.exception is None
+    assert f"Moved mover (3 tasks) from shard {source} to shard {target}." in (
+        result.output
+    )
+
+    # The session carries on, on the new shard
+    export = client.get("/tasks/export").data
+    records = [json.loads(line) for line in export.splitlines()]
+    assert [record["title"] for record in records] == ["root", "child", "grandchild"]
+    new_root = records[0]
+    response = client.get(
+        f"/tasks/{new_root['id']}/subtasks", query_string={"format": "json"}
+    )
+    (task,) = response.json["tasks"]
+    assert (task["title"], task["descendant_count"]) == ("child", 1)
+    response = client.get("/search", query_string={"q": "grand", "format": "json"})
+    assert [result["title"] for result in response.json["results"]] == ["grandchild"]
+    add_task(client, "added after", new_root["id"])
+
+    with sharded_app.app_context():
+        user = todo.User.query.filter_by(username="mover").one()
+        assert user.shard == target
+        with todo.shards.engine(source).connect() as connection:
+            assert not connection.scalar(
+                text("SELECT count(*) FROM task WHERE user_id = :id"), {"id": user.id}
+            )
+            assert connection.scalar(
+                text("SELECT moved FROM data_version WHERE user_id = :id"),
+                {"id": user.id},
+            )
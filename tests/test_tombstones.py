@@ -0,0 +1,68 @@
+"""Deleting a task tombstones its subtree; the purger removes the rows later."""
+import pytest
+from sqlalchemy import func, select
+
+import app as todo
+
+
+@pytest.fixture
+def tombstone_app(make_app, monkeypatch):
+    app = make_app(TASK_PURGE_BATCH_SIZE=1)
+    # Purged by the tests themselves, not by the background thread
+    monkeypatch.setattr(app.extensions["task_purger"], "notify", lambda: None)
+    return app
+
+
+def task_ids(app):
+    with app.app_context():
+        return set(todo.db.session.scalars(select(todo.Task.id)))
+
+
+def test_deleted_subtree_is_hidden_until_purged(tombstone_app, login, add_task):
+    client = login(tombstone_app, "tombstone")
+    root = add_task(client, "root")
+    kept = add_task(client, "kept", root["id"])
+    deleted = add_task(client, "deleted", root["id"])
+    below = add_task(client, "deleted below", deleted["id"])
+
+    response = client.post(
+        f"/tasks/{deleted['id']}/delete", query_string={"format": "json"}
+    )
+    assert response.json["type"] == "deleted"
+
+    # The rows are still there, but nothing shows them
+    assert task_ids(tombstone_app) == {
+        root["id"],
+        kept["id"],
+        deleted["id"],
+        below["id"],
+    }
+    response = client.get(
+        f"/tasks/{root['id']}/subtasks", query_string={"format": "json"}
+    )
+    assert [task["id"] for task in response.json["tasks"]] == [kept["id"]]
+    assert client.get(f"/tasks/{below['id']}/subtasks").status_code == 404
+    response = client.post(
+        f"/tasks/{below['id']}/delete", query_string={"format": "json"}
+    )
+    assert response.status_code == 404
+    response = client.get("/search", query_string={"q": "deleted", "format": "json"})
+    assert response.json["results"] == []
+    assert b"deleted" not in client.get("/tasks/export").data
+    with tombstone_app.app_context():
+        root_task = todo.db.session.get(todo.Task, root["id"])
+        assert (root_task.descendant_count, root_task.max_depth) == (1, 1)
+
+    with tombstone_app.app_context():
+        # A step tombstones and removes the child; its parent goes next step
+        todo.purge_deleted_tasks(1)
+        assert todo.db.session.get(todo.Task, deleted["id"]) is not None
+        assert todo.db.session.get(todo.Task, below["id"]) is None
+        todo.task_purger.purge()
+        tree = todo.task_tree.table
+        assert todo.db.session.scalar(
+            select(func.count()).where(
+                tree.c.descendant_id.in_([deleted["id"], below["id"]])
+            )
+        ) == 0
+    assert task_ids(tombstone_app) == {root["id"], kept["id"]}
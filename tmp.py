@@ -11,14 +11,33 @@ from flask_login import (
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 
+from groupcommit import GroupCommitter
+from hierarchy import ClosureTable, CycleError
+import rollups
+from search import MIN_QUERY_LENGTH, SearchIndex
+from templating import configure_templates, flatten_tree
+
 app = Flask(__name__)
 app.config["SECRET_KEY"] = (
     "42e76d8053493a28cc90a625d2315d2666da0c445351d01c5ddb8ba8aaa71f55"  # Replace with a secure secret key
 )
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///todo.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Keep compiled templates across restarts, or load precompiled ones
+app.config["TEMPLATE_CACHE_DIR"] = os.environ.get("TEMPLATE_CACHE_DIR")
+app.config["TEMPLATE_MODULE_DIR"] = os.environ.get("TEMPLATE_MODULE_DIR")
+# Commit the item writes of concurrent requests (e.g. bursts of checkbox
+# toggles) together, from one writer thread
+app.config["GROUP_COMMIT"] = os.environ.get("GROUP_COMMIT") == "1"
+app.config["GROUP_COMMIT_WINDOW"] = 0.002  # seconds
+app.config["GROUP_COMMIT_MAX_BATCH"] = 64
+# Item ids per /items/batch request, over all of its operations; they end up
+# as bound parameters, of which SQLite allows a limited number per statement
+app.config["ITEM_BATCH_MAX_IDS"] = 1000
+configure_templates(app)
 
 db = SQLAlchemy(app)
+group_commit = GroupCommitter(db, app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
@@ -55,6 +74,30 @@ class Item(db.Model):
     children = db.relationship(
         "Item", backref=db.backref("parent", remote_side=[id]), lazy=True
     )
+    # Subtree aggregates, maintained by rollups along the ancestor path
+    descendant_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    completed_descendant_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    max_depth = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
+def _item_is_completed(item):
+    return item.is_completed
+
+
+# Every item's ancestors, for one-query subtrees and paths
+item_tree = ClosureTable(Item, "parent_item_id")
+
+# Trigram full-text index over item titles (SQLite only); moving an item to
+# another list can change its owner
+item_search = SearchIndex(
+    Item,
+    owner="SELECT user_id FROM list WHERE list.id = {row}.list_id",
+    watch=("title", "list_id"),
+)
 
 
 class TaskGroup(db.Model):
@@ -181,8 +224,26 @@ def view_list(list_id):
     if list.user_id != current_user.id:
         flash("You do not have permission to view this list.")
         return redirect(url_for("dashboard"))
-    items = Item.query.filter_by(list_id=list_id, parent_item_id=None).all()
-    return render_template("list.html", list=list, items=items)
+    # The whole tree in one query, rendered from a flat pre-order list
+    top_level = db.select(Item.id).where(
+        Item.list_id == list_id, Item.parent_item_id.is_(None)
+    )
+    roots, children = [], {}
+    for item in Item.query.filter(
+        Item.id.in_(item_tree.descendant_ids(top_level))
+    ).order_by(Item.id):
+        if item.parent_item_id is None:
+            roots.append(item)
+        else:
+            children.setdefault(item.parent_item_id, []).append(item)
+    rows = flatten_tree(roots, children)
+    return render_template("list.html", list=list, rows=rows)
+
+
+def _insert_item(title, list_id, parent_item_id):
+    item = Item(title=title, list_id=list_id, parent_item_id=parent_item_id)
+    db.session.add(item)
+    rollups.add_subtree(db.session, Item, "parent_item_id", parent_item_id)
 
 
 # Add an item to a list
@@ -200,14 +261,18 @@ def add_item(list_id):
             parent_item_id = int(parent_item_id)
         else:
             parent_item_id = None
-        new_item = Item(title=title, list_id=list_id, parent_item_id=parent_item_id)
-        db.session.add(new_item)
-        db.session.commit()
+        group_commit.run(None, _insert_item, title, list_id, parent_item_id)
         return redirect(url_for("view_list", list_id=list_id))
     parent_items = Item.query.filter_by(list_id=list_id, parent_item_id=None).all()
     return render_template("add_item.html", list=list, parent_items=parent_items)
 
 
+def _rename_item(item_id, title):
+    item = db.session.get(Item, item_id)
+    if item is not None:
+        item.title = title
+
+
 # Edit an item
 @app.route("/items/<int:item_id>/edit", methods=["GET", "POST"])
 @login_required
@@ -218,8 +283,7 @@ def edit_item(item_id):
         flash("You do not have permission to edit this item.")
         return redirect(url_for("dashboard"))
     if request.method == "POST":
-        item.title = request.form["title"]
-        db.session.commit()
+        group_commit.run(None, _rename_item, item.id, request.form["title"])
         return redirect(url_for("view_list", list_id=list.id))
     return render_template("edit_item.html", item=item)
 
@@ -233,33 +297,90 @@ def delete_item(item_id):
     if list.user_id != current_user.id:
         flash("You do not have permission to delete this item.")
         return redirect(url_for("dashboard"))
-    db.session.delete(item)
+    item_tree.delete_subtrees(db.session, [item.id])
+    rollups.remove_subtree(
+        db.session, Item, "parent_item_id", item, bool(item.is_completed)
+    )
     db.session.commit()
     return redirect(url_for("view_list", list_id=list.id))
 
 
-# Move a top-level item to a different list
+def _move_item_subtree(item, list_id, parent_item_id):
+    """Move an item and its sub-items below another item or to the top level
+    of a list; returns the number of items moved."""
+    previous_parent_id = item.parent_item_id
+    item_tree.move(db.session, item.id, parent_item_id)
+    moved = db.session.execute(
+        db.update(Item)
+        .where(Item.id.in_(item_tree.descendant_ids([item.id])))
+        .values(list_id=list_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    rollups.move_subtree(
+        db.session,
+        Item,
+        "parent_item_id",
+        item,
+        previous_parent_id,
+        bool(item.is_completed),
+    )
+    return moved
+
+
+# Move an item with its sub-items to another list or below another item
 @app.route("/items/<int:item_id>/move", methods=["GET", "POST"])
 @login_required
 def move_item(item_id):
     item = Item.query.get_or_404(item_id)
-    if item.parent_item_id is not None:
-        flash("Only top-level items can be moved.")
-        return redirect(url_for("view_list", list_id=item.list_id))
     if item.list.user_id != current_user.id:
         flash("You do not have permission to move this item.")
         return redirect(url_for("dashboard"))
     if request.method == "POST":
-        new_list_id = request.form["new_list_id"]
-        new_list = List.query.get_or_404(new_list_id)
+        new_list = List.query.get_or_404(request.form["new_list_id"])
+        parent_item_id = request.form.get("new_parent_item_id", type=int)
+        if parent_item_id is not None:
+            # A sub-item always lives in its parent's list
+            new_list = Item.query.get_or_404(parent_item_id).list
         if new_list.user_id != current_user.id:
             flash("You do not have permission to move items to this list.")
             return redirect(url_for("dashboard"))
-        item.list_id = new_list_id
+        try:
+            _move_item_subtree(item, new_list.id, parent_item_id)
+        except CycleError:
+            flash("An item cannot be moved below its own sub-items.")
+            return redirect(url_for("view_list", list_id=item.list_id))
         db.session.commit()
-        return redirect(url_for("view_list", list_id=new_list_id))
+        return redirect(url_for("view_list", list_id=new_list.id))
     lists = List.query.filter_by(user_id=current_user.id).all()
-    return render_template("move_item.html", item=item, lists=lists)
+    # Anything outside the item's own subtree can become its parent
+    parent_items = (
+        Item.query.join(List)
+        .options(db.contains_eager(Item.list))
+        .filter(
+            List.user_id == current_user.id,
+            Item.id.not_in(item_tree.descendant_ids([item.id])),
+        )
+        .order_by(Item.list_id, Item.id)
+        .all()
+    )
+    return render_template(
+        "move_item.html", item=item, lists=lists, parent_items=parent_items
+    )
+
+
+def _toggle_item(item_id):
+    # Read inside the write, so that concurrent toggles are not lost
+    item = db.session.get(Item, item_id, populate_existing=True)
+    if item is None:
+        return
+    item.is_completed = not item.is_completed
+    rollups.change_completed(
+        db.session,
+        Item,
+        "parent_item_id",
+        item.parent_item_id,
+        1 if item.is_completed else -1,
+    )
 
 
 # Toggle completion status
@@ -270,11 +391,175 @@ def complete_item(item_id):
     if item.list.user_id != current_user.id:
         flash("You do not have permission to complete this item.")
         return redirect(url_for("dashboard"))
-    item.is_completed = not item.is_completed
-    db.session.commit()
+    group_commit.run(None, _toggle_item, item.id)
     return redirect(url_for("view_list", list_id=item.list_id))
 
 
+BATCH_OPERATIONS = ("complete", "uncomplete", "move", "delete")
+
+
+def _is_id(value):
+    # JSON true and false arrive as bools, which are ints too
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Apply many item changes in one request and one transaction
+@app.route("/items/batch", methods=["POST"])
+@login_required
+def batch_items():
+    """Apply a JSON list of operations to many items at once.
+
+    The body looks like ``{"operations": [{"op": "complete", "item_ids":
+    [1, 2]}, {"op": "move", "item_ids": [3], "list_id": 4}]}``, with ``op``
+    one of complete, uncomplete, move (with their sub-items, to the top level
+    of the list) and delete (with sub-items). Either every operation applies
+    or none does. A batch names at most ``ITEM_BATCH_MAX_IDS`` ids.
+    """
+    operations = (request.get_json(silent=True) or {}).get("operations")
+    if not isinstance(operations, list):
+        return {"error": "Expected a list of operations."}, 400
+    for operation in operations:
+        if (
+            not isinstance(operation, dict)
+            or operation.get("op") not in BATCH_OPERATIONS
+            or not isinstance(operation.get("item_ids"), list)
+            or not all(_is_id(i) for i in operation["item_ids"])
+            or operation["op"] == "move"
+            and not _is_id(operation.get("list_id"))
+        ):
+            return {"error": f"Invalid operation: {operation!r}"}, 400
+    max_ids = app.config["ITEM_BATCH_MAX_IDS"]
+    # Every operation binds its item ids and at most one list id
+    if sum(len(o["item_ids"]) + 1 for o in operations) > max_ids:
+        return {"error": f"A batch may change at most {max_ids} items."}, 400
+
+    # Check ownership of every item and target list with a single query
+    item_ids = {i for operation in operations for i in operation["item_ids"]}
+    list_ids = {o["list_id"] for o in operations if o["op"] == "move"}
+    owned = db.session.execute(
+        db.union_all(
+            db.select(db.literal("item"), Item.id, Item.parent_item_id)
+            .join(List, Item.list_id == List.id)
+            .where(Item.id.in_(item_ids), List.user_id == current_user.id),
+            db.select(db.literal("list"), List.id, db.null()).where(
+                List.id.in_(list_ids), List.user_id == current_user.id
+            ),
+        )
+    ).all()
+    owned_items = {row[1]: row[2] for row in owned if row[0] == "item"}
+    owned_lists = {row[1] for row in owned if row[0] == "list"}
+    if item_ids - owned_items.keys() or list_ids - owned_lists:
+        return {
+            "error": "You do not have permission to change these items or lists.",
+            "item_ids": sorted(item_ids - owned_items.keys()),
+            "list_ids": sorted(list_ids - owned_lists),
+        }, 403
+
+    results = []
+    for operation in operations:
+        op, ids = operation["op"], operation["item_ids"]
+        if op in ("complete", "uncomplete"):
+            value = op == "complete"
+            changing = Item.id.in_(ids) & (
+                db.func.coalesce(Item.is_completed, False) != value
+            )
+            rollups.adjust_ancestors(
+                db.session,
+                Item,
+                "parent_item_id",
+                db.select(
+                    Item.parent_item_id.label("id"),
+                    db.literal(0).label("count"),
+                    db.literal(1 if value else -1).label("completed"),
+                ).where(changing),
+            )
+            changed = db.session.execute(
+                db.update(Item)
+                .where(changing)
+                .values(is_completed=value)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            results.append({"op": op, "changed": changed})
+            continue
+
+        if op == "move":
+            # Every item becomes a top-level item of the list, its sub-items
+            # along; its former ancestors lose what their closure rows held
+            cut = item_tree.cut_rows(ids)
+            db.session.execute(
+                db.update(Item)
+                .where(Item.id.in_(db.select(cut.subquery().c.ancestor_id)))
+                .values(max_depth=item_tree.height(Item.id, detaching=ids))
+                .execution_options(synchronize_session=False)
+            )
+            rollups.remove_descendants(db.session, Item, cut, _item_is_completed)
+            item_tree.detach(db.session, ids)
+            changed = db.session.execute(
+                db.update(Item)
+                .where(Item.id.in_(item_tree.descendant_ids(ids)))
+                .values(list_id=operation["list_id"])
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        else:
+            subtree = item_tree.descendant_ids(ids)
+            # Only the topmost deleted items change their ancestors' counts
+            roots = Item.id.in_(ids) & db.or_(
+                Item.parent_item_id.is_(None),
+                ~Item.parent_item_id.in_(subtree),
+            )
+            parents = [
+                parent_id
+                for (parent_id,) in db.session.query(Item.parent_item_id)
+                .filter(roots, Item.parent_item_id.isnot(None))
+                .distinct()
+            ]
+            completed = db.cast(db.func.coalesce(Item.is_completed, False), db.Integer)
+            rollups.adjust_ancestors(
+                db.session,
+                Item,
+                "parent_item_id",
+                db.select(
+                    Item.parent_item_id.label("id"),
+                    (-1 - Item.descendant_count).label("count"),
+                    (-completed - Item.completed_descendant_count).label("completed"),
+                ).where(roots),
+            )
+            changed = item_tree.delete_subtrees(db.session, ids)
+            rollups.update_heights(db.session, Item, "parent_item_id", parents)
+        results.append({"op": op, "changed": changed})
+    db.session.commit()
+    return {"results": results}
+
+
+@app.route("/items/search")
+@login_required
+def search_items():
+    """The user's items whose title contains ``q``, best matches first."""
+    query = request.args.get("q", "").strip()
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = min(max(1, request.args.get("limit", 20, type=int)), 100)
+    if len(query) < MIN_QUERY_LENGTH:
+        return {"error": f"Search for at least {MIN_QUERY_LENGTH} characters."}, 400
+    items = db.session.scalars(
+        item_search.search(current_user.id, query).limit(limit + 1).offset(offset)
+    ).all()
+    paths = item_tree.paths(db.session, [item.id for item in items])
+    results = [
+        {
+            "id": item.id,
+            "title": item.title,
+            "list_id": item.list_id,
+            "is_completed": item.is_completed,
+            "path": [{"id": i, "title": title} for i, title in paths[item.id]],
+        }
+        for item in items[:limit]
+    ]
+    next_url = None
+    if len(items) > limit:
+        next_url = url_for("search_items", q=query, offset=offset + limit, limit=limit)
+    return {"results": results, "next": next_url}
+
+
 @app.route("/task_groups")
 @login_required
 def task_groups():
@@ -311,6 +596,52 @@ def add_task(group_id):
     return render_template("add_task.html", task_group=task_group)
 
 
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    """Bring a database of an earlier version of this app up to date.
+
+    This app has no migrations: add the item columns it lacks, create the
+    missing tables, then fill the closure table, the item aggregates and the
+    search index from the items. Safe to run again.
+    """
+    existing = db.inspect(db.engine).get_columns("item")
+    columns = {column["name"] for column in existing}
+    for name in ("descendant_count", "completed_descendant_count", "max_depth"):
+        if name not in columns:
+            db.session.execute(
+                db.text(
+                    f"ALTER TABLE item ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+    db.session.commit()
+    db.create_all()
+    rows = item_tree.rebuild(db.session)
+    fixed = rollups.recompute(db.session, Item, "parent_item_id", _item_is_completed)
+    indexed = item_search.rebuild(db.session)
+    print(f"Wrote {rows} closure rows, repaired {fixed} items, indexed {indexed}.")
+
+
+@app.cli.command("repair-rollups")
+def repair_rollups():
+    """Recompute every item's subtree aggregates from scratch."""
+    fixed = rollups.recompute(db.session, Item, "parent_item_id", _item_is_completed)
+    print(f"Repaired the aggregates of {fixed} items.")
+
+
+@app.cli.command("rebuild-hierarchy")
+def rebuild_hierarchy():
+    """Refill the item closure table from the items' parent links."""
+    rows = item_tree.rebuild(db.session)
+    print(f"Wrote {rows} item closure rows.")
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search():
+    """Create the item search index if needed and refill it from the items."""
+    indexed = item_search.rebuild(db.session)
+    print(f"Indexed {indexed} items.")
+
+
 # Run the app
 if __name__ == "__main__":
     # Create database tables if they don't exist